@@ -0,0 +1,107 @@
+"""Compression codecs for BK-tree tar artifacts.
+
+The precompute job writes the artifact tar as gzip (``.tar.gz``, the historical default), zstd
+(``.tar.zst``, compressed with every core) or uncompressed (``.tar``). The service never needs to
+be told which: :func:`detect_compression` reads the codec from the first bytes of the object,
+and :func:`open_decompressed` returns a forward-only reader over the tar stream for
+``tarfile.open(fileobj=..., mode="r|")``.
+
+``zstandard`` is imported only when a zstd artifact is written or read, so gzip and plain
+artifacts keep working without it.
+"""
+
+import gzip
+import tarfile
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Iterator
+
+COMPRESSIONS = ("gzip", "zstd", "none")
+
+# Archive suffix and upload content type per codec.
+SUFFIXES = {"gzip": ".tar.gz", "zstd": ".tar.zst", "none": ".tar"}
+CONTENT_TYPES = {"gzip": "application/gzip", "zstd": "application/zstd", "none": "application/x-tar"}
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Bytes of the object detect_compression needs to see.
+MAGIC_BYTES = len(_ZSTD_MAGIC)
+
+
+def _zstandard():
+    try:
+        import zstandard  # Lazy import: only zstd artifacts need it.
+    except ImportError as exc:
+        raise RuntimeError("zstd artifacts need the 'zstandard' package (pip install zstandard)") from exc
+    return zstandard
+
+
+def detect_compression(head: bytes) -> str:
+    """Return the codec of an artifact from its leading bytes; anything unrecognised is a plain tar."""
+    if head.startswith(_ZSTD_MAGIC):
+        return "zstd"
+    if head.startswith(_GZIP_MAGIC):
+        return "gzip"
+    return "none"
+
+
+def open_decompressed(source: BinaryIO, compression: str, buffer_bytes: int) -> BinaryIO:
+    """Wrap ``source`` (positioned at the start of the artifact) in a streaming decoder."""
+    if compression == "zstd":
+        decoder = _zstandard().ZstdDecompressor()
+        return decoder.stream_reader(source, read_size=buffer_bytes, read_across_frames=True, closefd=False)
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=source, mode="rb")
+    if compression == "none":
+        return source
+    raise ValueError(f"Unknown artifact compression {compression!r}; expected one of {', '.join(COMPRESSIONS)}")
+
+
+class CountingReader:
+    """Pass-through reader that counts the bytes handed out, for throughput logging."""
+
+    def __init__(self, source: BinaryIO):
+        self._source = source
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._source.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        readinto = getattr(self._source, "readinto", None)
+        if readinto is None:
+            data = self.read(len(buffer))
+            buffer[: len(data)] = data
+            return len(data)
+        count = readinto(buffer) or 0
+        self.bytes_read += count
+        return count
+
+
+@contextmanager
+def open_archive_writer(path: str, compression: str, *, level: int | None = None,
+                        threads: int = -1) -> Iterator[tarfile.TarFile]:
+    """Create a tar artifact at ``path`` compressed with ``compression``.
+
+    zstd compresses on ``threads`` worker threads (``-1``, the default, uses every core) at
+    ``level`` (zstd's default of 3 when omitted). gzip keeps tarfile's compression level 9 unless
+    ``level`` is given.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown artifact compression {compression!r}; expected one of {', '.join(COMPRESSIONS)}")
+
+    if compression == "gzip":
+        options: dict[str, Any] = {} if level is None else {"compresslevel": level}
+        with tarfile.open(path, "w:gz", **options) as tar:
+            yield tar
+    elif compression == "none":
+        with tarfile.open(path, "w") as tar:
+            yield tar
+    else:
+        zstandard = _zstandard()
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level, threads=threads)
+        with open(path, "wb") as raw, compressor.stream_writer(raw, closefd=False) as writer:
+            with tarfile.open(fileobj=writer, mode="w|") as tar:
+                yield tar
@@ -7,6 +7,7 @@ import os
 import sys
 import time
 import random
+import threading
 from cppmatch import BKTree
 from rapidfuzz.distance import Levenshtein
 
@@ -46,6 +47,36 @@ def build_bktree(terms):
     return tree, build_time
 
 
+def benchmark_build_scaling(terms, thread_counts=(1, 2, 4, 8)):
+    """Time BKTree.build at several thread counts."""
+    timings = {}
+    for threads in thread_counts:
+        start = time.time()
+        BKTree.build(terms, threads)
+        timings[threads] = time.time() - start
+        print(f"  {threads} thread(s): {timings[threads]:.2f} seconds")
+    return timings
+
+
+def benchmark_search_scaling(tree, queries, maxdist=1, thread_counts=(1, 2, 4)):
+    """Searches per second with the queries split across several threads."""
+    rates = {}
+    for threads in thread_counts:
+        chunks = [queries[i::threads] for i in range(threads)]
+        workers = [
+            threading.Thread(target=lambda chunk=chunk: [tree.search(q, maxdist) for q in chunk])
+            for chunk in chunks
+        ]
+        start = time.time()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        rates[threads] = len(queries) / (time.time() - start)
+        print(f"  {threads} thread(s): {rates[threads]:.1f} QPS")
+    return rates
+
+
 def benchmark_bktree(tree, queries, maxdist=1):
     """Benchmark BK-tree search."""
     start = time.time()
@@ -92,6 +123,10 @@ def main():
     print("Building BK-tree index...")
     tree, build_time = build_bktree(terms)
     print()
+
+    print(f"Parallel build scaling (BKTree.build, {os.cpu_count()} CPUs available)...")
+    build_scaling = benchmark_build_scaling(terms)
+    print()
     
     # Sample queries
     queries = random.sample(terms, min(num_queries, len(terms)))
@@ -105,6 +140,10 @@ def main():
     print(f"  Time: {bkt_time:.3f} seconds")
     print(f"  QPS:  {bkt_qps:.1f}")
     print()
+
+    print("Search scaling (queries split across threads)...")
+    search_scaling = benchmark_search_scaling(tree, queries, maxdist)
+    print()
     
     # Benchmark Python
     print("Benchmarking Python baseline...")
@@ -119,13 +158,17 @@ def main():
     print("RESULTS")
     print("=" * 70)
     print(f"Dataset size:          {len(terms):,} terms")
-    print(f"BK-tree build time:    {build_time:.2f} seconds")
+    print(f"BK-tree build time:    {build_time:.2f} seconds (sequential insert)")
+    for threads, elapsed in build_scaling.items():
+        print(f"  BKTree.build x{threads}:      {elapsed:.2f} seconds  ({build_time/elapsed:.2f}× vs insert)")
     print(f"Queries:               {len(queries)}")
     print(f"Max distance:          {maxdist}")
     print()
     print(f"BK-tree time:          {bkt_time:.3f} s  ({bkt_qps:.1f} QPS)")
     print(f"Python time:           {py_time:.3f} s  ({py_qps:.1f} QPS)")
     print(f"Speedup (Python/BK):   {py_time/bkt_time:.2f}×")
+    for threads, rate in search_scaling.items():
+        print(f"  BK-tree x{threads} threads:  {rate:.1f} QPS  ({rate/search_scaling[1]:.2f}× vs 1 thread)")
     print("=" * 70)
 
 
@@ -1,164 +1,1813 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
 #include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <climits>
 #include <cstdint>
 #include <cstring>
+#include <exception>
+#include <cstdio>
 #include <fstream>
+#include <functional>
+#include <fcntl.h>
+#include <istream>
+#include <iterator>
+#include <map>
 #include <memory>
+#include <mutex>
+#include <queue>
+#include <shared_mutex>
 #include <stdexcept>
 #include <string>
+#include <string_view>
+#include <thread>
+#include <tuple>
 #include <unordered_map>
 #include <vector>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
 
 namespace py = pybind11;
 
-// Levenshtein distance implementation
+// Bit-parallel Levenshtein distance (Myers 1999, Hyyro 2003 formulation).
+//
+// The pattern's match vectors are built once and then reused against many
+// texts, which is exactly what BK-tree insert and search do at every visited
+// node. Patterns up to 64 bytes use a single machine word; longer patterns
+// fall back to the blocked multi-word variant. Distances are computed over
+// bytes, matching the previous dynamic-programming implementation.
+class LevenshteinPattern {
+public:
+    explicit LevenshteinPattern(const std::string& pattern)
+        : LevenshteinPattern(pattern.data(), pattern.size()) {}
+
+    LevenshteinPattern(const char* pattern, std::size_t length)
+        : m_(length), words_((length + 63) / 64) {
+        if (words_ <= 1) {
+            std::memset(single_, 0, sizeof(single_));
+            for (std::size_t i = 0; i < m_; ++i) {
+                single_[static_cast<unsigned char>(pattern[i])] |= std::uint64_t(1) << i;
+            }
+        } else {
+            blocks_.assign(256 * words_, 0);
+            for (std::size_t i = 0; i < m_; ++i) {
+                std::size_t c = static_cast<unsigned char>(pattern[i]);
+                blocks_[c * words_ + i / 64] |= std::uint64_t(1) << (i % 64);
+            }
+        }
+    }
+
+    std::size_t size() const { return m_; }
+
+    int distance(const std::string& text) const {
+        return distance(text.data(), text.size());
+    }
+
+    int distance(const char* text, std::size_t n) const {
+        if (m_ == 0) return static_cast<int>(n);
+        if (n == 0) return static_cast<int>(m_);
+        return words_ == 1 ? distanceSingle(text, n, kUnbounded)
+                           : distanceBlocked(text, n, kUnbounded);
+    }
+
+    // Cutoff-aware distance: returns the exact distance when it is <= bound
+    // and some value > bound otherwise. The length difference is a lower
+    // bound on the distance, so hopeless pairs never reach the kernel; inside
+    // the kernel the scan stops as soon as the last-row score can no longer
+    // fall back under the bound with the characters that remain.
+    int distance(const std::string& text, int bound) const {
+        return distance(text.data(), text.size(), bound);
+    }
+
+    int distance(const char* text, std::size_t n, int bound) const {
+        const std::size_t lengthGap = m_ > n ? m_ - n : n - m_;
+        if (bound < 0 || lengthGap > static_cast<std::size_t>(bound)) return bound + 1;
+        if (m_ == 0) return static_cast<int>(n);
+        if (n == 0) return static_cast<int>(m_);
+        return words_ == 1 ? distanceSingle(text, n, bound) : distanceBlocked(text, n, bound);
+    }
+
+    static const int kUnbounded = INT_MAX - 1;
+
+private:
+    std::size_t m_;
+    std::size_t words_;
+    std::uint64_t single_[256];
+    std::vector<std::uint64_t> blocks_;
+
+    int distanceSingle(const char* text, std::size_t n, int bound) const {
+        const std::uint64_t last = std::uint64_t(1) << (m_ - 1);
+        std::uint64_t vp = ~std::uint64_t(0);
+        std::uint64_t vn = 0;
+        int score = static_cast<int>(m_);
+
+        for (std::size_t j = 0; j < n; ++j) {
+            const std::uint64_t pm = single_[static_cast<unsigned char>(text[j])];
+            const std::uint64_t d0 = (((pm & vp) + vp) ^ vp) | pm | vn;
+            std::uint64_t hp = vn | ~(d0 | vp);
+            std::uint64_t hn = d0 & vp;
+            score += (hp & last) != 0;
+            score -= (hn & last) != 0;
+            hp = (hp << 1) | 1;
+            hn = hn << 1;
+            vp = hn | ~(d0 | hp);
+            vn = hp & d0;
+            if (score - static_cast<int>(n - j - 1) > bound) return bound + 1;
+        }
+        return score;
+    }
+
+    int distanceBlocked(const char* text, std::size_t n, int bound) const {
+        // Per-thread scratch for the vertical delta vectors so repeated calls
+        // do not allocate once the buffer has grown to the longest pattern.
+        thread_local std::vector<std::uint64_t> scratch;
+        if (scratch.size() < 2 * words_) {
+            scratch.resize(2 * words_);
+        }
+        std::uint64_t* vp = scratch.data();
+        std::uint64_t* vn = vp + words_;
+        std::fill(vp, vp + words_, ~std::uint64_t(0));
+        std::fill(vn, vn + words_, std::uint64_t(0));
+
+        const std::uint64_t last = std::uint64_t(1) << ((m_ - 1) % 64);
+        int score = static_cast<int>(m_);
+
+        for (std::size_t j = 0; j < n; ++j) {
+            const std::uint64_t* pmRow = &blocks_[static_cast<unsigned char>(text[j]) * words_];
+            std::uint64_t hpCarry = 1;
+            std::uint64_t hnCarry = 0;
+            for (std::size_t w = 0; w < words_; ++w) {
+                const std::uint64_t pm = pmRow[w] | hnCarry;
+                const std::uint64_t d0 = (((pm & vp[w]) + vp[w]) ^ vp[w]) | pm | vn[w];
+                std::uint64_t hp = vn[w] | ~(d0 | vp[w]);
+                std::uint64_t hn = d0 & vp[w];
+                const std::uint64_t hpIn = hpCarry;
+                const std::uint64_t hnIn = hnCarry;
+                if (w + 1 < words_) {
+                    hpCarry = hp >> 63;
+                    hnCarry = hn >> 63;
+                } else {
+                    hpCarry = (hp & last) != 0;
+                    hnCarry = (hn & last) != 0;
+                }
+                hp = (hp << 1) | hpIn;
+                hn = (hn << 1) | hnIn;
+                vp[w] = hn | ~(d0 | hp);
+                vn[w] = hp & d0;
+            }
+            score += static_cast<int>(hpCarry);
+            score -= static_cast<int>(hnCarry);
+            if (score - static_cast<int>(n - j - 1) > bound) return bound + 1;
+        }
+        return score;
+    }
+};
+
+// Levenshtein distance between two byte strings. The shorter string becomes
+// the bit-parallel pattern so the blocked path is only taken when both
+// inputs exceed 64 bytes.
 int levenshtein(const std::string& s1, const std::string& s2) {
-    const size_t m = s1.size();
-    const size_t n = s2.size();
-    
-    if (m == 0) return n;
-    if (n == 0) return m;
-    
-    std::vector<std::vector<int>> dp(m + 1, std::vector<int>(n + 1));
-    
-    for (size_t i = 0; i <= m; ++i) dp[i][0] = i;
-    for (size_t j = 0; j <= n; ++j) dp[0][j] = j;
-    
-    for (size_t i = 1; i <= m; ++i) {
-        for (size_t j = 1; j <= n; ++j) {
-            int cost = (s1[i-1] == s2[j-1]) ? 0 : 1;
-            dp[i][j] = std::min({
-                dp[i-1][j] + 1,      // deletion
-                dp[i][j-1] + 1,      // insertion
-                dp[i-1][j-1] + cost  // substitution
-            });
+    if (s1.size() <= s2.size()) {
+        return LevenshteinPattern(s1).distance(s2);
+    }
+    return LevenshteinPattern(s2).distance(s1);
+}
+
+// Worker count for a `threads` argument: <= 0 means every hardware thread,
+// and there is never more than one worker per task.
+static std::size_t workerCount(int threads, std::size_t tasks) {
+    std::size_t workers = threads > 0 ? static_cast<std::size_t>(threads)
+                                      : std::max(1u, std::thread::hardware_concurrency());
+    return std::max<std::size_t>(1, std::min(workers, tasks));
+}
+
+// Run fn(i) for i in [0, count) on `workers` threads (the caller is one of
+// them), handing out indices from a shared counter. The first exception
+// stops further work and is rethrown on the calling thread.
+template <typename Fn>
+static void parallelFor(std::size_t count, std::size_t workers, Fn fn) {
+    std::atomic<std::size_t> next(0);
+    std::exception_ptr failure;
+    std::mutex failureMutex;
+    auto worker = [&]() {
+        try {
+            for (std::size_t i = next++; i < count; i = next++) {
+                fn(i);
+            }
+        } catch (...) {
+            std::lock_guard<std::mutex> guard(failureMutex);
+            if (!failure) failure = std::current_exception();
+            next = count;
         }
+    };
+
+    std::vector<std::thread> pool;
+    pool.reserve(workers > 0 ? workers - 1 : 0);
+    for (std::size_t t = 1; t < workers; ++t) {
+        pool.emplace_back(worker);
+    }
+    worker();
+    for (auto& thread : pool) {
+        thread.join();
+    }
+    if (failure) {
+        std::rethrow_exception(failure);
     }
-    
-    return dp[m][n];
 }
 
-// BK-tree node structure
-struct BKNode {
-    std::string term;
-    std::vector<std::pair<int, std::shared_ptr<BKNode>>> children;
-    
-    BKNode(const std::string& t) : term(t) {}
+// Flat BK-tree storage.
+//
+// Terms live in one concatenated UTF-8 pool, nodes in a contiguous array and
+// child links in a packed edge array, so the tree costs a handful of large
+// allocations instead of one heap object per term. Each node owns a block of
+// edges sorted by distance; while terms are being inserted a block may carry
+// spare capacity and is relocated to the end of the edge array when it fills
+// up. compact() rewrites everything in BFS order with no slack, which is also
+// the order save() emits.
+struct FlatNode {
+    std::uint64_t termOffset;
+    std::uint32_t termLen;
+    std::uint32_t firstChild;     // index of the node's first edge
+    std::uint32_t childCount;
+    std::uint32_t childCapacity;  // edge slots reserved for the node
+};
+
+#pragma pack(push, 1)
+struct FlatEdge {
+    std::uint8_t distance;  // kWideEdge means ">= 255": recompute from the terms
+    std::uint32_t child;
+};
+#pragma pack(pop)
+
+static_assert(sizeof(FlatNode) == 24, "FlatNode layout must stay fixed");
+static_assert(sizeof(FlatEdge) == 5, "FlatEdge must be packed");
+
+static const std::uint8_t kWideEdge = 255;
+
+// On-disk layout of a BKTREE2 file. The sections after the header are the
+// in-memory FlatNode/FlatEdge arrays and the term pool byte for byte, so a
+// file can be memory-mapped and searched without parsing or copying.
+struct FlatFileHeader {
+    char magic[8];                // "BKTREE2\0"
+    std::uint32_t byteOrder;      // kByteOrderMark in the producer's byte order
+    std::uint32_t headerBytes;
+    std::uint64_t nodeCount;
+    std::uint64_t edgeCount;
+    std::uint64_t poolBytes;
+    std::uint64_t nodesOffset;
+    std::uint64_t edgesOffset;
+    std::uint64_t poolOffset;
+    std::uint64_t exactOffset;    // exact-match hash section, 0 if absent (files before it)
+    std::uint64_t exactSlots;
+    std::uint64_t reserved[6];
 };
 
+static_assert(sizeof(FlatFileHeader) == 128, "FlatFileHeader layout must stay fixed");
+
+static const char kMagicV1[8] = {'B', 'K', 'T', 'R', 'E', 'E', '1', 0};
+static const char kMagicV2[8] = {'B', 'K', 'T', 'R', 'E', 'E', '2', 0};
+static const std::uint32_t kByteOrderMark = 0x01020304;
+
+// FNV-1a over a term's bytes: the shard hash and the exact-match index hash.
+static std::uint64_t fnv1a64(const char* data, std::size_t length) {
+    std::uint64_t hash = 1469598103934665603ULL;
+    for (std::size_t i = 0; i < length; ++i) {
+        hash ^= static_cast<unsigned char>(data[i]);
+        hash *= 1099511628211ULL;
+    }
+    return hash;
+}
+
+// Slots in an exact-match table for `count` terms: a power of two, at most
+// two-thirds full, so probing always reaches an empty slot.
+static std::size_t exactSlotsFor(std::size_t count) {
+    std::size_t slots = 16;
+    while (slots < count + count / 2 + 1) slots <<= 1;
+    return slots;
+}
+
+// Read-only shared mapping of a file; trees loaded with load_mmap keep it
+// alive and fault pages in on demand.
+class MappedFile {
+public:
+    explicit MappedFile(const std::string& path) {
+        int fd = ::open(path.c_str(), O_RDONLY);
+        if (fd < 0) {
+            throw std::runtime_error("BKTree.load_mmap: unable to open file for reading");
+        }
+        struct stat st;
+        if (::fstat(fd, &st) != 0) {
+            ::close(fd);
+            throw std::runtime_error("BKTree.load_mmap: unable to stat file");
+        }
+        size_ = static_cast<std::size_t>(st.st_size);
+        if (size_ > 0) {
+            void* addr = ::mmap(nullptr, size_, PROT_READ, MAP_SHARED, fd, 0);
+            if (addr == MAP_FAILED) {
+                ::close(fd);
+                throw std::runtime_error("BKTree.load_mmap: mmap failed");
+            }
+            data_ = static_cast<const char*>(addr);
+        }
+        ::close(fd);
+    }
+
+    ~MappedFile() {
+        if (data_) {
+            ::munmap(const_cast<char*>(data_), size_);
+        }
+    }
+
+    MappedFile(const MappedFile&) = delete;
+    MappedFile& operator=(const MappedFile&) = delete;
+
+    const char* data() const { return data_; }
+    std::size_t size() const { return size_; }
+
+private:
+    const char* data_ = nullptr;
+    std::size_t size_ = 0;
+};
+
+// Input buffer over a Python binary file-like object (anything with
+// readinto() or read(): open files, gzip/tar members, GCS blob readers).
+// The GIL is taken only while a chunk is fetched, so the loader parses
+// without it. Reads at least as large as the buffer go straight into the
+// caller's memory through readinto(). A Python exception ends the stream
+// and is kept so the binding can re-raise it instead of a parse error.
+namespace {
+class PyReadStreambuf : public std::streambuf {
+public:
+    PyReadStreambuf(py::object readable, std::size_t bufferBytes, const char* context = "BKTree.load_stream")
+        : buffer_(std::max<std::size_t>(bufferBytes, 4096)) {
+        if (py::hasattr(readable, "readinto")) {
+            readinto_ = readable.attr("readinto");
+        } else if (py::hasattr(readable, "read")) {
+            read_ = readable.attr("read");
+        } else {
+            throw py::type_error(std::string(context) +
+                                 ": expected a binary file-like object with read() or readinto()");
+        }
+        setg(buffer_.data(), buffer_.data(), buffer_.data());
+    }
+
+    // Bytes pulled from the Python object so far.
+    std::uint64_t bytesRead() const { return bytesRead_; }
+
+    void rethrowIfFailed() const {
+        if (error_) std::rethrow_exception(error_);
+    }
+
+protected:
+    int_type underflow() override {
+        if (gptr() < egptr()) return traits_type::to_int_type(*gptr());
+        const std::size_t got = fetch(buffer_.data(), buffer_.size());
+        setg(buffer_.data(), buffer_.data(), buffer_.data() + got);
+        return got == 0 ? traits_type::eof() : traits_type::to_int_type(*gptr());
+    }
+
+    std::streamsize xsgetn(char* out, std::streamsize count) override {
+        std::streamsize done = 0;
+        while (done < count) {
+            std::streamsize available = egptr() - gptr();
+            if (available == 0) {
+                const std::size_t want = static_cast<std::size_t>(count - done);
+                if (want >= buffer_.size()) {
+                    const std::size_t got = fetch(out + done, want);
+                    if (got == 0) break;
+                    done += static_cast<std::streamsize>(got);
+                    continue;
+                }
+                if (traits_type::eq_int_type(underflow(), traits_type::eof())) break;
+                available = egptr() - gptr();
+            }
+            const std::streamsize step = std::min(available, count - done);
+            std::memcpy(out + done, gptr(), static_cast<std::size_t>(step));
+            gbump(static_cast<int>(step));
+            done += step;
+        }
+        return done;
+    }
+
+private:
+    // One readinto()/read() call; returns 0 at end of stream or on error.
+    std::size_t fetch(char* dest, std::size_t capacity) {
+        if (eof_ || error_) return 0;
+        std::size_t got = 0;
+        try {
+            py::gil_scoped_acquire gil;
+            if (readinto_) {
+                py::memoryview view = py::memoryview::from_memory(dest, static_cast<py::ssize_t>(capacity));
+                py::object n = readinto_(view);
+                view.attr("release")();
+                got = n.is_none() ? 0 : n.cast<std::size_t>();
+            } else {
+                py::object chunk = read_(capacity);
+                if (!py::isinstance<py::bytes>(chunk)) chunk = py::bytes(chunk);
+                char* data = nullptr;
+                py::ssize_t length = 0;
+                if (PYBIND11_BYTES_AS_STRING_AND_SIZE(chunk.ptr(), &data, &length) != 0) {
+                    throw py::error_already_set();
+                }
+                got = std::min(static_cast<std::size_t>(length), capacity);
+                std::memcpy(dest, data, got);
+            }
+            if (got > capacity) throw std::runtime_error("readinto() overran its buffer");
+        } catch (...) {
+            error_ = std::current_exception();
+            return 0;
+        }
+        if (got == 0) eof_ = true;
+        bytesRead_ += got;
+        return got;
+    }
+
+    py::object readinto_;
+    py::object read_;
+    std::vector<char> buffer_;
+    std::uint64_t bytesRead_ = 0;
+    bool eof_ = false;
+    std::exception_ptr error_;
+};
+}  // namespace
+
+// Check a BKTREE2 header against the size of the file it came from.
+static void validateFlatHeader(const FlatFileHeader& header, std::uint64_t fileBytes, const char* context) {
+    auto fail = [context](const char* what) {
+        throw std::runtime_error(std::string(context) + ": " + what);
+    };
+    if (std::memcmp(header.magic, kMagicV2, sizeof(kMagicV2)) != 0) fail("invalid file header");
+    if (header.byteOrder != kByteOrderMark) fail("file was written with a different byte order");
+    if (header.headerBytes < sizeof(FlatFileHeader)) fail("truncated file header");
+    if (header.nodeCount > UINT32_MAX || header.edgeCount > UINT32_MAX) fail("node count exceeds 32-bit index range");
+    if (header.nodesOffset % alignof(FlatNode) != 0) fail("misaligned node section");
+    // Written as subtractions so a corrupt header cannot overflow; streams of
+    // unknown length pass UINT64_MAX and rely on reads failing at the end.
+    auto fits = [fileBytes](std::uint64_t offset, std::uint64_t bytes) {
+        return offset <= fileBytes && bytes <= fileBytes - offset;
+    };
+    if (!fits(header.nodesOffset, header.nodeCount * sizeof(FlatNode)) ||
+        !fits(header.edgesOffset, header.edgeCount * sizeof(FlatEdge)) ||
+        !fits(header.poolOffset, header.poolBytes)) {
+        fail("file is truncated");
+    }
+    if (header.exactSlots != 0) {
+        if ((header.exactSlots & (header.exactSlots - 1)) != 0 || header.exactSlots <= header.nodeCount ||
+            header.exactSlots > (std::uint64_t(1) << 34)) {
+            fail("invalid exact-match index size");
+        }
+        if (header.exactOffset % alignof(std::uint32_t) != 0) fail("misaligned exact-match index");
+        if (!fits(header.exactOffset, header.exactSlots * sizeof(std::uint32_t))) fail("file is truncated");
+    }
+}
+
+// Work done by one search. search_with_stats returns it per query and every
+// search adds it to its tree's SearchCounters.
+struct SearchStats {
+    std::uint64_t visited = 0;        // nodes reached
+    std::uint64_t distanceCalls = 0;  // nodes the distance kernel ran on (not rejected on length)
+    std::uint64_t pruned = 0;         // child subtrees skipped by the distance band
+    std::uint64_t maxDepth = 0;       // deepest node reached, root = 0
+    std::uint64_t elapsedNs = 0;
+
+    void merge(const SearchStats& other) {
+        visited += other.visited;
+        distanceCalls += other.distanceCalls;
+        pruned += other.pruned;
+        maxDepth = std::max(maxDepth, other.maxDepth);
+        elapsedNs += other.elapsedNs;
+    }
+
+    std::map<std::string, std::uint64_t> toMap() const {
+        return {{"visited", visited}, {"distance_calls", distanceCalls}, {"pruned", pruned},
+                {"max_depth", maxDepth}, {"elapsed_ns", elapsedNs}};
+    }
+};
+
+// Lock-free running totals over every search a tree has served.
+struct SearchCounters {
+    std::atomic<std::uint64_t> searches{0};
+    std::atomic<std::uint64_t> visited{0};
+    std::atomic<std::uint64_t> distanceCalls{0};
+    std::atomic<std::uint64_t> pruned{0};
+    std::atomic<std::uint64_t> maxDepth{0};
+    std::atomic<std::uint64_t> elapsedNs{0};
+
+    void add(const SearchStats& stats) {
+        searches.fetch_add(1, std::memory_order_relaxed);
+        visited.fetch_add(stats.visited, std::memory_order_relaxed);
+        distanceCalls.fetch_add(stats.distanceCalls, std::memory_order_relaxed);
+        pruned.fetch_add(stats.pruned, std::memory_order_relaxed);
+        elapsedNs.fetch_add(stats.elapsedNs, std::memory_order_relaxed);
+        std::uint64_t depth = maxDepth.load(std::memory_order_relaxed);
+        while (stats.maxDepth > depth &&
+               !maxDepth.compare_exchange_weak(depth, stats.maxDepth, std::memory_order_relaxed)) {
+        }
+    }
+
+    std::map<std::string, std::uint64_t> snapshot() const {
+        return {{"searches", searches.load(std::memory_order_relaxed)},
+                {"visited", visited.load(std::memory_order_relaxed)},
+                {"distance_calls", distanceCalls.load(std::memory_order_relaxed)},
+                {"pruned", pruned.load(std::memory_order_relaxed)},
+                {"max_depth", maxDepth.load(std::memory_order_relaxed)},
+                {"elapsed_ns", elapsedNs.load(std::memory_order_relaxed)}};
+    }
+
+    void reset() {
+        searches = 0;
+        visited = 0;
+        distanceCalls = 0;
+        pruned = 0;
+        maxDepth = 0;
+        elapsedNs = 0;
+    }
+};
+
+// Shape of a tree: depth, fan-out, the distance on each edge (how far a
+// child's term sits from its parent's) and term byte lengths. Histograms are
+// dense vectors indexed by value.
+struct TreeStats {
+    std::uint64_t nodes = 0;
+    std::uint64_t edges = 0;
+    std::uint64_t leaves = 0;
+    std::uint64_t depthSum = 0;
+    std::uint64_t termBytes = 0;
+    std::vector<std::uint64_t> depth;
+    std::vector<std::uint64_t> fanout;
+    std::vector<std::uint64_t> edgeDistance;
+    std::vector<std::uint64_t> termLength;
+
+    static void bump(std::vector<std::uint64_t>& histogram, std::size_t value, std::uint64_t count = 1) {
+        if (histogram.size() <= value) histogram.resize(value + 1, 0);
+        histogram[value] += count;
+    }
+
+    void merge(const TreeStats& other) {
+        nodes += other.nodes;
+        edges += other.edges;
+        leaves += other.leaves;
+        depthSum += other.depthSum;
+        termBytes += other.termBytes;
+        for (const auto& pair : {std::make_pair(&depth, &other.depth), std::make_pair(&fanout, &other.fanout),
+                                 std::make_pair(&edgeDistance, &other.edgeDistance),
+                                 std::make_pair(&termLength, &other.termLength)}) {
+            for (std::size_t value = 0; value < pair.second->size(); ++value) {
+                if ((*pair.second)[value]) bump(*pair.first, value, (*pair.second)[value]);
+            }
+        }
+    }
+
+    py::dict toDict() const {
+        auto sparse = [](const std::vector<std::uint64_t>& histogram) {
+            py::dict out;
+            for (std::size_t value = 0; value < histogram.size(); ++value) {
+                if (histogram[value]) out[py::int_(value)] = histogram[value];
+            }
+            return out;
+        };
+        auto ratio = [](std::uint64_t num, std::uint64_t den) {
+            return den ? static_cast<double>(num) / static_cast<double>(den) : 0.0;
+        };
+        py::dict out;
+        out["nodes"] = nodes;
+        out["edges"] = edges;
+        out["leaves"] = leaves;
+        out["max_depth"] = depth.empty() ? 0 : depth.size() - 1;
+        out["mean_depth"] = ratio(depthSum, nodes);
+        out["max_fanout"] = fanout.empty() ? 0 : fanout.size() - 1;
+        out["mean_fanout"] = ratio(edges, nodes - leaves);
+        out["max_term_length"] = termLength.empty() ? 0 : termLength.size() - 1;
+        out["mean_term_length"] = ratio(termBytes, nodes);
+        out["depth_histogram"] = sparse(depth);
+        out["fanout_histogram"] = sparse(fanout);
+        out["edge_distance_histogram"] = sparse(edgeDistance);
+        out["term_length_histogram"] = sparse(termLength);
+        return out;
+    }
+};
+
+static std::uint64_t elapsedSince(std::chrono::steady_clock::time_point start) {
+    return static_cast<std::uint64_t>(std::chrono::duration_cast<std::chrono::nanoseconds>(
+        std::chrono::steady_clock::now() - start).count());
+}
+
 // BK-tree implementation
+//
+// Mutating operations take the tree lock exclusively and lookups take it
+// shared, so the Python bindings can drop the GIL for the whole traversal
+// and let searches from different threads run in parallel.
 class BKTree {
 private:
-    std::shared_ptr<BKNode> root;
-    
-    void insertHelper(std::shared_ptr<BKNode>& node, const std::string& term) {
-        if (!node) {
-            node = std::make_shared<BKNode>(term);
+    // Arrays the tree reads from: either the owned vectors below or the
+    // sections of a memory-mapped BKTREE2 file.
+    struct TreeView {
+        const char* pool = nullptr;
+        const FlatNode* nodes = nullptr;
+        const FlatEdge* edges = nullptr;
+        std::size_t nodeCount = 0;
+        std::size_t edgeCount = 0;
+        std::size_t poolBytes = 0;
+        const std::uint32_t* exact = nullptr;  // exact-match slots (node index + 1, 0 = empty)
+        std::size_t exactMask = 0;             // slot count - 1
+    };
+
+    std::vector<char> pool_;
+    std::vector<FlatNode> nodes_;
+    std::vector<FlatEdge> edges_;
+    std::vector<std::uint32_t> exact_;
+    std::shared_ptr<MappedFile> mapping_;
+    TreeView view_;
+    mutable std::shared_mutex mutex_;
+    mutable SearchCounters counters_;  // per tree object, not moved or saved
+
+    void refreshView() {
+        view_.pool = pool_.data();
+        view_.nodes = nodes_.data();
+        view_.edges = edges_.data();
+        view_.nodeCount = nodes_.size();
+        view_.edgeCount = edges_.size();
+        view_.poolBytes = pool_.size();
+        view_.exact = exact_.empty() ? nullptr : exact_.data();
+        view_.exactMask = exact_.empty() ? 0 : exact_.size() - 1;
+    }
+
+    // Exact-match index: an open-addressing table of node indices keyed by
+    // the term's FNV-1a hash, so an exact hit costs one hash and usually one
+    // comparison instead of a walk from the root. It is rebuilt whenever
+    // node indices change (compaction) and extended by insert.
+    static std::size_t exactHome(const char* data, std::size_t length) {
+        const std::uint64_t hash = fnv1a64(data, length);
+        return static_cast<std::size_t>(hash ^ (hash >> 32));
+    }
+
+    static void exactPlace(std::vector<std::uint32_t>& slots, std::uint32_t index, const char* data,
+                           std::size_t length) {
+        const std::size_t mask = slots.size() - 1;
+        std::size_t slot = exactHome(data, length) & mask;
+        while (slots[slot] != 0) slot = (slot + 1) & mask;
+        slots[slot] = index + 1;
+    }
+
+    void rebuildExact() {
+        exact_.assign(exactSlotsFor(view_.nodeCount), 0);
+        for (std::uint32_t i = 0; i < static_cast<std::uint32_t>(view_.nodeCount); ++i) {
+            exactPlace(exact_, i, termData(i), view_.nodes[i].termLen);
+        }
+        view_.exact = exact_.data();
+        view_.exactMask = exact_.size() - 1;
+    }
+
+    // Index the node just appended at `index`, growing the table if needed.
+    void exactAdd(std::uint32_t index) {
+        if (exactSlotsFor(view_.nodeCount) > exact_.size()) {
+            rebuildExact();
             return;
         }
-        
-        int dist = levenshtein(node->term, term);
-        if (dist == 0) return; // duplicate
-        
-        // Find child with this distance
-        for (auto& child : node->children) {
-            if (child.first == dist) {
-                insertHelper(child.second, term);
+        exactPlace(exact_, index, termData(index), view_.nodes[index].termLen);
+    }
+
+    bool exactFind(const char* data, std::size_t length, std::uint32_t& index) const {
+        if (view_.exact == nullptr) {
+            return false;
+        }
+        std::size_t slot = exactHome(data, length) & view_.exactMask;
+        for (std::uint32_t entry; (entry = view_.exact[slot]) != 0; slot = (slot + 1) & view_.exactMask) {
+            const std::uint32_t candidate = entry - 1;
+            if (candidate < view_.nodeCount && view_.nodes[candidate].termLen == length &&
+                std::memcmp(termData(candidate), data, length) == 0) {
+                index = candidate;
+                return true;
+            }
+        }
+        return false;
+    }
+
+    // The distance-0 match for `query`, if the tree holds it, as a result list.
+    bool exactLocked(const std::string& query, std::vector<std::pair<std::string, int>>& results) const {
+        std::uint32_t index;
+        if (!exactFind(query.data(), query.size(), index)) {
+            return false;
+        }
+        results.emplace_back(query, 0);
+        return true;
+    }
+
+    const char* termData(std::uint32_t index) const {
+        return view_.pool + view_.nodes[index].termOffset;
+    }
+
+    // Check every index and offset in a loaded image against the sections
+    // it points into, so a corrupt file fails to load instead of crashing a
+    // later search. One pass over nodes, edges and exact-match slots. Every
+    // writer emits children after their parent (insertion or BFS order), so
+    // requiring that also rules out cycles.
+    void validateView(const char* context) const {
+        auto fail = [context](const char* what) {
+            throw std::runtime_error(std::string(context) + ": " + what);
+        };
+        std::uint64_t edgesUsed = 0;
+        for (std::size_t i = 0; i < view_.nodeCount; ++i) {
+            const FlatNode& node = view_.nodes[i];
+            if (node.termOffset > view_.poolBytes || node.termLen > view_.poolBytes - node.termOffset) {
+                fail("term outside the term pool");
+            }
+            if (node.childCount > node.childCapacity || node.firstChild > view_.edgeCount ||
+                node.childCapacity > view_.edgeCount - node.firstChild) {
+                fail("child edges outside the edge section");
+            }
+            edgesUsed += node.childCount;
+            if (edgesUsed > view_.edgeCount) fail("child edges outside the edge section");
+            for (std::size_t e = node.firstChild; e < node.firstChild + std::size_t(node.childCount); ++e) {
+                const std::uint32_t child = view_.edges[e].child;
+                if (child <= i || child >= view_.nodeCount) fail("invalid child index");
+            }
+        }
+        if (view_.exact != nullptr) {
+            bool free = false;
+            for (std::size_t slot = 0; slot <= view_.exactMask; ++slot) {
+                const std::uint32_t entry = view_.exact[slot];
+                if (entry > view_.nodeCount) fail("invalid exact-match index entry");
+                free = free || entry == 0;
+            }
+            if (!free) fail("exact-match index has no free slot");
+        }
+    }
+
+    std::string termString(std::uint32_t index) const {
+        return std::string(termData(index), view_.nodes[index].termLen);
+    }
+
+    // Exact distance of an edge; only edges of 255 or more need the terms.
+    int edgeDistance(std::uint32_t parent, const FlatEdge& edge) const {
+        if (edge.distance != kWideEdge) {
+            return edge.distance;
+        }
+        const FlatNode& a = view_.nodes[parent];
+        const FlatNode& b = view_.nodes[edge.child];
+        if (a.termLen <= b.termLen) {
+            return LevenshteinPattern(termData(parent), a.termLen).distance(termData(edge.child), b.termLen);
+        }
+        return LevenshteinPattern(termData(edge.child), b.termLen).distance(termData(parent), a.termLen);
+    }
+
+    std::uint32_t appendNode(const char* data, std::size_t length) {
+        if (nodes_.size() >= UINT32_MAX) {
+            throw std::length_error("BKTree: node count exceeds 32-bit index range");
+        }
+        FlatNode node;
+        node.termOffset = pool_.size();
+        node.termLen = static_cast<std::uint32_t>(length);
+        node.firstChild = static_cast<std::uint32_t>(edges_.size());
+        node.childCount = 0;
+        node.childCapacity = 0;
+        pool_.insert(pool_.end(), data, data + length);
+        nodes_.push_back(node);
+        refreshView();
+        return static_cast<std::uint32_t>(nodes_.size() - 1);
+    }
+
+    // Insert an edge into the parent's block, keeping it sorted by distance.
+    void addEdge(std::uint32_t parent, int distance, std::uint32_t child) {
+        FlatNode& node = nodes_[parent];
+        if (node.childCount == node.childCapacity) {
+            std::uint32_t capacity = node.childCapacity ? node.childCapacity * 2 : 2;
+            std::size_t first = edges_.size();
+            if (first + capacity > UINT32_MAX) {
+                throw std::length_error("BKTree: edge count exceeds 32-bit index range");
+            }
+            edges_.resize(first + capacity);
+            std::copy(edges_.begin() + node.firstChild,
+                      edges_.begin() + node.firstChild + node.childCount,
+                      edges_.begin() + first);
+            node.firstChild = static_cast<std::uint32_t>(first);
+            node.childCapacity = capacity;
+        }
+
+        FlatEdge edge;
+        edge.distance = static_cast<std::uint8_t>(std::min(distance, static_cast<int>(kWideEdge)));
+        edge.child = child;
+
+        FlatEdge* begin = &edges_[node.firstChild];
+        FlatEdge* end = begin + node.childCount;
+        FlatEdge* pos = std::upper_bound(begin, end, edge.distance,
+            [](std::uint8_t d, const FlatEdge& e) { return d < e.distance; });
+        std::copy_backward(pos, end, end + 1);
+        *pos = edge;
+        ++node.childCount;
+        refreshView();
+    }
+
+    // Child reached through an edge of exactly `distance`, if any.
+    bool findChild(std::uint32_t parent, int distance, std::uint32_t& child) const {
+        const FlatNode& node = view_.nodes[parent];
+        const FlatEdge* begin = view_.edges + node.firstChild;
+        const FlatEdge* end = begin + node.childCount;
+        const std::uint8_t stored = static_cast<std::uint8_t>(std::min(distance, static_cast<int>(kWideEdge)));
+        const FlatEdge* it = std::lower_bound(begin, end, stored,
+            [](const FlatEdge& e, std::uint8_t d) { return e.distance < d; });
+        for (; it != end && it->distance == stored; ++it) {
+            if (stored != kWideEdge || edgeDistance(parent, *it) == distance) {
+                child = it->child;
+                return true;
+            }
+        }
+        return false;
+    }
+
+    // Walk down from `node` to the first node without a child at the term's
+    // distance and attach the term there. A loop rather than recursion, so
+    // a degenerate tree cannot exhaust the stack.
+    void insertHelper(std::uint32_t node, const std::string& term, const LevenshteinPattern& pattern) {
+        for (;;) {
+            int dist = pattern.distance(termData(node), view_.nodes[node].termLen);
+            if (dist == 0) return; // duplicate
+
+            std::uint32_t child;
+            if (!findChild(node, dist, child)) {
+                // No child with this distance, create new
+                std::uint32_t newNode = appendNode(term.data(), term.size());
+                addEdge(node, dist, newNode);
                 return;
             }
+            node = child;
         }
-        
-        // No child with this distance, create new
-        auto newNode = std::make_shared<BKNode>(term);
-        node->children.push_back({dist, newNode});
+    }
+
+    // No node: node indices stay below UINT32_MAX (see appendNode).
+    static constexpr std::uint32_t kNoNode = UINT32_MAX;
+
+    // Range search from the root. Depth-first over an explicit stack that
+    // each thread keeps between calls, so a search allocates nothing besides
+    // its results and tree depth is bounded only by memory. Children are
+    // pushed in reverse to visit them in edge order, as a recursive walk would.
+    // `seeded` is the exact hit the caller already put in `results` at
+    // distance 0: the walk knows its distance without computing it and does
+    // not report it again.
+    void searchLocked(const LevenshteinPattern& query, int maxDist,
+                      std::vector<std::pair<std::string, int>>& results, SearchStats& out,
+                      std::uint32_t seeded = kNoNode) const {
+        if (view_.nodeCount == 0) {
+            return;
+        }
+        // Borrow the thread's buffer for the walk: a local vector optimises
+        // better than a thread_local accessed in the loop.
+        static thread_local std::vector<std::pair<std::uint32_t, std::uint32_t>> threadStack;  // (node, depth)
+        std::vector<std::pair<std::uint32_t, std::uint32_t>> stack;
+        stack.swap(threadStack);
+        stack.clear();
+        stack.emplace_back(0, 0);
+        SearchStats stats;  // local copy the compiler can keep in registers
+
+        while (!stack.empty()) {
+            const std::uint32_t index = stack.back().first;
+            const std::uint32_t depth = stack.back().second;
+            stack.pop_back();
+
+            const FlatNode& node = view_.nodes[index];
+            const FlatEdge* begin = view_.edges + node.firstChild;
+            const FlatEdge* end = begin + node.childCount;
+
+            // The exact distance only matters while it is <= maxDist plus the
+            // widest child edge: beyond that neither this node nor any child band
+            // can match, so the bounded kernel may give up early. Edges are sorted,
+            // so the widest one is last.
+            int maxEdge = 0;
+            if (begin != end) {
+                maxEdge = end[-1].distance == kWideEdge ? LevenshteinPattern::kUnbounded : end[-1].distance;
+            }
+            const int bound = maxDist > LevenshteinPattern::kUnbounded - maxEdge
+                ? LevenshteinPattern::kUnbounded : maxDist + maxEdge;
+            ++stats.visited;
+            stats.maxDepth = std::max<std::uint64_t>(stats.maxDepth, depth);
+            int dist = 0;
+            if (index != seeded) {
+                if (lengthGap(query.size(), node.termLen) <= static_cast<std::size_t>(bound)) ++stats.distanceCalls;
+                dist = query.distance(termData(index), node.termLen, bound);
+                if (dist > bound) continue;
+                if (dist <= maxDist) {
+                    results.emplace_back(termString(index), dist);
+                }
+            }
+
+            // Prune search by distance band
+            int minDist = dist - maxDist;
+            int maxDistEdge = dist + maxDist;
+
+            // Edges are sorted, so scanning them backwards skips the band's
+            // upper side, then stops at the first edge below it.
+            for (const FlatEdge* edge = end; edge != begin;) {
+                --edge;
+                if (edge->distance > maxDistEdge) {
+                    ++stats.pruned;
+                    continue;
+                }
+                if (edge->distance < minDist && edge->distance != kWideEdge) {
+                    stats.pruned += static_cast<std::uint64_t>(edge - begin) + 1;
+                    break;
+                }
+                int edgeDist = edgeDistance(index, *edge);
+                if (edgeDist >= minDist && edgeDist <= maxDistEdge) {
+                    stack.emplace_back(edge->child, depth + 1);
+                } else {
+                    ++stats.pruned;
+                }
+            }
+        }
+        out.merge(stats);
+        threadStack.swap(stack);
+    }
+
+    static std::size_t lengthGap(std::size_t a, std::size_t b) {
+        return a > b ? a - b : b - a;
+    }
+
+    std::string_view termView(std::uint32_t index) const {
+        return std::string_view(termData(index), view_.nodes[index].termLen);
+    }
+
+    // k-nearest-neighbour search with an adaptive radius. The traversal is
+    // depth-first but each node's children are visited tightest lower bound
+    // |d(query, parent) - edge| first; once k candidates are held the radius
+    // shrinks to the worst of them, so later subtrees prune harder. Ties are
+    // broken by term exactly as search() sorts. A `seeded` exact hit starts
+    // out among the candidates, with its distance known.
+    std::vector<std::pair<std::string, int>> topkLocked(const LevenshteinPattern& query, std::size_t k,
+                                                        int maxDist, SearchStats& stats,
+                                                        std::uint32_t seeded = kNoNode) const {
+        std::vector<std::pair<std::string, int>> results;
+        if (k == 0 || view_.nodeCount == 0 || maxDist < 0) {
+            return results;
+        }
+
+        typedef std::pair<int, std::uint32_t> Entry;  // (distance or bound, node)
+        auto worse = [this](const Entry& a, const Entry& b) {
+            if (a.first != b.first) return a.first < b.first;
+            return termView(a.second) < termView(b.second);
+        };
+        std::priority_queue<Entry, std::vector<Entry>, decltype(worse)> best(worse);
+        typedef std::tuple<int, std::uint32_t, std::uint32_t> Pending;  // (bound, node, depth)
+        std::vector<Pending> frontier;
+        frontier.push_back(Pending(0, 0, 0));
+        int radius = maxDist;
+        if (seeded != kNoNode) {
+            best.push(Entry(0, seeded));
+            if (best.size() == k) radius = 0;
+        }
+
+        while (!frontier.empty()) {
+            const Pending next = frontier.back();
+            frontier.pop_back();
+            const int lowerBound = std::get<0>(next);
+            if (lowerBound > radius) {
+                ++stats.pruned;
+                continue;
+            }
+
+            const std::uint32_t index = std::get<1>(next);
+            const FlatNode& node = view_.nodes[index];
+            const FlatEdge* begin = view_.edges + node.firstChild;
+            const FlatEdge* end = begin + node.childCount;
+            int maxEdge = 0;
+            if (begin != end) {
+                maxEdge = end[-1].distance == kWideEdge ? LevenshteinPattern::kUnbounded : end[-1].distance;
+            }
+            const int bound = radius > LevenshteinPattern::kUnbounded - maxEdge
+                ? LevenshteinPattern::kUnbounded : radius + maxEdge;
+            ++stats.visited;
+            stats.maxDepth = std::max<std::uint64_t>(stats.maxDepth, std::get<2>(next));
+            int dist = 0;
+            if (index != seeded) {
+                if (lengthGap(query.size(), node.termLen) <= static_cast<std::size_t>(bound)) ++stats.distanceCalls;
+                dist = query.distance(termData(index), node.termLen, bound);
+                if (dist > bound) continue;
+            }
+
+            if (dist <= radius && index != seeded) {
+                best.push(Entry(dist, index));
+                if (best.size() > k) best.pop();
+                if (best.size() == k) radius = best.top().first;
+            }
+
+            const std::size_t pushedFrom = frontier.size();
+            const int minEdge = dist - radius;
+            const int maxDistEdge = radius > LevenshteinPattern::kUnbounded - dist
+                ? LevenshteinPattern::kUnbounded : dist + radius;
+            for (const FlatEdge* edge = begin; edge != end; ++edge) {
+                if (edge->distance < minEdge && edge->distance != kWideEdge) {
+                    ++stats.pruned;
+                    continue;
+                }
+                if (edge->distance > maxDistEdge) {
+                    stats.pruned += static_cast<std::uint64_t>(end - edge);
+                    break;
+                }
+                const int edgeDist = edgeDistance(index, *edge);
+                const int lower = std::max(lowerBound, std::abs(dist - edgeDist));
+                if (lower <= radius) {
+                    frontier.push_back(Pending(lower, edge->child, std::get<2>(next) + 1));
+                } else {
+                    ++stats.pruned;
+                }
+            }
+            // Visit the tightest subtrees first so the radius shrinks early.
+            std::sort(frontier.begin() + pushedFrom, frontier.end(), std::greater<Pending>());
+        }
+
+        results.reserve(best.size());
+        while (!best.empty()) {
+            results.emplace_back(termString(best.top().second), best.top().first);
+            best.pop();
+        }
+        std::reverse(results.begin(), results.end());
+        return results;
+    }
+
+    void insertLocked(const std::string& term, const LevenshteinPattern& pattern) {
+        std::uint32_t existing;
+        if (exactFind(term.data(), term.size(), existing)) {
+            return;  // duplicate, found without walking the tree
+        }
+        const std::size_t before = view_.nodeCount;
+        if (before == 0) {
+            appendNode(term.data(), term.size());
+        } else {
+            insertHelper(0, term, pattern);
+        }
+        if (view_.nodeCount != before) {
+            exactAdd(static_cast<std::uint32_t>(view_.nodeCount - 1));
+        }
+    }
+
+    // One unit of a parallel build: the terms (indices into the input, in
+    // input order) that sequential insertion would route into one subtree.
+    // A split job keeps items[0] as its root and hands every other item to a
+    // child job per distance bucket; a leaf job is built sequentially.
+    struct BuildJob {
+        std::vector<std::uint32_t> items;
+        bool split = false;
+        std::vector<std::pair<int, std::size_t>> children;  // (distance, job), in edge order
+        std::unique_ptr<BKTree> tree;
+    };
+
+    // Split the largest jobs by distance to their first term until there are
+    // enough similarly sized leaves to keep every worker busy. Subtrees of a
+    // BK-tree only depend on which terms reach them and in what order, so the
+    // buckets can then be built independently.
+    static void planBuild(const std::vector<std::string>& terms,
+                          std::vector<std::unique_ptr<BuildJob>>& jobs, std::size_t workers) {
+        const std::size_t leafTarget = std::max<std::size_t>(2048, terms.size() / (workers * 8));
+        std::vector<int> distances;
+        for (;;) {
+            std::size_t largest = jobs.size();
+            for (std::size_t j = 0; j < jobs.size(); ++j) {
+                if (!jobs[j]->split && jobs[j]->items.size() > leafTarget &&
+                    (largest == jobs.size() || jobs[j]->items.size() > jobs[largest]->items.size())) {
+                    largest = j;
+                }
+            }
+            if (largest == jobs.size()) return;
+
+            BuildJob& job = *jobs[largest];
+            const std::string& root = terms[job.items[0]];
+            const LevenshteinPattern pattern(root);
+            const std::size_t count = job.items.size();
+            distances.assign(count, 0);
+            const std::size_t chunk = 4096;
+            const std::size_t chunks = (count + chunk - 1) / chunk;
+            parallelFor(chunks, std::min(workers, chunks), [&](std::size_t c) {
+                const std::size_t end = std::min(count, (c + 1) * chunk);
+                for (std::size_t i = std::max<std::size_t>(1, c * chunk); i < end; ++i) {
+                    const std::string& term = terms[job.items[i]];
+                    distances[i] = pattern.distance(term.data(), term.size());
+                }
+            });
+
+            // Buckets in first-appearance order; duplicates of the root vanish
+            // exactly as insert() drops them.
+            std::unordered_map<int, std::size_t> bucket;
+            for (std::size_t i = 1; i < count; ++i) {
+                const int d = distances[i];
+                if (d == 0) continue;
+                auto found = bucket.find(d);
+                if (found == bucket.end()) {
+                    found = bucket.emplace(d, jobs.size()).first;
+                    job.children.emplace_back(d, jobs.size());
+                    jobs.emplace_back(new BuildJob());
+                }
+                jobs[found->second]->items.push_back(job.items[i]);
+            }
+            // Edge order as addEdge leaves it: by stored distance, ties (wide
+            // edges) in insertion order.
+            std::stable_sort(job.children.begin(), job.children.end(),
+                [](const std::pair<int, std::size_t>& a, const std::pair<int, std::size_t>& b) {
+                    return std::min(a.first, static_cast<int>(kWideEdge)) <
+                           std::min(b.first, static_cast<int>(kWideEdge));
+                });
+            job.items.resize(1);
+            job.split = true;
+        }
+    }
+
+    // Append a planned job's subtree to this tree and return its root index.
+    std::uint32_t graftJob(const std::vector<std::string>& terms,
+                           std::vector<std::unique_ptr<BuildJob>>& jobs, std::size_t j) {
+        BuildJob& job = *jobs[j];
+        if (job.split) {
+            const std::string& root = terms[job.items[0]];
+            const std::uint32_t index = appendNode(root.data(), root.size());
+            for (const auto& child : job.children) {
+                const std::uint32_t childIndex = graftJob(terms, jobs, child.second);
+                addEdge(index, child.first, childIndex);
+            }
+            return index;
+        }
+
+        BKTree& sub = *job.tree;
+        const std::uint64_t poolBase = pool_.size();
+        const std::size_t nodeBase = nodes_.size();
+        const std::size_t edgeBase = edges_.size();
+        if (nodeBase + sub.nodes_.size() > UINT32_MAX || edgeBase + sub.edges_.size() > UINT32_MAX) {
+            throw std::length_error("BKTree: tree exceeds 32-bit index range");
+        }
+        pool_.insert(pool_.end(), sub.pool_.begin(), sub.pool_.end());
+        for (FlatNode node : sub.nodes_) {
+            node.termOffset += poolBase;
+            node.firstChild += static_cast<std::uint32_t>(edgeBase);
+            nodes_.push_back(node);
+        }
+        for (FlatEdge edge : sub.edges_) {
+            edge.child += static_cast<std::uint32_t>(nodeBase);
+            edges_.push_back(edge);
+        }
+        refreshView();
+        job.tree.reset();  // release the part as soon as it is copied
+        return static_cast<std::uint32_t>(nodeBase);
+    }
+
+    // Node indices in BFS order, following each node's sorted edge block.
+    std::vector<std::uint32_t> bfsOrder() const {
+        std::vector<std::uint32_t> order;
+        if (view_.nodeCount == 0) {
+            return order;
+        }
+        order.reserve(view_.nodeCount);
+        order.push_back(0);
+        for (std::size_t i = 0; i < order.size() && order.size() <= view_.nodeCount; ++i) {
+            const FlatNode& node = view_.nodes[order[i]];
+            for (std::uint32_t c = 0; c < node.childCount; ++c) {
+                order.push_back(view_.edges[node.firstChild + c].child);
+            }
+        }
+        if (order.size() != view_.nodeCount) {
+            throw std::runtime_error("BKTree: node graph is not a tree rooted at node 0");
+        }
+        return order;
+    }
+
+    // Rewrite the tree into freshly allocated owned vectors in BFS order.
+    // This is also how a memory-mapped tree is detached before mutation.
+    void compactLocked() {
+        std::vector<std::uint32_t> order = bfsOrder();
+        std::vector<std::uint32_t> remap(view_.nodeCount);
+        for (std::uint32_t i = 0; i < static_cast<std::uint32_t>(order.size()); ++i) {
+            remap[order[i]] = i;
+        }
+
+        std::vector<char> pool;
+        std::vector<FlatNode> nodes;
+        std::vector<FlatEdge> edges;
+        pool.reserve(view_.poolBytes);
+        nodes.reserve(view_.nodeCount);
+        edges.reserve(view_.nodeCount == 0 ? 0 : view_.nodeCount - 1);
+
+        for (std::uint32_t oldIndex : order) {
+            const FlatNode& old = view_.nodes[oldIndex];
+            FlatNode node;
+            node.termOffset = pool.size();
+            node.termLen = old.termLen;
+            node.firstChild = static_cast<std::uint32_t>(edges.size());
+            node.childCount = old.childCount;
+            node.childCapacity = old.childCount;
+            pool.insert(pool.end(), termData(oldIndex), termData(oldIndex) + old.termLen);
+            for (std::uint32_t c = 0; c < old.childCount; ++c) {
+                FlatEdge edge = view_.edges[old.firstChild + c];
+                edge.child = remap[edge.child];
+                edges.push_back(edge);
+            }
+            nodes.push_back(node);
+        }
+
+        pool_.swap(pool);
+        nodes_.swap(nodes);
+        edges_.swap(edges);
+        mapping_.reset();
+        refreshView();
+        rebuildExact();
+    }
+
+    // Build from (term, [(distance, child)]) records and normalise the layout.
+    static BKTree fromRecords(std::vector<std::string>& terms,
+                              std::vector<std::vector<std::pair<std::uint32_t, std::uint32_t>>>& children,
+                              const char* context) {
+        BKTree tree;
+        std::size_t poolBytes = 0;
+        for (const auto& term : terms) poolBytes += term.size();
+        tree.pool_.reserve(poolBytes);
+        tree.nodes_.reserve(terms.size());
+        for (const auto& term : terms) {
+            tree.appendNode(term.data(), term.size());
+        }
+        for (std::size_t i = 0; i < children.size(); ++i) {
+            auto& list = children[i];
+            std::sort(list.begin(), list.end());
+            FlatNode& node = tree.nodes_[i];
+            node.firstChild = static_cast<std::uint32_t>(tree.edges_.size());
+            node.childCount = static_cast<std::uint32_t>(list.size());
+            node.childCapacity = node.childCount;
+            for (const auto& child : list) {
+                if (child.second >= terms.size()) {
+                    throw std::out_of_range(std::string(context) + ": child index out of range");
+                }
+                FlatEdge edge;
+                edge.distance = static_cast<std::uint8_t>(std::min<std::uint32_t>(child.first, kWideEdge));
+                edge.child = child.second;
+                tree.edges_.push_back(edge);
+            }
+        }
+        tree.refreshView();
+        tree.compactLocked();
+        return tree;
+    }
+
+    // Write the tree as a BKTREE2 image, in BFS order with no spare capacity.
+    void writeFlatImage(std::ostream& out) const {
+        std::vector<std::uint32_t> order = bfsOrder();
+        std::vector<std::uint32_t> remap(view_.nodeCount);
+        for (std::uint32_t i = 0; i < static_cast<std::uint32_t>(order.size()); ++i) {
+            remap[order[i]] = i;
+        }
+
+        std::uint64_t poolBytes = 0;
+        for (std::uint32_t index : order) poolBytes += view_.nodes[index].termLen;
+
+        FlatFileHeader header;
+        std::memset(&header, 0, sizeof(header));
+        std::memcpy(header.magic, kMagicV2, sizeof(kMagicV2));
+        header.byteOrder = kByteOrderMark;
+        header.headerBytes = sizeof(FlatFileHeader);
+        header.nodeCount = order.size();
+        header.edgeCount = order.empty() ? 0 : order.size() - 1;
+        header.poolBytes = poolBytes;
+        header.nodesOffset = sizeof(FlatFileHeader);
+        header.edgesOffset = header.nodesOffset + header.nodeCount * sizeof(FlatNode);
+        header.poolOffset = header.edgesOffset + header.edgeCount * sizeof(FlatEdge);
+        const std::uint64_t poolEnd = header.poolOffset + header.poolBytes;
+        const std::uint64_t exactAlign = alignof(std::uint32_t);
+        header.exactOffset = (poolEnd + exactAlign - 1) / exactAlign * exactAlign;
+        header.exactSlots = exactSlotsFor(order.size());
+        out.write(reinterpret_cast<const char*>(&header), sizeof(header));
+
+        std::uint64_t termOffset = 0;
+        std::uint32_t firstChild = 0;
+        for (std::uint32_t index : order) {
+            const FlatNode& old = view_.nodes[index];
+            FlatNode node;
+            node.termOffset = termOffset;
+            node.termLen = old.termLen;
+            node.firstChild = firstChild;
+            node.childCount = old.childCount;
+            node.childCapacity = old.childCount;
+            out.write(reinterpret_cast<const char*>(&node), sizeof(node));
+            termOffset += old.termLen;
+            firstChild += old.childCount;
+        }
+        for (std::uint32_t index : order) {
+            const FlatNode& node = view_.nodes[index];
+            for (std::uint32_t c = 0; c < node.childCount; ++c) {
+                FlatEdge edge = view_.edges[node.firstChild + c];
+                edge.child = remap[edge.child];
+                out.write(reinterpret_cast<const char*>(&edge), sizeof(edge));
+            }
+        }
+        for (std::uint32_t index : order) {
+            out.write(termData(index), view_.nodes[index].termLen);
+        }
+
+        // The exact-match index over the new (BFS) node numbering.
+        std::vector<std::uint32_t> slots(static_cast<std::size_t>(header.exactSlots), 0);
+        for (std::uint32_t i = 0; i < static_cast<std::uint32_t>(order.size()); ++i) {
+            exactPlace(slots, i, termData(order[i]), view_.nodes[order[i]].termLen);
+        }
+        const char padding[alignof(std::uint32_t)] = {0};
+        out.write(padding, static_cast<std::streamsize>(header.exactOffset - poolEnd));
+        out.write(reinterpret_cast<const char*>(slots.data()),
+                  static_cast<std::streamsize>(slots.size() * sizeof(std::uint32_t)));
+    }
+
+    // Advance a forward-only stream from `position` to `offset`. Sections are
+    // written in file order, so a loader never needs to seek backwards.
+    static void skipTo(std::istream& in, std::uint64_t& position, std::uint64_t offset, const char* context) {
+        if (offset < position) {
+            throw std::runtime_error(std::string(context) + ": tree sections are out of order");
+        }
+        if (offset > position) {
+            in.ignore(static_cast<std::streamsize>(offset - position));
+            if (!in || static_cast<std::uint64_t>(in.gcount()) != offset - position) {
+                throw std::runtime_error(std::string(context) + ": file is truncated");
+            }
+        }
+        position = offset;
+    }
+
+    // Read `bytes` into `out`, growing it a chunk at a time so a truncated
+    // stream fails before the full section size has been allocated.
+    template <typename T>
+    static void readSection(std::istream& in, std::vector<T>& out, std::uint64_t bytes,
+                            std::uint64_t& position, const char* context) {
+        constexpr std::uint64_t kChunkBytes = std::uint64_t(64) << 20;
+        const std::uint64_t count = bytes / sizeof(T);
+        out.clear();
+        out.reserve(static_cast<std::size_t>(std::min(count, kChunkBytes / sizeof(T))));
+        std::uint64_t done = 0;
+        while (done < count) {
+            const std::uint64_t step = std::min(count - done, kChunkBytes / sizeof(T));
+            out.resize(static_cast<std::size_t>(done + step));
+            in.read(reinterpret_cast<char*>(out.data() + done), static_cast<std::streamsize>(step * sizeof(T)));
+            if (!in) {
+                throw std::runtime_error(std::string(context) + ": failed to read tree sections");
+            }
+            done += step;
+        }
+        position += bytes;
+    }
+
+    // Read a BKTREE2 image whose magic has already been consumed. The stream
+    // is only read forwards, so this works on pipes and Python readers too.
+    static BKTree readFlatImage(std::istream& in, std::uint64_t fileBytes, const char* context) {
+        FlatFileHeader header;
+        std::memcpy(header.magic, kMagicV2, sizeof(kMagicV2));
+        in.read(reinterpret_cast<char*>(&header) + sizeof(header.magic),
+                sizeof(header) - sizeof(header.magic));
+        if (!in) {
+            throw std::runtime_error(std::string(context) + ": failed to read file header");
+        }
+        validateFlatHeader(header, fileBytes, context);
+
+        BKTree tree;
+        std::uint64_t position = sizeof(header);
+        skipTo(in, position, header.nodesOffset, context);
+        readSection(in, tree.nodes_, header.nodeCount * sizeof(FlatNode), position, context);
+        skipTo(in, position, header.edgesOffset, context);
+        readSection(in, tree.edges_, header.edgeCount * sizeof(FlatEdge), position, context);
+        skipTo(in, position, header.poolOffset, context);
+        readSection(in, tree.pool_, header.poolBytes, position, context);
+        if (header.exactSlots != 0) {
+            skipTo(in, position, header.exactOffset, context);
+            readSection(in, tree.exact_, header.exactSlots * sizeof(std::uint32_t), position, context);
+            tree.refreshView();
+            tree.validateView(context);
+        } else {
+            tree.refreshView();
+            tree.validateView(context);
+            tree.rebuildExact();  // image written before the exact-match index
+        }
+        return tree;
+    }
+
+    // Read a BKTREE1 or BKTREE2 image from the start of `in`.
+    static BKTree readImage(std::istream& in, std::uint64_t fileBytes, const char* context) {
+        auto fail = [context](const char* what) {
+            throw std::runtime_error(std::string(context) + ": " + what);
+        };
+        char magic[8];
+        in.read(magic, sizeof(magic));
+        if (in && std::memcmp(magic, kMagicV2, sizeof(magic)) == 0) {
+            return readFlatImage(in, fileBytes, context);
+        }
+        if (!in || std::memcmp(magic, kMagicV1, sizeof(magic)) != 0) {
+            fail("invalid file header");
+        }
+
+        std::uint32_t count = 0;
+        in.read(reinterpret_cast<char*>(&count), sizeof(count));
+        if (!in) {
+            fail("failed to read node count");
+        }
+
+        std::vector<std::string> terms;
+        std::vector<std::vector<std::pair<std::uint32_t, std::uint32_t>>> children;
+        // Every node takes at least 8 bytes, which bounds what a corrupt
+        // count can make us allocate up front.
+        const std::uint64_t reserveCount = std::min<std::uint64_t>(count, fileBytes / 8);
+        terms.reserve(static_cast<std::size_t>(std::min<std::uint64_t>(reserveCount, 1u << 20)));
+        children.reserve(terms.capacity());
+
+        for (std::uint32_t i = 0; i < count; ++i) {
+            std::uint32_t termLen = 0;
+            in.read(reinterpret_cast<char*>(&termLen), sizeof(termLen));
+            if (!in) {
+                fail("failed to read term length");
+            }
+
+            std::string term(termLen, '\0');
+            if (termLen > 0) {
+                in.read(&term[0], termLen);
+            }
+            if (!in) {
+                fail("failed to read term data");
+            }
+            terms.push_back(std::move(term));
+
+            std::uint32_t childCount = 0;
+            in.read(reinterpret_cast<char*>(&childCount), sizeof(childCount));
+            if (!in) {
+                fail("failed to read child count");
+            }
+
+            std::vector<std::pair<std::uint32_t, std::uint32_t>> edges;
+            edges.reserve(std::min<std::uint32_t>(childCount, count));
+            for (std::uint32_t c = 0; c < childCount; ++c) {
+                std::uint32_t distance = 0;
+                std::uint32_t childIndex = 0;
+                in.read(reinterpret_cast<char*>(&distance), sizeof(distance));
+                in.read(reinterpret_cast<char*>(&childIndex), sizeof(childIndex));
+                if (!in) {
+                    fail("failed to read child entry");
+                }
+                if (childIndex >= count) {
+                    fail("child index out of range");
+                }
+                edges.push_back({distance, childIndex});
+            }
+            children.push_back(std::move(edges));
+        }
+
+        return fromRecords(terms, children, context);
+    }
+
+public:
+    BKTree() {}
+
+    BKTree(BKTree&& other) noexcept {
+        std::unique_lock<std::shared_mutex> lock(other.mutex_);
+        pool_ = std::move(other.pool_);
+        nodes_ = std::move(other.nodes_);
+        edges_ = std::move(other.edges_);
+        exact_ = std::move(other.exact_);
+        mapping_ = std::move(other.mapping_);
+        view_ = other.view_;
+        other.view_ = TreeView();
+    }
+
+    BKTree& operator=(BKTree&& other) noexcept {
+        if (this != &other) {
+            std::unique_lock<std::shared_mutex> lockThis(mutex_, std::defer_lock);
+            std::unique_lock<std::shared_mutex> lockOther(other.mutex_, std::defer_lock);
+            std::lock(lockThis, lockOther);
+            pool_ = std::move(other.pool_);
+            nodes_ = std::move(other.nodes_);
+            edges_ = std::move(other.edges_);
+            exact_ = std::move(other.exact_);
+            mapping_ = std::move(other.mapping_);
+            view_ = other.view_;
+            other.view_ = TreeView();
+        }
+        return *this;
     }
     
-    void searchHelper(const std::shared_ptr<BKNode>& node, const std::string& query, 
-                     int maxDist, std::vector<std::pair<std::string, int>>& results) const {
-        if (!node) return;
-        
-        int dist = levenshtein(node->term, query);
-        if (dist <= maxDist) {
-            results.push_back({node->term, dist});
+    void insert(const std::string& term) {
+        LevenshteinPattern pattern(term);
+        std::unique_lock<std::shared_mutex> lock(mutex_);
+        if (mapping_) {
+            compactLocked();  // copy a memory-mapped tree before mutating it
+        }
+        insertLocked(term, pattern);
+    }
+
+    // Insert a batch under one lock acquisition; returns how many terms were
+    // new (repeats are rejected by the exact-match index).
+    std::size_t insert_many(const std::vector<std::string>& terms) {
+        std::unique_lock<std::shared_mutex> lock(mutex_);
+        if (mapping_) {
+            compactLocked();
+        }
+        const std::size_t before = view_.nodeCount;
+        for (const auto& term : terms) {
+            insertLocked(term, LevenshteinPattern(term));
+        }
+        return view_.nodeCount - before;
+    }
+
+    // Bulk constructor. The tree is identical to inserting `terms` one by one
+    // in order, then compacting, but independent subtrees are built on
+    // `threads` worker threads (<= 0 means every hardware thread).
+    static BKTree build(const std::vector<std::string>& terms, int threads) {
+        const std::size_t workers = workerCount(threads, terms.size());
+        BKTree tree;
+        if (workers == 1) {
+            for (const auto& term : terms) {
+                tree.insertLocked(term, LevenshteinPattern(term));
+            }
+            tree.compactLocked();
+            return tree;
+        }
+
+        std::vector<std::unique_ptr<BuildJob>> jobs;
+        jobs.emplace_back(new BuildJob());
+        jobs[0]->items.resize(terms.size());
+        for (std::uint32_t i = 0; i < static_cast<std::uint32_t>(terms.size()); ++i) {
+            jobs[0]->items[i] = i;
+        }
+        planBuild(terms, jobs, workers);
+
+        std::vector<std::size_t> leaves;
+        for (std::size_t j = 0; j < jobs.size(); ++j) {
+            if (!jobs[j]->split) leaves.push_back(j);
+        }
+        // Largest first so a big subtree does not start last.
+        std::sort(leaves.begin(), leaves.end(), [&jobs](std::size_t a, std::size_t b) {
+            return jobs[a]->items.size() > jobs[b]->items.size();
+        });
+        parallelFor(leaves.size(), workers, [&](std::size_t i) {
+            BuildJob& job = *jobs[leaves[i]];
+            job.tree.reset(new BKTree());
+            for (std::uint32_t item : job.items) {
+                job.tree->insertLocked(terms[item], LevenshteinPattern(terms[item]));
+            }
+        });
+
+        std::size_t poolBytes = 0;
+        for (const auto& term : terms) poolBytes += term.size();
+        tree.pool_.reserve(poolBytes);
+        tree.nodes_.reserve(terms.size());
+        tree.graftJob(terms, jobs, 0);
+        tree.compactLocked();
+        return tree;
+    }
+    
+    std::vector<std::pair<std::string, int>> search(const std::string& query, int maxDist) const {
+        SearchStats stats;
+        return searchStats(query, maxDist, stats);
+    }
+
+    // search(), also filling `stats` with the work it took.
+    std::vector<std::pair<std::string, int>> searchStats(const std::string& query, int maxDist,
+                                                         SearchStats& stats) const {
+        const auto start = std::chrono::steady_clock::now();
+        std::vector<std::pair<std::string, int>> results;
+        if (maxDist == 0) {
+            // Only an exact hit can match: answer from the hash index without a walk.
+            std::shared_lock<std::shared_mutex> lock(mutex_);
+            if (view_.exact != nullptr || view_.nodeCount == 0) {
+                exactLocked(query, results);
+                stats.elapsedNs = elapsedSince(start);
+                counters_.add(stats);
+                return results;
+            }
+        }
+        LevenshteinPattern pattern(query);
+        {
+            std::shared_lock<std::shared_mutex> lock(mutex_);
+            // Seed the results with the exact hit, so the bounded walk skips its distance.
+            std::uint32_t hit = kNoNode;
+            if (maxDist > 0 && exactFind(query.data(), query.size(), hit)) {
+                results.emplace_back(query, 0);
+            }
+            searchLocked(pattern, maxDist, results, stats, hit);
         }
         
-        // Prune search by distance band
-        int minDist = dist - maxDist;
-        int maxDistEdge = dist + maxDist;
+        // Sort by distance, then alphabetically
+        std::sort(results.begin(), results.end(), 
+            [](const std::pair<std::string, int>& a, const std::pair<std::string, int>& b) {
+                if (a.second != b.second) return a.second < b.second;
+                return a.first < b.first;
+            });
         
-        for (const auto& child : node->children) {
-            if (child.first >= minDist && child.first <= maxDistEdge) {
-                searchHelper(child.second, query, maxDist, results);
+        stats.elapsedNs = elapsedSince(start);
+        counters_.add(stats);
+        return results;
+    }
+
+    // Number of nodes whose distance search(query, maxDist) has to compute.
+    // Not counted in search_stats().
+    std::size_t count_visited(const std::string& query, int maxDist) const {
+        std::vector<std::pair<std::string, int>> results;
+        SearchStats stats;
+        LevenshteinPattern pattern(query);
+        std::shared_lock<std::shared_mutex> lock(mutex_);
+        searchLocked(pattern, maxDist, results, stats);
+        return stats.visited;
+    }
+
+    // The k closest terms within maxDist (maxDist < 0 means unbounded),
+    // sorted like search(). Equivalent to search(query, maxDist)[:k] without
+    // materialising every match.
+    std::vector<std::pair<std::string, int>> search_topk(const std::string& query, int k, int maxDist) const {
+        SearchStats stats;
+        return searchTopkStats(query, k, maxDist, stats);
+    }
+
+    std::vector<std::pair<std::string, int>> searchTopkStats(const std::string& query, int k, int maxDist,
+                                                             SearchStats& stats) const {
+        const auto start = std::chrono::steady_clock::now();
+        LevenshteinPattern pattern(query);
+        std::vector<std::pair<std::string, int>> results;
+        {
+            std::shared_lock<std::shared_mutex> lock(mutex_);
+            // An exact hit is the single best match, so top-1 (or a
+            // distance-0 top-k) is settled by the hash index alone.
+            if (k > 0 && (k == 1 || maxDist == 0) && exactLocked(query, results)) {
+                // settled without a walk
+            } else if (maxDist == 0 && view_.exact != nullptr) {
+                // no exact hit, so nothing within distance 0
+            } else {
+                // Seed the candidates with the exact hit, if any.
+                std::uint32_t hit = kNoNode;
+                if (k > 0) exactFind(query.data(), query.size(), hit);
+                results = topkLocked(pattern, k > 0 ? static_cast<std::size_t>(k) : 0,
+                                     maxDist < 0 ? LevenshteinPattern::kUnbounded : maxDist, stats, hit);
+            }
+        }
+        stats.elapsedNs = elapsedSince(start);
+        counters_.add(stats);
+        return results;
+    }
+
+    // The nearest matches only: an exact hit if there is one, otherwise
+    // every term at the smallest distance d <= maxDist (maxDist < 0 means
+    // unbounded) that has any. Radii are tried in turn, 1, 2, ..., so a
+    // close match costs a tight, heavily pruned walk rather than a walk at
+    // the full radius.
+    std::vector<std::pair<std::string, int>> search_best(const std::string& query, int maxDist) const {
+        SearchStats stats;
+        return searchBestStats(query, maxDist, stats);
+    }
+
+    std::vector<std::pair<std::string, int>> searchBestStats(const std::string& query, int maxDist,
+                                                             SearchStats& stats) const {
+        const auto start = std::chrono::steady_clock::now();
+        std::vector<std::pair<std::string, int>> results;
+        LevenshteinPattern pattern(query);
+        {
+            std::shared_lock<std::shared_mutex> lock(mutex_);
+            if (view_.nodeCount != 0 && !exactLocked(query, results)) {
+                // Without an index, radius 0 needs a walk like any other.
+                int radius = view_.exact != nullptr ? 1 : 0;
+                const int limit = maxDist < 0 ? LevenshteinPattern::kUnbounded : maxDist;
+                for (; radius <= limit && results.empty(); ++radius) {
+                    searchLocked(pattern, radius, results, stats);
+                }
             }
         }
+        std::sort(results.begin(), results.end(),
+            [](const std::pair<std::string, int>& a, const std::pair<std::string, int>& b) {
+                if (a.second != b.second) return a.second < b.second;
+                return a.first < b.first;
+            });
+        stats.elapsedNs = elapsedSince(start);
+        counters_.add(stats);
+        return results;
+    }
+
+    // Whether `term` is in the tree, from the exact-match index.
+    bool contains(const std::string& term) const {
+        std::shared_lock<std::shared_mutex> lock(mutex_);
+        std::vector<std::pair<std::string, int>> results;
+        if (view_.exact != nullptr || view_.nodeCount == 0) {
+            return exactLocked(term, results);
+        }
+        SearchStats stats;
+        searchLocked(LevenshteinPattern(term), 0, results, stats);
+        return !results.empty();
     }
-    
-    std::vector<std::shared_ptr<BKNode>> collectNodes(std::unordered_map<BKNode*, std::uint32_t>& index) const {
-        std::vector<std::shared_ptr<BKNode>> nodes;
-        if (!root) {
-            return nodes;
+
+    // search() (k < 0) or search_topk() (k >= 0), returning the matches and
+    // the work the query took: nodes visited, distance kernel calls, pruned
+    // subtrees, deepest node reached and elapsed time.
+    std::pair<std::vector<std::pair<std::string, int>>, std::map<std::string, std::uint64_t>>
+    search_with_stats(const std::string& query, int maxDist, int k, bool best) const {
+        SearchStats stats;
+        auto results = best ? searchBestStats(query, maxDist, stats)
+                            : k < 0 ? searchStats(query, maxDist, stats) : searchTopkStats(query, k, maxDist, stats);
+        if (best && k >= 0 && results.size() > static_cast<std::size_t>(k)) {
+            results.resize(static_cast<std::size_t>(k));
         }
+        return std::make_pair(std::move(results), stats.toMap());
+    }
 
-        nodes.push_back(root);
-        index[root.get()] = 0;
+    // Totals over every search this tree object has run since it was
+    // created or last reset.
+    std::map<std::string, std::uint64_t> search_stats() const {
+        return counters_.snapshot();
+    }
 
-        for (std::size_t i = 0; i < nodes.size(); ++i) {
-            const auto& node = nodes[i];
-            for (const auto& child : node->children) {
-                const auto& childPtr = child.second;
-                if (!childPtr) {
-                    continue;
-                }
-                auto found = index.find(childPtr.get());
-                if (found == index.end()) {
-                    std::uint32_t childIndex = static_cast<std::uint32_t>(nodes.size());
-                    index[childPtr.get()] = childIndex;
-                    nodes.push_back(childPtr);
+    void reset_search_stats() {
+        counters_.reset();
+    }
+
+    // Walk the tree breadth-first (no recursion, so depth is unbounded) and
+    // collect its TreeStats.
+    TreeStats stats() const {
+        TreeStats result;
+        std::shared_lock<std::shared_mutex> lock(mutex_);
+        if (view_.nodeCount == 0) {
+            return result;
+        }
+        std::vector<std::pair<std::uint32_t, std::uint32_t>> level{{0, 0}};  // (node, depth)
+        std::vector<std::pair<std::uint32_t, std::uint32_t>> next;
+        while (!level.empty()) {
+            for (const auto& entry : level) {
+                const FlatNode& node = view_.nodes[entry.first];
+                ++result.nodes;
+                result.depthSum += entry.second;
+                result.termBytes += node.termLen;
+                TreeStats::bump(result.depth, entry.second);
+                TreeStats::bump(result.fanout, node.childCount);
+                TreeStats::bump(result.termLength, node.termLen);
+                if (node.childCount == 0) ++result.leaves;
+                for (std::uint32_t c = 0; c < node.childCount; ++c) {
+                    const FlatEdge& edge = view_.edges[node.firstChild + c];
+                    ++result.edges;
+                    TreeStats::bump(result.edgeDistance, static_cast<std::size_t>(edgeDistance(entry.first, edge)));
+                    next.emplace_back(edge.child, entry.second + 1);
                 }
             }
+            level.swap(next);
+            next.clear();
+        }
+        return result;
+    }
+
+    // Run many searches on a pool of worker threads. maxDists and ks hold
+    // either one value per query or a single value applied to every query;
+    // a negative k returns every match. Results come back in query order.
+    // threads <= 0 uses every hardware thread.
+    std::vector<std::vector<std::pair<std::string, int>>> search_many(
+            const std::vector<std::string>& queries, const std::vector<int>& maxDists, int threads,
+            const std::vector<int>& ks) const {
+        if (maxDists.size() != queries.size() && maxDists.size() != 1) {
+            throw std::invalid_argument("BKTree.search_many: maxdists must have one entry or one per query");
+        }
+        if (!ks.empty() && ks.size() != queries.size() && ks.size() != 1) {
+            throw std::invalid_argument("BKTree.search_many: k must be empty, one entry or one per query");
+        }
+        std::vector<std::vector<std::pair<std::string, int>>> results(queries.size());
+        if (queries.empty()) {
+            return results;
         }
 
-        return nodes;
+        parallelFor(queries.size(), workerCount(threads, queries.size()), [&](std::size_t i) {
+            int maxDist = maxDists.size() == 1 ? maxDists[0] : maxDists[i];
+            int k = ks.empty() ? -1 : (ks.size() == 1 ? ks[0] : ks[i]);
+            results[i] = k < 0 ? search(queries[i], maxDist) : search_topk(queries[i], k, maxDist);
+        });
+        return results;
     }
 
-public:
-    BKTree() : root(nullptr) {}
-    
-    void insert(const std::string& term) {
-        insertHelper(root, term);
+    // Drop spare edge capacity left by incremental inserts and lay the tree
+    // out in BFS order for sequential traversal.
+    void compact() {
+        std::unique_lock<std::shared_mutex> lock(mutex_);
+        if (mapping_) {
+            return;  // mapped images are written compact
+        }
+        compactLocked();
+        pool_.shrink_to_fit();
+        nodes_.shrink_to_fit();
+        edges_.shrink_to_fit();
+        refreshView();
     }
-    
-    std::vector<std::pair<std::string, int>> search(const std::string& query, int maxDist) const {
-        std::vector<std::pair<std::string, int>> results;
-        searchHelper(root, query, maxDist, results);
-        
-        // Sort by distance, then alphabetically
-        std::sort(results.begin(), results.end(), 
-            [](const std::pair<std::string, int>& a, const std::pair<std::string, int>& b) {
-                if (a.second != b.second) return a.second < b.second;
-                return a.first < b.first;
-            });
-        
-        return results;
+
+    std::size_t size() const {
+        std::shared_lock<std::shared_mutex> lock(mutex_);
+        return view_.nodeCount;
+    }
+
+    bool is_mmapped() const {
+        std::shared_lock<std::shared_mutex> lock(mutex_);
+        return static_cast<bool>(mapping_);
     }
 
     py::list to_serializable() const {
         py::list serialized;
-        std::unordered_map<BKNode*, std::uint32_t> index;
-        auto nodes = collectNodes(index);
+        std::shared_lock<std::shared_mutex> lock(mutex_);
+        std::vector<std::uint32_t> order = bfsOrder();
+        std::vector<std::uint32_t> remap(view_.nodeCount);
+        for (std::uint32_t i = 0; i < static_cast<std::uint32_t>(order.size()); ++i) {
+            remap[order[i]] = i;
+        }
 
-        for (std::uint32_t i = 0; i < static_cast<std::uint32_t>(nodes.size()); ++i) {
-            const auto& node = nodes[i];
+        for (std::uint32_t index : order) {
+            const FlatNode& node = view_.nodes[index];
             py::list childList;
-            for (const auto& child : node->children) {
-                auto it = index.find(child.second.get());
-                if (it == index.end()) {
-                    throw std::runtime_error("BKTree.to_serializable: missing child index");
-                }
-                childList.append(py::make_tuple(child.first, it->second));
+            for (std::uint32_t c = 0; c < node.childCount; ++c) {
+                const FlatEdge& edge = view_.edges[node.firstChild + c];
+                childList.append(py::make_tuple(edgeDistance(index, edge), remap[edge.child]));
             }
-            serialized.append(py::make_tuple(node->term, childList));
+            serialized.append(py::make_tuple(termString(index), childList));
         }
 
         return serialized;
@@ -167,39 +1816,33 @@ public:
     static BKTree from_serializable(const py::object& data) {
         py::sequence seq = py::cast<py::sequence>(data);
         py::ssize_t length = seq.size();
-        BKTree tree;
         if (length <= 0) {
-            return tree;
+            return BKTree();
         }
 
-        std::vector<std::shared_ptr<BKNode>> nodes;
-        nodes.reserve(static_cast<std::size_t>(length));
-
-        for (py::ssize_t i = 0; i < length; ++i) {
-            py::tuple entry = py::cast<py::tuple>(seq[i]);
-            std::string term = py::cast<std::string>(entry[0]);
-            nodes.push_back(std::make_shared<BKNode>(term));
-        }
+        std::vector<std::string> terms;
+        std::vector<std::vector<std::pair<std::uint32_t, std::uint32_t>>> children;
+        terms.reserve(static_cast<std::size_t>(length));
+        children.resize(static_cast<std::size_t>(length));
 
         for (py::ssize_t i = 0; i < length; ++i) {
             py::tuple entry = py::cast<py::tuple>(seq[i]);
+            terms.push_back(py::cast<std::string>(entry[0]));
             py::list childList = py::cast<py::list>(entry[1]);
-            auto& nodeChildren = nodes[static_cast<std::size_t>(i)]->children;
-            nodeChildren.clear();
+            auto& nodeChildren = children[static_cast<std::size_t>(i)];
             nodeChildren.reserve(childList.size());
             for (const auto& childObj : childList) {
                 py::tuple childTuple = py::cast<py::tuple>(childObj);
-                int distance = py::cast<int>(childTuple[0]);
+                std::uint32_t distance = py::cast<std::uint32_t>(childTuple[0]);
                 std::size_t childIndex = py::cast<std::size_t>(childTuple[1]);
-                if (childIndex >= nodes.size()) {
+                if (childIndex >= static_cast<std::size_t>(length)) {
                     throw std::out_of_range("BKTree.from_serializable: child index out of range");
                 }
-                nodeChildren.push_back({distance, nodes[childIndex]});
+                nodeChildren.push_back({distance, static_cast<std::uint32_t>(childIndex)});
             }
         }
 
-        tree.root = nodes.front();
-        return tree;
+        return fromRecords(terms, children, "BKTree.from_serializable");
     }
 
     void save(const std::string& path) const {
@@ -208,120 +1851,862 @@ public:
             throw std::runtime_error("BKTree.save: unable to open file for writing");
         }
 
-        const char magic[8] = {'B', 'K', 'T', 'R', 'E', 'E', '1', 0};
-        out.write(magic, sizeof(magic));
+        out.write(kMagicV1, sizeof(kMagicV1));
 
-        std::unordered_map<BKNode*, std::uint32_t> index;
-        auto nodes = collectNodes(index);
-        std::uint32_t count = static_cast<std::uint32_t>(nodes.size());
+        std::shared_lock<std::shared_mutex> lock(mutex_);
+        std::vector<std::uint32_t> order = bfsOrder();
+        std::vector<std::uint32_t> remap(view_.nodeCount);
+        for (std::uint32_t i = 0; i < static_cast<std::uint32_t>(order.size()); ++i) {
+            remap[order[i]] = i;
+        }
+        std::uint32_t count = static_cast<std::uint32_t>(order.size());
         out.write(reinterpret_cast<const char*>(&count), sizeof(count));
 
-        for (std::uint32_t i = 0; i < count; ++i) {
-            const auto& node = nodes[i];
-            std::uint32_t termLen = static_cast<std::uint32_t>(node->term.size());
+        for (std::uint32_t index : order) {
+            const FlatNode& node = view_.nodes[index];
+            std::uint32_t termLen = node.termLen;
             out.write(reinterpret_cast<const char*>(&termLen), sizeof(termLen));
-            out.write(node->term.data(), termLen);
+            out.write(termData(index), termLen);
 
-            std::uint32_t childCount = static_cast<std::uint32_t>(node->children.size());
+            std::uint32_t childCount = node.childCount;
             out.write(reinterpret_cast<const char*>(&childCount), sizeof(childCount));
-            for (const auto& child : node->children) {
-                std::uint32_t distance = static_cast<std::uint32_t>(child.first);
-                auto it = index.find(child.second.get());
-                if (it == index.end()) {
-                    throw std::runtime_error("BKTree.save: encountered child without index");
-                }
-                std::uint32_t childIndex = it->second;
+            for (std::uint32_t c = 0; c < childCount; ++c) {
+                const FlatEdge& edge = view_.edges[node.firstChild + c];
+                std::uint32_t distance = static_cast<std::uint32_t>(edgeDistance(index, edge));
+                std::uint32_t childIndex = remap[edge.child];
                 out.write(reinterpret_cast<const char*>(&distance), sizeof(distance));
                 out.write(reinterpret_cast<const char*>(&childIndex), sizeof(childIndex));
             }
         }
     }
 
+    // Write a BKTREE2 image that load_mmap can map without parsing.
+    void save_mmap(const std::string& path) const {
+        std::ofstream out(path, std::ios::binary);
+        if (!out) {
+            throw std::runtime_error("BKTree.save_mmap: unable to open file for writing");
+        }
+        std::shared_lock<std::shared_mutex> lock(mutex_);
+        writeFlatImage(out);
+        if (!out) {
+            throw std::runtime_error("BKTree.save_mmap: write failed");
+        }
+    }
+
+    // Map a BKTREE2 file read-only; the mapping lives as long as the tree.
+    // Loading reads the node, edge and exact-match sections once to validate
+    // them; the term pool is faulted in as search touches it.
+    static BKTree load_mmap(const std::string& path) {
+        auto mapping = std::make_shared<MappedFile>(path);
+        if (mapping->size() < sizeof(FlatFileHeader)) {
+            throw std::runtime_error("BKTree.load_mmap: invalid file header");
+        }
+        FlatFileHeader header;
+        std::memcpy(&header, mapping->data(), sizeof(header));
+        validateFlatHeader(header, mapping->size(), "BKTree.load_mmap");
+
+        BKTree tree;
+        const char* base = mapping->data();
+        tree.view_.nodes = reinterpret_cast<const FlatNode*>(base + header.nodesOffset);
+        tree.view_.edges = reinterpret_cast<const FlatEdge*>(base + header.edgesOffset);
+        tree.view_.pool = base + header.poolOffset;
+        tree.view_.nodeCount = static_cast<std::size_t>(header.nodeCount);
+        tree.view_.edgeCount = static_cast<std::size_t>(header.edgeCount);
+        tree.view_.poolBytes = static_cast<std::size_t>(header.poolBytes);
+        if (header.exactSlots != 0) {
+            tree.view_.exact = reinterpret_cast<const std::uint32_t*>(base + header.exactOffset);
+            tree.view_.exactMask = static_cast<std::size_t>(header.exactSlots - 1);
+            tree.validateView("BKTree.load_mmap");
+        } else {
+            tree.validateView("BKTree.load_mmap");
+            tree.rebuildExact();  // older image: index it in owned memory
+        }
+        tree.mapping_ = std::move(mapping);
+        return tree;
+    }
+
     static BKTree load(const std::string& path) {
-        std::ifstream in(path, std::ios::binary);
+        std::ifstream in(path, std::ios::binary | std::ios::ate);
         if (!in) {
             throw std::runtime_error("BKTree.load: unable to open file for reading");
         }
+        const std::uint64_t fileBytes = static_cast<std::uint64_t>(in.tellg());
+        in.seekg(0);
+        return readImage(in, fileBytes, "BKTree.load");
+    }
 
-        char magic[8];
-        in.read(magic, sizeof(magic));
-        const char expected[8] = {'B', 'K', 'T', 'R', 'E', 'E', '1', 0};
-        if (!in || std::memcmp(magic, expected, sizeof(magic)) != 0) {
-            throw std::runtime_error("BKTree.load: invalid file header");
+    // Build a tree from a forward-only stream of unknown length, reading
+    // it exactly once (see PyReadStreambuf).
+    static BKTree load_stream(std::istream& in) {
+        return readImage(in, UINT64_MAX, "BKTree.load_stream");
+    }
+};
+
+// Forest of independent BK-trees. Each term belongs to one shard, so shards
+// are built, saved and loaded independently and duplicates always meet in
+// the same shard. Terms are assigned either by a stable hash of their bytes
+// (FNV-1a), which balances the shards, or by byte length in bands of `band`
+// (the last shard takes everything longer). Levenshtein distance is at least
+// the length difference, so a length-partitioned forest only consults the
+// shards overlapping len(query) +/- maxdist. A query fans out to the
+// consulted shards and the sorted per-shard results are merged. Shards can
+// be loaded one at a time while searches run; until the last one arrives,
+// results only cover the loaded shards.
+class ShardedBKTree {
+public:
+    enum class Partition { Hash, Length };
+
+    ShardedBKTree(int shardCount, const std::string& partition, int band) {
+        if (shardCount <= 0) {
+            throw std::invalid_argument("ShardedBKTree: shard count must be positive");
+        }
+        if (partition == "hash") {
+            partition_ = Partition::Hash;
+        } else if (partition == "length") {
+            partition_ = Partition::Length;
+        } else {
+            throw std::invalid_argument("ShardedBKTree: partition must be 'hash' or 'length'");
+        }
+        if (band <= 0) {
+            throw std::invalid_argument("ShardedBKTree: band must be positive");
         }
+        band_ = static_cast<std::size_t>(band);
+        shards_.resize(static_cast<std::size_t>(shardCount));
+    }
 
-        std::uint32_t count = 0;
-        in.read(reinterpret_cast<char*>(&count), sizeof(count));
-        if (!in) {
-            throw std::runtime_error("BKTree.load: failed to read node count");
+    ShardedBKTree(ShardedBKTree&& other) noexcept
+        : shards_(std::move(other.shards_)), partition_(other.partition_), band_(other.band_) {}
+
+    static std::uint64_t hashTerm(const char* data, std::size_t length) {
+        return fnv1a64(data, length);
+    }
+
+    std::size_t shard_of(const std::string& term) const {
+        if (partition_ == Partition::Length) {
+            return std::min(term.size() / band_, shards_.size() - 1);
+        }
+        return static_cast<std::size_t>(hashTerm(term.data(), term.size()) % shards_.size());
+    }
+
+    std::string partition() const { return partition_ == Partition::Length ? "length" : "hash"; }
+
+    std::size_t band() const { return band_; }
+
+    void insert(const std::string& term) {
+        const std::size_t index = shard_of(term);
+        std::shared_ptr<BKTree> shard = snapshot()[index];
+        if (!shard) {
+            std::unique_lock<std::shared_mutex> lock(mutex_);
+            if (!shards_[index]) {
+                shards_[index] = std::make_shared<BKTree>();
+            }
+            shard = shards_[index];
         }
+        shard->insert(term);
+    }
 
-        std::vector<std::shared_ptr<BKNode>> nodes;
-        nodes.reserve(count);
-        for (std::uint32_t i = 0; i < count; ++i) {
-            nodes.push_back(std::make_shared<BKNode>(std::string()));
+    // Partition terms by shard (keeping input order within each shard) and
+    // build the shards concurrently.
+    static ShardedBKTree build(const std::vector<std::string>& terms, int shardCount, int threads,
+                               const std::string& partition, int band) {
+        ShardedBKTree forest(shardCount, partition, band);
+        std::vector<std::vector<std::string>> parts(forest.shards_.size());
+        for (const auto& term : terms) {
+            parts[forest.shard_of(term)].push_back(term);
         }
+        const std::size_t workers = workerCount(threads, terms.size());
+        parallelFor(parts.size(), std::min(workers, parts.size()), [&](std::size_t i) {
+            forest.shards_[i] = std::make_shared<BKTree>(BKTree::build(parts[i], 1));
+            std::vector<std::string>().swap(parts[i]);
+        });
+        return forest;
+    }
 
-        for (std::uint32_t i = 0; i < count; ++i) {
-            std::uint32_t termLen = 0;
-            in.read(reinterpret_cast<char*>(&termLen), sizeof(termLen));
-            if (!in) {
-                throw std::runtime_error("BKTree.load: failed to read term length");
+    std::vector<std::pair<std::string, int>> search(const std::string& query, int maxDist, int threads) const {
+        if (maxDist == 0) {
+            return homeSearch(query);  // an exact hit can only be in the term's own shard
+        }
+        return fanOut(candidates(query.size(), maxDist), threads,
+                      [&](const BKTree& shard) { return shard.search(query, maxDist); }, 0);
+    }
+
+    std::vector<std::pair<std::string, int>> search_topk(const std::string& query, int k, int maxDist,
+                                                         int threads) const {
+        if (k <= 0) {
+            return {};
+        }
+        if (maxDist == 0 || k == 1) {
+            std::vector<std::pair<std::string, int>> exact = homeSearch(query);
+            if (!exact.empty() || maxDist == 0) {
+                return exact;
             }
+        }
+        if (partition_ == Partition::Hash) {
+            return fanOut(candidates(query.size(), maxDist), threads,
+                          [&](const BKTree& shard) { return shard.search_topk(query, k, maxDist); },
+                          static_cast<std::size_t>(k));
+        }
 
-            std::string term(termLen, '\0');
-            if (termLen > 0) {
-                in.read(&term[0], termLen);
+        return lengthTopk(query, k, maxDist, nullptr);
+    }
+
+    // BKTree::search_best over the forest: the exact hit from the term's own
+    // shard, else search() at radius 1, 2, ... up to maxDist (unbounded if
+    // negative), stopping at the first radius with matches.
+    std::vector<std::pair<std::string, int>> search_best(const std::string& query, int maxDist, int threads) const {
+        std::vector<std::pair<std::string, int>> results = homeSearch(query);
+        if (!results.empty() || size() == 0) {
+            return results;
+        }
+        const int limit = maxDist < 0 ? LevenshteinPattern::kUnbounded : maxDist;
+        for (int radius = 1; radius <= limit && results.empty(); ++radius) {
+            results = search(query, radius, threads);
+        }
+        return results;
+    }
+
+    bool contains(const std::string& term) const {
+        std::shared_ptr<BKTree> shard = snapshot()[shard_of(term)];
+        return shard && shard->contains(term);
+    }
+
+    // search() (k < 0), search_topk() (k >= 0) or search_best() (best) on
+    // the calling thread, returning the matches and the work summed over the
+    // consulted shards (max_depth is the deepest within any shard).
+    std::pair<std::vector<std::pair<std::string, int>>, std::map<std::string, std::uint64_t>>
+    search_with_stats(const std::string& query, int maxDist, int k, bool best) const {
+        const auto start = std::chrono::steady_clock::now();
+        SearchStats total;
+        std::vector<std::pair<std::string, int>> results;
+        if (best) {
+            std::shared_ptr<BKTree> home = snapshot()[shard_of(query)];
+            if (home) {
+                SearchStats stats;
+                results = home->searchStats(query, 0, stats);
+                total.merge(stats);
             }
-            if (!in) {
-                throw std::runtime_error("BKTree.load: failed to read term data");
+            const int limit = maxDist < 0 ? LevenshteinPattern::kUnbounded : maxDist;
+            for (int radius = 1; radius <= limit && results.empty() && size() != 0; ++radius) {
+                for (const auto& shard : candidates(query.size(), radius)) {
+                    SearchStats stats;
+                    auto found = shard->searchStats(query, radius, stats);
+                    total.merge(stats);
+                    results.insert(results.end(), std::make_move_iterator(found.begin()),
+                                   std::make_move_iterator(found.end()));
+                }
+            }
+            std::sort(results.begin(), results.end(), resultOrder);
+            if (k >= 0 && results.size() > static_cast<std::size_t>(k)) {
+                results.resize(static_cast<std::size_t>(k));
+            }
+        } else if (maxDist == 0 && k != 0) {
+            std::shared_ptr<BKTree> home = snapshot()[shard_of(query)];
+            if (home) {
+                SearchStats stats;
+                results = home->searchStats(query, 0, stats);
+                total.merge(stats);
+            }
+        } else if (k >= 0 && partition_ == Partition::Length) {
+            results = lengthTopk(query, k, maxDist, &total);
+        } else if (k != 0) {
+            for (const auto& shard : candidates(query.size(), maxDist)) {
+                SearchStats stats;
+                auto found = k < 0 ? shard->searchStats(query, maxDist, stats)
+                                   : shard->searchTopkStats(query, k, maxDist, stats);
+                total.merge(stats);
+                results.insert(results.end(), std::make_move_iterator(found.begin()),
+                               std::make_move_iterator(found.end()));
+            }
+            std::sort(results.begin(), results.end(), resultOrder);
+            if (k > 0 && results.size() > static_cast<std::size_t>(k)) {
+                results.resize(static_cast<std::size_t>(k));
+            }
+        }
+        total.elapsedNs = elapsedSince(start);
+        return std::make_pair(std::move(results), total.toMap());
+    }
+
+    // Totals over the loaded shards. Every shard a query consults counts as
+    // one search.
+    std::map<std::string, std::uint64_t> search_stats() const {
+        std::map<std::string, std::uint64_t> totals = BKTree().search_stats();
+        for (const auto& shard : snapshot()) {
+            if (!shard) continue;
+            for (const auto& entry : shard->search_stats()) {
+                if (entry.first == "max_depth") {
+                    totals[entry.first] = std::max(totals[entry.first], entry.second);
+                } else {
+                    totals[entry.first] += entry.second;
+                }
             }
-            nodes[i]->term = std::move(term);
+        }
+        return totals;
+    }
 
-            std::uint32_t childCount = 0;
-            in.read(reinterpret_cast<char*>(&childCount), sizeof(childCount));
+    void reset_search_stats() {
+        for (const auto& shard : snapshot()) {
+            if (shard) shard->reset_search_stats();
+        }
+    }
+
+    // TreeStats merged over the loaded shards (each shard has its own root,
+    // so depths are per shard).
+    TreeStats stats() const {
+        TreeStats total;
+        for (const auto& shard : snapshot()) {
+            if (shard) total.merge(shard->stats());
+        }
+        return total;
+    }
+
+private:
+    // The distance-0 match from the shard `query` hashes (or falls) into.
+    std::vector<std::pair<std::string, int>> homeSearch(const std::string& query) const {
+        std::shared_ptr<BKTree> shard = snapshot()[shard_of(query)];
+        if (!shard) {
+            return {};
+        }
+        return shard->search(query, 0);
+    }
+
+    // Top-k over length bands: visit shards nearest in length first and
+    // shrink the radius to the k-th best distance, so far bands are never
+    // opened. Adds each shard's work to `stats` when given.
+    std::vector<std::pair<std::string, int>> lengthTopk(const std::string& query, int k, int maxDist,
+                                                        SearchStats* stats) const {
+        std::vector<std::pair<std::size_t, std::shared_ptr<BKTree>>> byGap;
+        std::vector<std::shared_ptr<BKTree>> shards = snapshot();
+        for (std::size_t i = 0; i < shards.size(); ++i) {
+            if (shards[i]) byGap.emplace_back(lengthGap(i, query.size()), shards[i]);
+        }
+        std::stable_sort(byGap.begin(), byGap.end(),
+            [](const std::pair<std::size_t, std::shared_ptr<BKTree>>& a,
+               const std::pair<std::size_t, std::shared_ptr<BKTree>>& b) { return a.first < b.first; });
+
+        std::vector<std::pair<std::string, int>> best;
+        int radius = maxDist;
+        for (const auto& entry : byGap) {
+            if (radius >= 0 && entry.first > static_cast<std::size_t>(radius)) break;
+            SearchStats shardStats;
+            auto found = entry.second->searchTopkStats(query, k, radius, shardStats);
+            if (stats) stats->merge(shardStats);
+            std::vector<std::pair<std::string, int>> merged;
+            merged.reserve(best.size() + found.size());
+            std::merge(best.begin(), best.end(), found.begin(), found.end(), std::back_inserter(merged), resultOrder);
+            if (merged.size() > static_cast<std::size_t>(k)) merged.resize(static_cast<std::size_t>(k));
+            best.swap(merged);
+            if (best.size() == static_cast<std::size_t>(k)) radius = best.back().second;
+        }
+        return best;
+    }
+
+public:
+
+    // Nodes whose distance search(query, maxDist) computes, over the shards
+    // the partition lets it consult.
+    std::size_t count_visited(const std::string& query, int maxDist) const {
+        std::size_t visited = 0;
+        for (const auto& shard : candidates(query.size(), maxDist)) {
+            visited += shard->count_visited(query, maxDist);
+        }
+        return visited;
+    }
+
+    // Parallel over queries; each query visits the shards in turn.
+    std::vector<std::vector<std::pair<std::string, int>>> search_many(
+            const std::vector<std::string>& queries, const std::vector<int>& maxDists, int threads,
+            const std::vector<int>& ks) const {
+        if (maxDists.size() != queries.size() && maxDists.size() != 1) {
+            throw std::invalid_argument("ShardedBKTree.search_many: maxdists must have one entry or one per query");
+        }
+        if (!ks.empty() && ks.size() != queries.size() && ks.size() != 1) {
+            throw std::invalid_argument("ShardedBKTree.search_many: k must be empty, one entry or one per query");
+        }
+        std::vector<std::vector<std::pair<std::string, int>>> results(queries.size());
+        if (queries.empty()) {
+            return results;
+        }
+        parallelFor(queries.size(), workerCount(threads, queries.size()), [&](std::size_t i) {
+            int maxDist = maxDists.size() == 1 ? maxDists[0] : maxDists[i];
+            int k = ks.empty() ? -1 : (ks.size() == 1 ? ks[0] : ks[i]);
+            results[i] = k < 0 ? search(queries[i], maxDist, 1) : search_topk(queries[i], k, maxDist, 1);
+        });
+        return results;
+    }
+
+    // Load one shard from a BKTREE2 (memory-mapped) or BKTREE1 file and make
+    // it visible to searches; replaces any tree already in that slot.
+    void load_shard(int index, const std::string& path) {
+        const std::size_t slot = checkIndex(index, "ShardedBKTree.load_shard");
+        char magic[8] = {0};
+        {
+            std::ifstream in(path, std::ios::binary);
             if (!in) {
-                throw std::runtime_error("BKTree.load: failed to read child count");
+                throw std::runtime_error("ShardedBKTree.load_shard: unable to open file for reading");
             }
+            in.read(magic, sizeof(magic));
+        }
+        auto shard = std::make_shared<BKTree>(std::memcmp(magic, kMagicV2, sizeof(magic)) == 0
+                                                  ? BKTree::load_mmap(path)
+                                                  : BKTree::load(path));
+        std::unique_lock<std::shared_mutex> lock(mutex_);
+        shards_[slot] = std::move(shard);
+    }
 
-            nodes[i]->children.clear();
-            nodes[i]->children.reserve(childCount);
-            for (std::uint32_t c = 0; c < childCount; ++c) {
-                std::uint32_t distance = 0;
-                std::uint32_t childIndex = 0;
-                in.read(reinterpret_cast<char*>(&distance), sizeof(distance));
-                in.read(reinterpret_cast<char*>(&childIndex), sizeof(childIndex));
-                if (!in) {
-                    throw std::runtime_error("BKTree.load: failed to read child entry");
+    // Load one shard (BKTREE1 or BKTREE2) from a forward-only stream.
+    void load_shard_stream(int index, std::istream& in) {
+        const std::size_t slot = checkIndex(index, "ShardedBKTree.load_shard_stream");
+        auto shard = std::make_shared<BKTree>(BKTree::load_stream(in));
+        std::unique_lock<std::shared_mutex> lock(mutex_);
+        shards_[slot] = std::move(shard);
+    }
+
+    // Write one shard as a BKTREE2 image (an empty tree if it holds no terms).
+    void save_shard(int index, const std::string& path) const {
+        const std::size_t slot = checkIndex(index, "ShardedBKTree.save_shard");
+        std::shared_ptr<BKTree> shard = snapshot()[slot];
+        if (shard) {
+            shard->save_mmap(path);
+        } else {
+            BKTree().save_mmap(path);
+        }
+    }
+
+    std::size_t size() const {
+        std::size_t total = 0;
+        for (const auto& shard : snapshot()) {
+            if (shard) total += shard->size();
+        }
+        return total;
+    }
+
+    std::size_t shard_count() const { return shards_.size(); }
+
+    std::size_t loaded_shards() const {
+        std::size_t loaded = 0;
+        for (const auto& shard : snapshot()) {
+            if (shard) ++loaded;
+        }
+        return loaded;
+    }
+
+    bool is_complete() const { return loaded_shards() == shards_.size(); }
+
+    // Terms per shard; -1 for a shard that has not been loaded yet.
+    std::vector<long long> shard_sizes() const {
+        std::vector<long long> sizes;
+        for (const auto& shard : snapshot()) {
+            sizes.push_back(shard ? static_cast<long long>(shard->size()) : -1);
+        }
+        return sizes;
+    }
+
+private:
+    std::vector<std::shared_ptr<BKTree>> shards_;  // null until built or loaded
+    Partition partition_ = Partition::Hash;
+    std::size_t band_ = 1;
+    mutable std::shared_mutex mutex_;
+
+    static bool resultOrder(const std::pair<std::string, int>& a, const std::pair<std::string, int>& b) {
+        if (a.second != b.second) return a.second < b.second;
+        return a.first < b.first;
+    }
+
+    // How far a query length lies outside the byte-length range of a shard.
+    std::size_t lengthGap(std::size_t slot, std::size_t length) const {
+        const std::size_t lo = slot * band_;
+        const std::size_t hi = slot + 1 == shards_.size() ? SIZE_MAX : lo + band_ - 1;
+        if (length < lo) return lo - length;
+        if (length > hi) return length - hi;
+        return 0;
+    }
+
+    // Loaded shards that may hold a term within maxDist (< 0 = unbounded).
+    std::vector<std::shared_ptr<BKTree>> candidates(std::size_t length, int maxDist) const {
+        std::vector<std::shared_ptr<BKTree>> shards = snapshot();
+        std::vector<std::shared_ptr<BKTree>> selected;
+        for (std::size_t i = 0; i < shards.size(); ++i) {
+            if (!shards[i]) continue;
+            if (partition_ == Partition::Length && maxDist >= 0 &&
+                lengthGap(i, length) > static_cast<std::size_t>(maxDist)) {
+                continue;
+            }
+            selected.push_back(shards[i]);
+        }
+        return selected;
+    }
+
+    std::vector<std::shared_ptr<BKTree>> snapshot() const {
+        std::shared_lock<std::shared_mutex> lock(mutex_);
+        return shards_;
+    }
+
+    std::size_t checkIndex(int index, const char* context) const {
+        if (index < 0 || static_cast<std::size_t>(index) >= shards_.size()) {
+            throw std::out_of_range(std::string(context) + ": shard index out of range");
+        }
+        return static_cast<std::size_t>(index);
+    }
+
+    // Run `query` against the given shards on up to `threads` workers and
+    // merge into search() order, keeping the first `limit` (0 = all).
+    template <typename Query>
+    std::vector<std::pair<std::string, int>> fanOut(const std::vector<std::shared_ptr<BKTree>>& shards,
+                                                    int threads, Query query, std::size_t limit) const {
+        std::vector<std::vector<std::pair<std::string, int>>> parts(shards.size());
+        parallelFor(shards.size(), workerCount(threads, shards.size()), [&](std::size_t i) {
+            parts[i] = query(*shards[i]);
+        });
+
+        std::vector<std::pair<std::string, int>> merged;
+        std::size_t total = 0;
+        for (const auto& part : parts) total += part.size();
+        merged.reserve(total);
+        for (auto& part : parts) {
+            std::move(part.begin(), part.end(), std::back_inserter(merged));
+        }
+        if (limit > 0 && merged.size() > limit) {
+            std::partial_sort(merged.begin(), merged.begin() + limit, merged.end(), resultOrder);
+            merged.resize(limit);
+        } else {
+            std::sort(merged.begin(), merged.end(), resultOrder);
+        }
+        return merged;
+    }
+};
+
+// Default read size for load_stream: large enough that per-call Python
+// overhead vanishes, small enough to be negligible next to the tree.
+constexpr std::size_t kStreamBufferBytes = std::size_t(8) << 20;
+
+// Run `parse` on an istream over a Python reader with the GIL released,
+// re-raising whatever the reader itself raised in preference to the
+// parse error it caused.
+template <typename Parse>
+static auto parsePyStream(py::object readable, std::size_t bufferBytes, Parse parse) {
+    if (bufferBytes > (std::size_t(1) << 30)) {
+        throw py::value_error("buffer_bytes must be at most 1 GiB");
+    }
+    PyReadStreambuf buffer(std::move(readable), bufferBytes);
+    std::istream in(&buffer);
+    try {
+        py::gil_scoped_release release;
+        return parse(in);
+    } catch (...) {
+        buffer.rethrowIfFailed();
+        throw;
+    }
+}
+
+// MRCONSO column names, for iter_rrf_terms filters given by name.
+static const char* const kMrconsoColumns[] = {
+    "CUI", "LAT", "TS", "LUI", "STT", "SUI", "ISPREF", "AUI", "SAUI",
+    "SCUI", "SDUI", "SAB", "TTY", "CODE", "STR", "SRL", "SUPPRESS", "CVF"};
+
+// Streaming scanner for pipe-delimited RRF rows (MRCONSO.RRF). Each buffer of
+// input is split into rows and fields with memchr, rows failing a column
+// filter are dropped, and the wanted column is recorded as a span into the
+// buffer; only the surviving terms are decoded into Python strings, one list
+// per buffer. Scanning runs with the GIL released. Rows are read like the
+// Python parser they replace: fields are split on '|', a row with no more
+// than `column` fields is malformed, and the term is decoded as UTF-8 with
+// invalid bytes dropped and stripped like str.strip(). ASCII whitespace is
+// trimmed during the scan; the rest is handled when the term is decoded.
+class RrfTermReader {
+public:
+    struct Filter {
+        std::size_t column;
+        std::vector<std::string> allowed;  // a handful of values: a linear scan beats hashing
+    };
+
+    RrfTermReader(py::object source, std::size_t column, std::vector<Filter> filters, std::size_t bufferBytes)
+        : column_(column), filters_(std::move(filters)), bufferBytes_(std::max<std::size_t>(bufferBytes, 4096)) {
+        maxColumn_ = column_;
+        for (const auto& filter : filters_) maxColumn_ = std::max(maxColumn_, filter.column);
+        fields_.resize(maxColumn_ + 1);
+
+        if (py::isinstance<py::str>(source) || py::hasattr(source, "__fspath__")) {
+            const std::string path = py::str(py::module_::import("os").attr("fspath")(source));
+            file_ = std::fopen(path.c_str(), "rb");
+            if (file_ == nullptr) {
+                throw std::runtime_error("iter_rrf_terms: unable to open " + path);
+            }
+        } else if (PyObject_CheckBuffer(source.ptr())) {
+            // Scanned in place: the view keeps the exporter alive and its memory fixed.
+            if (PyObject_GetBuffer(source.ptr(), &memory_, PyBUF_SIMPLE) != 0) throw py::error_already_set();
+            hasMemory_ = true;
+        } else {
+            auto reader = std::make_shared<PyReadStreambuf>(std::move(source), 4096, "iter_rrf_terms");
+            stream_ = reader;
+            rethrow_ = [reader]() { reader->rethrowIfFailed(); };
+        }
+        if (!hasMemory_) buffer_.resize(bufferBytes_);
+    }
+
+    ~RrfTermReader() {
+        if (file_ != nullptr) std::fclose(file_);
+        if (hasMemory_) {
+            py::gil_scoped_acquire gil;
+            PyBuffer_Release(&memory_);
+        }
+    }
+
+    RrfTermReader(const RrfTermReader&) = delete;
+    RrfTermReader& operator=(const RrfTermReader&) = delete;
+
+    // The next non-empty list of terms; raises StopIteration at the end.
+    py::list next() {
+        for (;;) {
+            bool more;
+            {
+                py::gil_scoped_release release;
+                more = scan();
+            }
+            if (rethrow_) rethrow_();
+            if (!spans_.empty()) {
+                const auto size = static_cast<py::ssize_t>(spans_.size());
+                py::list batch(spans_.size());
+                py::ssize_t kept = 0;
+                for (const auto& span : spans_) {
+                    PyObject* term = decodeTerm(span.first, span.second);
+                    if (term != nullptr) PyList_SET_ITEM(batch.ptr(), kept++, term);
                 }
-                if (childIndex >= count) {
-                    throw std::runtime_error("BKTree.load: child index out of range");
+                spans_.clear();
+                if (kept < size && PyList_SetSlice(batch.ptr(), kept, size, nullptr) != 0) {
+                    throw py::error_already_set();
                 }
-                nodes[i]->children.push_back({static_cast<int>(distance), nodes[childIndex]});
+                terms_ += static_cast<std::uint64_t>(kept);
+                if (kept > 0) return batch;
             }
+            if (!more) throw py::stop_iteration();
         }
+    }
 
-        BKTree tree;
-        tree.root = count > 0 ? nodes.front() : nullptr;
-        return tree;
+    std::uint64_t rows() const { return rows_; }
+    std::uint64_t terms() const { return terms_; }
+    std::uint64_t skipped() const { return skipped_; }
+    std::uint64_t filtered() const { return filtered_; }
+    std::uint64_t bytesRead() const { return bytesRead_; }
+
+private:
+    // A new reference to the decoded term, or nullptr when it strips to nothing.
+    // scanRow already trimmed ASCII whitespace; what remains for str.strip() is
+    // non-ASCII whitespace (U+00A0, U+3000, ...) and whitespace left at the ends
+    // once invalid bytes were dropped, both rare enough to leave to Python.
+    static PyObject* decodeTerm(const char* data, std::size_t size) {
+        PyObject* term = PyUnicode_DecodeUTF8(data, static_cast<py::ssize_t>(size), "ignore");
+        if (term == nullptr) throw py::error_already_set();
+        const py::ssize_t length = PyUnicode_GET_LENGTH(term);
+        if (length > 0 && !Py_UNICODE_ISSPACE(PyUnicode_READ_CHAR(term, 0)) &&
+            !Py_UNICODE_ISSPACE(PyUnicode_READ_CHAR(term, length - 1))) {
+            return term;
+        }
+        PyObject* stripped = PyObject_CallMethod(term, "strip", nullptr);
+        Py_DECREF(term);
+        if (stripped == nullptr) throw py::error_already_set();
+        if (PyUnicode_GET_LENGTH(stripped) == 0) {
+            Py_DECREF(stripped);
+            return nullptr;
+        }
+        return stripped;
     }
+
+    // Fill spans_ from the next buffer of input; false once the input is exhausted.
+    bool scan() {
+        if (done_) return false;
+        if (hasMemory_) {
+            const char* base = static_cast<const char*>(memory_.buf);
+            const std::size_t size = static_cast<std::size_t>(memory_.len);
+            const std::size_t stop = std::min(size, position_ + bufferBytes_);
+            position_ = scanRows(base, position_, stop, size, true);
+            bytesRead_ = position_;
+            done_ = position_ >= size;
+            return !done_;
+        }
+
+        // Keep the unfinished last row of the previous buffer and read after it.
+        std::size_t kept = filled_ - position_;
+        std::memmove(buffer_.data(), buffer_.data() + position_, kept);
+        if (kept == buffer_.size()) buffer_.resize(buffer_.size() * 2);  // a row longer than the buffer
+        const std::size_t got = read(buffer_.data() + kept, buffer_.size() - kept);
+        bytesRead_ += got;
+        filled_ = kept + got;
+        const bool last = got == 0;
+        position_ = scanRows(buffer_.data(), 0, filled_, filled_, last);
+        done_ = last;
+        return !last;
+    }
+
+    std::size_t read(char* dest, std::size_t capacity) {
+        if (file_ != nullptr) {
+            const std::size_t got = std::fread(dest, 1, capacity, file_);
+            if (got < capacity && std::ferror(file_)) throw std::runtime_error("iter_rrf_terms: read error");
+            return got;
+        }
+        return static_cast<std::size_t>(stream_->sgetn(dest, static_cast<std::streamsize>(capacity)));
+    }
+
+    // Scan the complete rows that start in [begin, stop) of data[0, end),
+    // plus a final unterminated row when `last`; returns where scanning
+    // stopped (the start of the first row left for the next call).
+    std::size_t scanRows(const char* data, std::size_t begin, std::size_t stop, std::size_t end, bool last) {
+        const char* p = data + begin;
+        const char* limit = data + end;
+        while (p < data + stop) {
+            const char* newline = static_cast<const char*>(std::memchr(p, '\n', static_cast<std::size_t>(limit - p)));
+            if (newline == nullptr) {
+                if (!last) break;
+                newline = limit;
+            }
+            scanRow(p, newline);
+            p = newline == limit ? limit : newline + 1;
+        }
+        return static_cast<std::size_t>(p - data);
+    }
+
+    void scanRow(const char* begin, const char* end) {
+        ++rows_;
+        fields_[0] = begin;
+        std::size_t found = 0;
+        for (const char* p = begin; found < maxColumn_;) {
+            const char* pipe = static_cast<const char*>(std::memchr(p, '|', static_cast<std::size_t>(end - p)));
+            if (pipe == nullptr) break;
+            fields_[++found] = p = pipe + 1;
+        }
+        if (found < column_) {
+            ++skipped_;
+            return;
+        }
+        auto fieldEnd = [&](std::size_t index) {
+            if (index < found) return fields_[index + 1] - 1;
+            const char* pipe = static_cast<const char*>(
+                std::memchr(fields_[index], '|', static_cast<std::size_t>(end - fields_[index])));
+            return pipe == nullptr ? end : pipe;
+        };
+        for (const auto& filter : filters_) {
+            std::string_view value;
+            if (filter.column <= found) {
+                value = std::string_view(fields_[filter.column],
+                                         static_cast<std::size_t>(fieldEnd(filter.column) - fields_[filter.column]));
+            }
+            if (std::find(filter.allowed.begin(), filter.allowed.end(), value) == filter.allowed.end()) {
+                ++filtered_;
+                return;
+            }
+        }
+        const char* first = fields_[column_];
+        const char* last = fieldEnd(column_);
+        auto blank = [](char c) { return c == ' ' || (c >= '\t' && c <= '\r') || (c >= '\x1c' && c <= '\x1f'); };
+        while (first < last && blank(*first)) ++first;
+        while (last > first && blank(last[-1])) --last;
+        if (first < last) spans_.emplace_back(first, static_cast<std::size_t>(last - first));
+    }
+
+    std::size_t column_;
+    std::size_t maxColumn_;
+    std::vector<Filter> filters_;
+    std::size_t bufferBytes_;
+    std::vector<const char*> fields_;
+    std::vector<std::pair<const char*, std::size_t>> spans_;
+
+    std::FILE* file_ = nullptr;
+    std::shared_ptr<std::streambuf> stream_;
+    std::function<void()> rethrow_;
+    Py_buffer memory_{};
+    bool hasMemory_ = false;
+    std::vector<char> buffer_;
+    std::size_t filled_ = 0;
+    std::size_t position_ = 0;
+    bool done_ = false;
+
+    std::uint64_t rows_ = 0;
+    std::uint64_t terms_ = 0;
+    std::uint64_t skipped_ = 0;
+    std::uint64_t filtered_ = 0;
+    std::uint64_t bytesRead_ = 0;
 };
 
+// Column index for a filter key: an int, or an MRCONSO column name.
+static std::size_t rrfColumn(const py::handle& key) {
+    if (py::isinstance<py::str>(key)) {
+        const std::string name = key.cast<std::string>();
+        for (std::size_t i = 0; i < sizeof(kMrconsoColumns) / sizeof(kMrconsoColumns[0]); ++i) {
+            if (name == kMrconsoColumns[i]) return i;
+        }
+        throw py::value_error("iter_rrf_terms: unknown MRCONSO column '" + name + "'");
+    }
+    const long index = key.cast<long>();
+    if (index < 0) throw py::value_error("iter_rrf_terms: column must be non-negative");
+    return static_cast<std::size_t>(index);
+}
+
 PYBIND11_MODULE(cppmatch, m) {
     m.doc() = "BK-tree fuzzy string matching with pybind11";
     
     m.def("levenshtein", &levenshtein, 
-          "Calculate Levenshtein distance between two strings",
+          "Calculate Levenshtein distance between two strings (bit-parallel)",
           py::arg("s1"), py::arg("s2"));
     
     py::class_<BKTree>(m, "BKTree")
         .def(py::init<>())
         .def("insert", &BKTree::insert, 
              "Insert a term into the BK-tree",
-             py::arg("term"))
+             py::arg("term"),
+             py::call_guard<py::gil_scoped_release>())
+        .def("insert_many", &BKTree::insert_many,
+             "Insert terms in order under one lock; returns how many were not already present",
+             py::arg("terms"),
+             py::call_guard<py::gil_scoped_release>())
         .def("search", &BKTree::search, 
            "Search for terms within maxDist of query",
-           py::arg("query"), py::arg("maxdist"))
+           py::arg("query"), py::arg("maxdist"),
+           py::call_guard<py::gil_scoped_release>())
+        .def("search_many", &BKTree::search_many,
+           "Search many queries in parallel; maxdists and k are one value or one per query",
+           py::arg("queries"), py::arg("maxdists"), py::arg("threads") = 0,
+           py::arg("k") = std::vector<int>(),
+           py::call_guard<py::gil_scoped_release>())
+        .def_static("build", &BKTree::build,
+           "Build a tree from terms using worker threads; identical to inserting them in order",
+           py::arg("terms"), py::arg("threads") = 0,
+           py::call_guard<py::gil_scoped_release>())
+        .def("search_topk", &BKTree::search_topk,
+           "Return the k closest terms within maxdist (negative maxdist = unbounded)",
+           py::arg("query"), py::arg("k"), py::arg("maxdist") = -1,
+           py::call_guard<py::gil_scoped_release>())
+        .def("count_visited", &BKTree::count_visited,
+           "Nodes whose distance search(query, maxdist) computes",
+           py::arg("query"), py::arg("maxdist"),
+           py::call_guard<py::gil_scoped_release>())
+        .def("search_best", &BKTree::search_best,
+           "Exact hit if present, else every term at the smallest distance <= maxdist that has any\n"
+           "(radius 1, 2, ... in turn; negative maxdist = unbounded)",
+           py::arg("query"), py::arg("maxdist") = -1,
+           py::call_guard<py::gil_scoped_release>())
+        .def("search_with_stats", &BKTree::search_with_stats,
+           "Search (top-k search when k >= 0, search_best when best) returning (matches, stats) with "
+           "visited, distance_calls, pruned, max_depth and elapsed_ns",
+           py::arg("query"), py::arg("maxdist"), py::arg("k") = -1, py::arg("best") = false,
+           py::call_guard<py::gil_scoped_release>())
+        .def("search_stats", &BKTree::search_stats,
+           "Aggregate counters over every search run on this tree")
+        .def("reset_search_stats", &BKTree::reset_search_stats)
+        .def("stats", [](const BKTree& tree) {
+            TreeStats stats;
+            {
+                py::gil_scoped_release release;
+                stats = tree.stats();
+            }
+            return stats.toDict();
+        }, "Tree shape: node/edge/leaf counts, depth, fan-out, edge-distance and term-length histograms")
+        .def("compact", &BKTree::compact,
+           "Release spare insert capacity and lay the tree out in BFS order",
+           py::call_guard<py::gil_scoped_release>())
+        .def("__len__", &BKTree::size)
+        .def("__contains__", &BKTree::contains, py::arg("term"),
+           py::call_guard<py::gil_scoped_release>())
+        .def_property_readonly("is_mmapped", &BKTree::is_mmapped,
+            "True when the tree reads from a memory-mapped BKTREE2 file")
         .def("to_serializable", &BKTree::to_serializable,
             "Return a serializable representation of the BK-tree")
         .def_static("from_serializable", &BKTree::from_serializable,
@@ -329,8 +2714,146 @@ PYBIND11_MODULE(cppmatch, m) {
             py::arg("data"))
        .def("save", &BKTree::save,
            "Serialize the BK-tree to a binary file",
-           py::arg("path"))
+           py::arg("path"),
+           py::call_guard<py::gil_scoped_release>())
+       .def("save_mmap", &BKTree::save_mmap,
+           "Write the BK-tree as a memory-mappable BKTREE2 file",
+           py::arg("path"),
+           py::call_guard<py::gil_scoped_release>())
        .def_static("load", &BKTree::load,
-           "Load a BK-tree from a binary file",
-           py::arg("path"));
+           "Load a BK-tree from a BKTREE1 or BKTREE2 binary file",
+           py::arg("path"),
+           py::call_guard<py::gil_scoped_release>())
+       .def_static("load_mmap", &BKTree::load_mmap,
+           "Memory-map a BKTREE2 file read-only without copying it",
+           py::arg("path"),
+           py::call_guard<py::gil_scoped_release>())
+        .def_static("load_stream",
+           [](py::object readable, std::size_t bufferBytes) {
+               return parsePyStream(std::move(readable), bufferBytes,
+                                    [](std::istream& in) { return BKTree::load_stream(in); });
+           },
+           "Build a BK-tree from a binary file-like object holding a BKTREE1 or BKTREE2 image,\n"
+           "reading it once, front to back, buffer_bytes at a time",
+           py::arg("readable"), py::arg("buffer_bytes") = kStreamBufferBytes);
+
+    py::class_<ShardedBKTree>(m, "ShardedBKTree")
+        .def(py::init<int, const std::string&, int>(),
+           py::arg("shards"), py::arg("partition") = "hash", py::arg("band") = 1)
+        .def_static("build", &ShardedBKTree::build,
+           "Partition terms into shards (by hash or length band) and build the shards concurrently",
+           py::arg("terms"), py::arg("shards"), py::arg("threads") = 0,
+           py::arg("partition") = "hash", py::arg("band") = 1,
+           py::call_guard<py::gil_scoped_release>())
+        .def("insert", &ShardedBKTree::insert,
+           "Insert a term into its shard",
+           py::arg("term"),
+           py::call_guard<py::gil_scoped_release>())
+        .def("shard_of", &ShardedBKTree::shard_of,
+           "Index of the shard a term belongs to",
+           py::arg("term"))
+        .def("search", &ShardedBKTree::search,
+           "Search every loaded shard in parallel and merge the sorted results",
+           py::arg("query"), py::arg("maxdist"), py::arg("threads") = 0,
+           py::call_guard<py::gil_scoped_release>())
+        .def("search_topk", &ShardedBKTree::search_topk,
+           "Return the k closest terms across loaded shards (negative maxdist = unbounded)",
+           py::arg("query"), py::arg("k"), py::arg("maxdist") = -1, py::arg("threads") = 0,
+           py::call_guard<py::gil_scoped_release>())
+        .def("search_many", &ShardedBKTree::search_many,
+           "Search many queries in parallel; maxdists and k are one value or one per query",
+           py::arg("queries"), py::arg("maxdists"), py::arg("threads") = 0,
+           py::arg("k") = std::vector<int>(),
+           py::call_guard<py::gil_scoped_release>())
+        .def("count_visited", &ShardedBKTree::count_visited,
+           "Nodes whose distance search(query, maxdist) computes across consulted shards",
+           py::arg("query"), py::arg("maxdist"),
+           py::call_guard<py::gil_scoped_release>())
+        .def("search_best", &ShardedBKTree::search_best,
+           "Exact hit from the term's shard if present, else the nearest matches within maxdist",
+           py::arg("query"), py::arg("maxdist") = -1, py::arg("threads") = 0,
+           py::call_guard<py::gil_scoped_release>())
+        .def("search_with_stats", &ShardedBKTree::search_with_stats,
+           "Search (top-k search when k >= 0, search_best when best) returning (matches, stats) "
+           "summed over consulted shards",
+           py::arg("query"), py::arg("maxdist"), py::arg("k") = -1, py::arg("best") = false,
+           py::call_guard<py::gil_scoped_release>())
+        .def("search_stats", &ShardedBKTree::search_stats,
+           "Aggregate counters summed over the loaded shards")
+        .def("reset_search_stats", &ShardedBKTree::reset_search_stats)
+        .def("stats", [](const ShardedBKTree& forest) {
+            TreeStats stats;
+            {
+                py::gil_scoped_release release;
+                stats = forest.stats();
+            }
+            py::dict out = stats.toDict();
+            out["shards"] = forest.shard_count();
+            out["loaded_shards"] = forest.loaded_shards();
+            return out;
+        }, "TreeStats merged over the loaded shards")
+        .def("load_shard", &ShardedBKTree::load_shard,
+           "Load one shard from a BKTREE2 (memory-mapped) or BKTREE1 file",
+           py::arg("index"), py::arg("path"),
+           py::call_guard<py::gil_scoped_release>())
+        .def("load_shard_stream",
+           [](ShardedBKTree& self, int index, py::object readable, std::size_t bufferBytes) {
+               parsePyStream(std::move(readable), bufferBytes, [&](std::istream& in) {
+                   self.load_shard_stream(index, in);
+                   return 0;
+               });
+           },
+           "Load one shard from a binary file-like object, reading it once front to back",
+           py::arg("index"), py::arg("readable"), py::arg("buffer_bytes") = kStreamBufferBytes)
+        .def("save_shard", &ShardedBKTree::save_shard,
+           "Write one shard as a BKTREE2 file",
+           py::arg("index"), py::arg("path"),
+           py::call_guard<py::gil_scoped_release>())
+        .def("__len__", &ShardedBKTree::size)
+        .def("__contains__", &ShardedBKTree::contains, py::arg("term"),
+           py::call_guard<py::gil_scoped_release>())
+        .def_property_readonly("shard_count", &ShardedBKTree::shard_count)
+        .def_property_readonly("partition", &ShardedBKTree::partition)
+        .def_property_readonly("band", &ShardedBKTree::band)
+        .def_property_readonly("loaded_shards", &ShardedBKTree::loaded_shards)
+        .def_property_readonly("is_complete", &ShardedBKTree::is_complete)
+        .def("shard_sizes", &ShardedBKTree::shard_sizes,
+           "Terms per shard (-1 for shards not loaded yet)");
+
+    py::class_<RrfTermReader>(m, "RrfTermReader")
+        .def("__iter__", [](RrfTermReader& self) -> RrfTermReader& { return self; })
+        .def("__next__", &RrfTermReader::next)
+        .def_property_readonly("rows", &RrfTermReader::rows, "Rows scanned so far")
+        .def_property_readonly("terms", &RrfTermReader::terms, "Terms returned so far")
+        .def_property_readonly("skipped", &RrfTermReader::skipped,
+            "Rows without the term column (malformed or blank)")
+        .def_property_readonly("filtered", &RrfTermReader::filtered, "Rows dropped by a column filter")
+        .def_property_readonly("bytes_read", &RrfTermReader::bytesRead, "Input bytes consumed so far");
+
+    m.def("iter_rrf_terms",
+          [](py::object source, py::object column, py::object filters, std::size_t bufferBytes) {
+              if (bufferBytes > (std::size_t(1) << 30)) {
+                  throw py::value_error("buffer_bytes must be at most 1 GiB");
+              }
+              std::vector<RrfTermReader::Filter> parsed;
+              if (!filters.is_none()) {
+                  for (auto item : py::reinterpret_borrow<py::dict>(filters)) {
+                      RrfTermReader::Filter filter;
+                      filter.column = rrfColumn(item.first);
+                      if (py::isinstance<py::str>(item.second)) {
+                          throw py::type_error("iter_rrf_terms: filter values must be a collection of strings");
+                      }
+                      for (auto value : item.second) filter.allowed.push_back(value.cast<std::string>());
+                      parsed.push_back(std::move(filter));
+                  }
+              }
+              return std::make_unique<RrfTermReader>(std::move(source), rrfColumn(column), std::move(parsed),
+                                                     bufferBytes);
+          },
+          "Iterate over one column of an RRF file (MRCONSO STR by default) in lists of terms, one list\n"
+          "per buffer_bytes of input. source is a path, a bytes-like object (scanned in place) or a\n"
+          "binary file-like object. filters maps a column (index or MRCONSO name such as 'LAT',\n"
+          "'SAB' or 'SUPPRESS') to the values a row must have there to be kept.",
+          py::arg("source"), py::arg("column") = 14, py::arg("filters") = py::none(),
+          py::arg("buffer_bytes") = kStreamBufferBytes);
 }
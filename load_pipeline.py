@@ -0,0 +1,240 @@
+"""Staged producer/consumer pipeline for index loads.
+
+A raw MRCONSO load reads bytes (often from a GCS stream), parses them into terms and inserts the
+terms into the tree. Run back to back in one thread, the CPU idles through network stalls and
+the network idles through inserts. :class:`LoadPipeline` runs each stage on its own thread,
+connected by bounded queues: a stage that gets ahead blocks on the full queue (backpressure)
+instead of buffering the whole file, and the load takes about as long as its slowest stage
+rather than the sum of all of them. The heavy stages (the native RRF scanner and
+``BKTree.insert_many``) release the GIL, so they overlap on separate cores as well as with I/O.
+
+Every stage records how much it handled and how long it waited on its input (starved) or its
+output (backpressured), which :meth:`LoadPipeline.report` turns into per-stage throughput and
+idle-time log lines. The first exception raised by any stage stops the others and is re-raised
+by :meth:`LoadPipeline.consume`.
+"""
+
+import io
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator
+
+logger = logging.getLogger("load_pipeline")
+
+_DONE = object()
+# How often a blocked stage checks whether the pipeline was stopped.
+_POLL_SECONDS = 0.1
+
+
+class StageStats:
+    """Work and waiting time of one stage."""
+
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.volume = 0
+        self.starved_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.started = time.perf_counter()
+        self.finished: float | None = None
+
+    @property
+    def seconds(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def busy_seconds(self) -> float:
+        return max(0.0, self.seconds - self.starved_seconds - self.blocked_seconds)
+
+    def as_dict(self) -> dict[str, Any]:
+        busy = self.busy_seconds
+        return {
+            "items": self.items,
+            self.unit: self.volume,
+            "seconds": round(self.seconds, 3),
+            "busy_seconds": round(busy, 3),
+            "starved_seconds": round(self.starved_seconds, 3),
+            "blocked_seconds": round(self.blocked_seconds, 3),
+            f"{self.unit}_per_busy_second": round(self.volume / busy, 1) if busy else None,
+        }
+
+
+class LoadPipeline:
+    """Threads connected by queues of at most ``queue_depth`` items each.
+
+    Build it front to back with :meth:`add_stage` (each stage runs on a thread) and finish with
+    :meth:`consume` on the calling thread.
+    """
+
+    def __init__(self, queue_depth: int = 4):
+        self.queue_depth = max(1, queue_depth)
+        self.stages: list[StageStats] = []
+        self._threads: list[threading.Thread] = []
+        self._stop = threading.Event()
+        self._error: BaseException | None = None
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+
+    def _fail(self, exc: BaseException) -> None:
+        with self._lock:
+            if self._error is None:
+                self._error = exc
+        self._stop.set()
+
+    def _get(self, inbound: queue.Queue, stats: StageStats) -> Iterator[Any]:
+        while True:
+            waited = time.perf_counter()
+            while True:
+                try:
+                    item = inbound.get(timeout=_POLL_SECONDS)
+                    break
+                except queue.Empty:
+                    if self._stop.is_set():
+                        stats.starved_seconds += time.perf_counter() - waited
+                        return
+            stats.starved_seconds += time.perf_counter() - waited
+            if item is _DONE:
+                return
+            yield item
+
+    def _put(self, outbound: queue.Queue, item: Any, stats: StageStats | None) -> bool:
+        waited = time.perf_counter()
+        try:
+            while True:
+                try:
+                    outbound.put(item, timeout=_POLL_SECONDS)
+                    return True
+                except queue.Full:
+                    if self._stop.is_set():
+                        return False
+        finally:
+            if stats is not None:
+                stats.blocked_seconds += time.perf_counter() - waited
+
+    def add_stage(self, name: str, unit: str, work: Callable[[Iterator[Any] | None], Iterable[Any]],
+                  inbound: queue.Queue | None = None, measure: Callable[[Any], int] = len) -> queue.Queue:
+        """Run ``work(items from inbound)`` on a thread and return the queue its output goes to.
+
+        ``work`` gets None for the first stage. ``measure(item)`` is added to the stage's volume
+        (``unit``: bytes, terms, ...) for every item it emits.
+        """
+        outbound: queue.Queue = queue.Queue(self.queue_depth)
+        stats = StageStats(name, unit)
+        self.stages.append(stats)
+
+        def run() -> None:
+            try:
+                items = self._get(inbound, stats) if inbound is not None else None
+                for item in work(items):
+                    stats.items += 1
+                    stats.volume += measure(item)
+                    if not self._put(outbound, item, stats):
+                        return
+            except BaseException as exc:  # noqa: BLE001 - handed to the consuming thread
+                self._fail(exc)
+            finally:
+                stats.finished = time.perf_counter()
+                self._put(outbound, _DONE, None)
+
+        thread = threading.Thread(target=run, name=f"load-{name}", daemon=True)
+        self._threads.append(thread)
+        thread.start()
+        return outbound
+
+    def consume(self, name: str, unit: str, inbound: queue.Queue, handle: Callable[[Any], bool | None],
+                measure: Callable[[Any], int] = len) -> None:
+        """Pass every item of ``inbound`` to ``handle`` on this thread until the input ends.
+
+        ``handle`` returning False stops the pipeline early. Waits for the stage threads, then
+        re-raises the first error any stage hit.
+        """
+        stats = StageStats(name, unit)
+        self.stages.append(stats)
+        try:
+            for item in self._get(inbound, stats):
+                stats.items += 1
+                stats.volume += measure(item)
+                if handle(item) is False:
+                    break
+        except BaseException as exc:  # noqa: BLE001
+            self._fail(exc)
+        finally:
+            stats.finished = time.perf_counter()
+            self._stop.set()
+            for thread in self._threads:
+                thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def report(self) -> dict[str, Any]:
+        """Log one line per stage and return the figures keyed by stage name."""
+        total = time.perf_counter() - self.started
+        busiest = max((stats.busy_seconds for stats in self.stages), default=0.0)
+        for stats in self.stages:
+            figures = stats.as_dict()
+            logger.info(
+                "Load stage %-6s %d items, %d %s in %.2fs: busy %.2fs (%s %s/s), starved %.2fs, blocked %.2fs",
+                stats.name,
+                stats.items,
+                stats.volume,
+                stats.unit,
+                stats.seconds,
+                stats.busy_seconds,
+                figures[f"{stats.unit}_per_busy_second"],
+                stats.unit,
+                stats.starved_seconds,
+                stats.blocked_seconds,
+            )
+        logger.info("Load pipeline finished in %.2fs; busiest stage %.2fs, stages summed %.2fs",
+                    total, busiest, sum(stats.busy_seconds for stats in self.stages))
+        return {
+            "seconds": round(total, 3),
+            "stages": {stats.name: stats.as_dict() for stats in self.stages},
+        }
+
+
+class QueueReader(io.RawIOBase):
+    """Binary file object over an iterator of ``bytes`` chunks, for parsers that pull input."""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        super().__init__()
+        self._chunks = chunks
+        self._chunk = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._chunk:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._chunk = memoryview(chunk)
+        count = min(len(buffer), len(self._chunk))
+        buffer[:count] = self._chunk[:count]
+        self._chunk = self._chunk[count:]
+        return count
+
+
+def read_chunks(handle: Any, chunk_bytes: int) -> Iterator[bytes]:
+    """Read a binary handle in ``chunk_bytes`` pieces until it is exhausted."""
+    while True:
+        chunk = handle.read(chunk_bytes)
+        if not chunk:
+            return
+        yield chunk
+
+
+def rebatch(batches: Iterable[list[Any]], size: int) -> Iterator[list[Any]]:
+    """Regroup lists of items into lists of ``size`` items (the last one may be shorter)."""
+    pending: list[Any] = []
+    for batch in batches:
+        pending.extend(batch)
+        while len(pending) >= size:
+            yield pending[:size]
+            del pending[:size]
+    if pending:
+        yield pending
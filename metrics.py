@@ -0,0 +1,217 @@
+"""Prometheus metrics for the search service, rendered in the text exposition format.
+
+Request and search metrics are updated from the asyncio event loop (the ASGI middleware and the
+endpoint coroutines), which is a single thread, so counters are plain integers with no locks.
+The index-load fields (``loads``, ``load_seconds``, ``artifact_bytes``) are the exception:
+``load_terms`` sets them, and the startup load runs it in a worker thread. It holds the
+service's load lock while it does, so they have one writer at a time, and the event loop only
+reads them to render ``/metrics``; a scrape during a load sees either the old or the new value.
+The per-endpoint series are created on the first request to each route; after that a request only
+bumps preallocated counters and histogram buckets. The exposition text is only built when
+``/metrics`` is scraped, together with the values that are cheap to read at that point (RSS,
+search executor and BK-tree search statistics).
+"""
+
+import os
+import time
+from typing import Any, Callable, Iterable
+
+from search_stats import Histogram, SearchStatsRecorder, maxdist_label
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RESULT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+MAXDIST_LABELS = tuple(maxdist_label(d) for d in range(-1, 9))
+
+# Per-query search statistics from SearchStatsRecorder, exported as histograms.
+_SEARCH_HISTOGRAMS = (
+    ("visited", "bktree_search_visited_nodes", "Nodes visited per BK-tree search", 1),
+    ("distance_calls", "bktree_search_distance_calls", "Distance-kernel calls per BK-tree search", 1),
+    ("pruned", "bktree_search_pruned_subtrees", "Subtrees pruned per BK-tree search", 1),
+    ("max_depth", "bktree_search_max_depth", "Deepest node reached per BK-tree search", 1),
+    ("elapsed_us", "bktree_search_tree_seconds", "Time spent in the BK-tree per search", 1e-6),
+)
+
+_PREFIX = "mrconso_"
+
+
+class _Route:
+    __slots__ = ("latency", "statuses")
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.statuses: dict[int, int] = {}
+
+
+def _resident_bytes() -> int:
+    try:
+        with open("/proc/self/statm", "rb") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _labels(**labels: Any) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{key}="{str(value)}"' for key, value in labels.items())
+    return "{" + inner + "}"
+
+
+def _histogram_lines(name: str, labels: dict[str, Any], count: int, total: float,
+                     buckets: Iterable[tuple[Any, int]], scale: float = 1) -> list[str]:
+    lines = []
+    for bound, cumulative in buckets:
+        le = "+Inf" if bound == "+Inf" else repr(bound * scale if scale != 1 else bound)
+        lines.append(f"{name}_bucket{_labels(**labels, le=le)} {cumulative}")
+    lines.append(f"{name}_sum{_labels(**labels)} {total * scale if scale != 1 else total}")
+    lines.append(f"{name}_count{_labels(**labels)} {count}")
+    return lines
+
+
+def _cumulative(hist: Histogram) -> list[tuple[Any, int]]:
+    buckets, running = [], 0
+    for bound, count in zip(hist.bounds, hist.counts):
+        running += count
+        buckets.append((bound, running))
+    buckets.append(("+Inf", hist.count))
+    return buckets
+
+
+class ServiceMetrics:
+    """Request, search and index-load metrics for one service process."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self._routes: dict[str, dict[str, _Route]] = {}
+        self.results = Histogram(RESULT_BUCKETS)
+        self.maxdist = dict.fromkeys(MAXDIST_LABELS, 0)
+        self.loads = {"success": 0, "failure": 0}
+        self.load_seconds = 0.0
+        self.artifact_bytes = 0
+
+    def observe_request(self, method: str, endpoint: str, status: int, seconds: float) -> None:
+        methods = self._routes.get(endpoint)
+        if methods is None:
+            methods = self._routes[endpoint] = {}
+        route = methods.get(method)
+        if route is None:
+            route = methods[method] = _Route()
+        route.latency.observe(seconds)
+        route.statuses[status] = route.statuses.get(status, 0) + 1
+
+    def observe_search(self, maxdist: int, result_count: int) -> None:
+        self.results.observe(result_count)
+        self.maxdist[maxdist_label(maxdist)] += 1
+
+    def observe_load(self, seconds: float, ok: bool) -> None:
+        self.loads["success" if ok else "failure"] += 1
+        if ok:
+            self.load_seconds = seconds
+
+    def render(self, *, terms: int, search_stats: SearchStatsRecorder | None = None,
+               executor: dict[str, Any] | None = None) -> str:
+        out: list[str] = []
+
+        def family(name: str, kind: str, help_text: str) -> str:
+            full = _PREFIX + name
+            out.append(f"# HELP {full} {help_text}")
+            out.append(f"# TYPE {full} {kind}")
+            return full
+
+        name = family("http_requests_total", "counter", "HTTP requests by route, method and status")
+        for endpoint, methods in sorted(self._routes.items()):
+            for method, route in sorted(methods.items()):
+                for status, count in sorted(route.statuses.items()):
+                    out.append(f"{name}{_labels(endpoint=endpoint, method=method, status=status)} {count}")
+
+        name = family("http_request_duration_seconds", "histogram", "HTTP request latency by route and method")
+        for endpoint, methods in sorted(self._routes.items()):
+            for method, route in sorted(methods.items()):
+                hist = route.latency
+                out.extend(_histogram_lines(name, {"endpoint": endpoint, "method": method},
+                                            hist.count, hist.total, _cumulative(hist)))
+
+        name = family("http_requests_in_flight", "gauge", "HTTP requests currently being served")
+        out.append(f"{name} {self.in_flight}")
+
+        name = family("search_results", "histogram", "Matches returned per BK-tree search")
+        out.extend(_histogram_lines(name, {}, self.results.count, self.results.total, _cumulative(self.results)))
+
+        name = family("search_maxdist_total", "counter", "BK-tree searches by requested maxdist")
+        for label, count in self.maxdist.items():
+            out.append(f"{name}{_labels(maxdist=label)} {count}")
+
+        name = family("index_loads_total", "counter", "Index loads by outcome")
+        for outcome, count in self.loads.items():
+            out.append(f"{name}{_labels(outcome=outcome)} {count}")
+        name = family("index_load_duration_seconds", "gauge", "Duration of the last successful index load")
+        out.append(f"{name} {self.load_seconds}")
+        name = family("index_artifact_bytes", "gauge", "Size of the last index artifact loaded")
+        out.append(f"{name} {self.artifact_bytes}")
+        name = family("index_terms", "gauge", "Terms in the loaded index")
+        out.append(f"{name} {terms}")
+
+        name = family("process_resident_memory_bytes", "gauge", "Resident set size of this process")
+        out.append(f"{name} {_resident_bytes()}")
+
+        if executor is not None:
+            for key, kind, help_text in (
+                ("active", "gauge", "Searches running on the search executor"),
+                ("queue_depth", "gauge", "Searches waiting for a search executor worker"),
+                ("rejected", "counter", "Searches rejected because the executor queue was full"),
+                ("timed_out", "counter", "Searches that exceeded SEARCH_TIMEOUT_SECONDS"),
+            ):
+                suffix = "_total" if kind == "counter" else ""
+                name = family(f"search_executor_{key}{suffix}", kind, help_text)
+                out.append(f"{name} {executor[key]}")
+
+        if search_stats is not None:
+            snapshot = search_stats.snapshot()
+            for key, metric, help_text, scale in _SEARCH_HISTOGRAMS:
+                name = family(metric, "histogram", help_text)
+                for label, histograms in snapshot.items():
+                    hist = histograms[key]
+                    buckets = [(b["le"], b["count"]) for b in hist["buckets"]]
+                    out.extend(_histogram_lines(name, {"maxdist": label}, hist["count"], hist["sum"],
+                                                buckets, scale))
+
+        out.append("")
+        return "\n".join(out)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware timing every HTTP request into ``metrics``.
+
+    Requests are labelled with the matched route template (``/search/bktree``, not the raw URL),
+    so the label set stays bounded; anything no route matched is reported as ``unmatched``.
+    """
+
+    def __init__(self, app: Callable, metrics: ServiceMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.metrics
+        status = 500
+        start = time.perf_counter()
+        metrics.in_flight += 1
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.in_flight -= 1
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "unmatched"
+            metrics.observe_request(scope["method"], endpoint, status, time.perf_counter() - start)
@@ -0,0 +1,160 @@
+"""In-process cache of BK-tree search results.
+
+Traffic is heavily skewed towards a small set of recurring mentions, so results are cached keyed on
+``(normalized query, maxdist, k)``. The cache is split into independently locked shards, each an
+LRU bounded by entry count and approximate bytes, so worker threads only contend when their keys
+land on the same shard. Entries expire after a TTL, and :meth:`QueryCache.invalidate` drops
+everything when a new index is loaded. Each invalidation bumps a generation number; a result
+computed against the previous index carries the old generation and is discarded by :meth:`put`
+rather than repopulating the fresh cache.
+"""
+
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Hashable
+
+# Rough per-entry and per-match overhead of the cached tuples, in bytes.
+_ENTRY_OVERHEAD = 200
+_MATCH_OVERHEAD = 120
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form used both for the cache key and the search itself.
+
+    Indexed terms are stripped when loaded, so surrounding whitespace can never help a match.
+    """
+    return query.strip()
+
+
+def _estimate_bytes(key: tuple, value: tuple) -> int:
+    size = _ENTRY_OVERHEAD + len(key[0])
+    for term, _ in value:
+        size += _MATCH_OVERHEAD + len(term)
+    return size
+
+
+def _split(total: int, parts: int) -> list[int]:
+    """``total`` divided into ``parts`` whole shares that add up to exactly ``total``."""
+    share, extra = divmod(total, parts)
+    return [share + (1 if index < extra else 0) for index in range(parts)]
+
+
+class _Shard:
+    __slots__ = ("lock", "entries", "bytes", "max_entries", "max_bytes", "hits", "misses", "evictions",
+                 "expirations")
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = Lock()
+        self.entries: OrderedDict[Hashable, tuple[float, int, Any]] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+
+class QueryCache:
+    """Sharded LRU with TTL, bounded by entry count and approximate bytes."""
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024,
+                 ttl_seconds: float | None = 300.0, shards: int = 16):
+        self.max_entries = max(0, max_entries)
+        self.max_bytes = max(0, max_bytes)
+        self.ttl_seconds = ttl_seconds if ttl_seconds and ttl_seconds > 0 else None
+        self.generation = 0
+        # Bounds are enforced per shard and the shares add up to the totals, so a small cache
+        # gets fewer shards rather than every shard holding at least one entry.
+        count = max(1, min(shards, self.max_entries))
+        self._shards = [
+            _Shard(entries, size)
+            for entries, size in zip(_split(self.max_entries, count), _split(self.max_bytes, count))
+        ]
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    @staticmethod
+    def make_key(query: str, maxdist: int, k: int | None, best: bool = False) -> tuple:
+        """``(query, maxdist, k)``, with a trailing ``True`` for a best-matches-only search."""
+        key = normalize_query(query), maxdist, k if k is not None and k >= 0 else -1
+        return key + (True,) if best else key
+
+    def _shard(self, key: Hashable) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def get(self, key: Hashable) -> Any | None:
+        """Return the cached value for ``key``, or None on a miss."""
+        if not self.enabled:
+            return None
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry is None:
+                shard.misses += 1
+                return None
+            expires_at, size, value = entry
+            if expires_at and expires_at <= time.monotonic():
+                del shard.entries[key]
+                shard.bytes -= size
+                shard.expirations += 1
+                shard.misses += 1
+                return None
+            shard.entries.move_to_end(key)
+            shard.hits += 1
+            return value
+
+    def put(self, key: tuple, value: tuple, generation: int) -> None:
+        """Store ``value`` unless the index changed since ``generation`` was read."""
+        if not self.enabled or generation != self.generation:
+            return
+        size = _estimate_bytes(key, value)
+        shard = self._shard(key)
+        if size > shard.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else 0.0
+        with shard.lock:
+            if generation != self.generation:
+                return
+            old = shard.entries.pop(key, None)
+            if old is not None:
+                shard.bytes -= old[1]
+            shard.entries[key] = (expires_at, size, value)
+            shard.bytes += size
+            while len(shard.entries) > shard.max_entries or shard.bytes > shard.max_bytes:
+                _, (_, evicted_size, _) = shard.entries.popitem(last=False)
+                shard.bytes -= evicted_size
+                shard.evictions += 1
+
+    def invalidate(self) -> None:
+        """Drop every entry; results computed before this call will not be stored."""
+        self.generation += 1
+        for shard in self._shards:
+            with shard.lock:
+                shard.entries.clear()
+                shard.bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        totals = {"entries": 0, "bytes": 0, "hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        for shard in self._shards:
+            with shard.lock:
+                totals["entries"] += len(shard.entries)
+                totals["bytes"] += shard.bytes
+                totals["hits"] += shard.hits
+                totals["misses"] += shard.misses
+                totals["evictions"] += shard.evictions
+                totals["expirations"] += shard.expirations
+        lookups = totals["hits"] + totals["misses"]
+        return {
+            "enabled": self.enabled,
+            **totals,
+            "hit_ratio": round(totals["hits"] / lookups, 4) if lookups else 0.0,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "shards": len(self._shards),
+            "generation": self.generation,
+        }
@@ -2,9 +2,15 @@
 """
 Massive-ish benchmark harness for BK-tree service and local engine.
 
-Two modes:
+Five modes:
   1) remote: load tests the deployed FastAPI service /search/bktree with async HTTP
   2) local: benchmarks in-process BKTree vs Python baseline
+  3) layout: compares visited nodes and latency of a single BKTree against a
+     length-partitioned ShardedBKTree
+  4) coldstart: packages one tree as gzip, zstd and uncompressed artifacts and times
+     the service's artifact loader on each
+  5) filter: builds one index from every MRCONSO row and one from the rows kept by a
+     LAT/SAB/SUPPRESS term filter, and compares their size, build time and query latency
 
 Outputs summary metrics and optionally writes a JSON report.
 
@@ -18,6 +24,19 @@ Examples:
   python scripts/massive_benchmark.py local \
     --terms data/mrconso_sample.txt --limit-terms 100000 --queries 1000 --maxdist 1 \
     --out-json docs/reports/local_bench.json
+
+  # Index layout comparison (length bands of 2 bytes)
+  python scripts/massive_benchmark.py layout \
+    --terms data/mrconso_sample.txt --limit-terms 100000 --maxdists 1 2 3 --band 2
+
+  # Artifact cold start per codec
+  python scripts/massive_benchmark.py coldstart \
+    --terms data/mrconso_sample.txt --compressions gzip zstd none
+
+  # Index size and latency with and without a term filter
+  python scripts/massive_benchmark.py filter \
+    --mrconso data/umls/2025AA/MRCONSO.RRF --langs ENG --sabs MSH,SNOMEDCT_US,RXNORM \
+    --exclude-suppressed --maxdists 1 2
 """
 
 from __future__ import annotations
@@ -50,6 +69,22 @@ def _percentiles(values: List[float], points=(50, 90, 95, 99)) -> dict:
     return {f"p{p}": at(p) for p in points}
 
 
+def _mutate(s: str) -> str:
+    """Apply one random substitution, insertion or deletion."""
+    if not s:
+        return s
+    ops = ["sub", "ins", "del"]
+    op = random.choice(ops)
+    pos = random.randrange(len(s))
+    ch = random.choice("abcdefghijklmnopqrstuvwxyz")
+    if op == "sub":
+        return s[:pos] + ch + s[pos + 1:]
+    if op == "ins":
+        return s[:pos] + ch + s[pos:]
+    # del
+    return s[:pos] + s[pos + 1:]
+
+
 # --------------------------- Remote benchmark ---------------------------------
 
 async def _remote_worker(client, sem, base_url: str, endpoint: str, payload: dict, results: list):
@@ -113,23 +148,9 @@ async def run_remote_bench(args) -> dict:
     # Randomly sample the requested number of queries and add noisy variants
     base_queries = random.sample(queries, min(args.queries, len(queries)))
 
-    def mutate(s: str) -> str:
-        if not s:
-            return s
-        ops = ["sub", "ins", "del"]
-        op = random.choice(ops)
-        pos = random.randrange(len(s))
-        ch = random.choice("abcdefghijklmnopqrstuvwxyz")
-        if op == "sub":
-            return s[:pos] + ch + s[pos + 1:]
-        if op == "ins":
-            return s[:pos] + ch + s[pos:]
-        # del
-        return s[:pos] + s[pos + 1:]
-
     prepared = []
     for q in base_queries:
-        q2 = mutate(q) if args.maxdist >= 1 else q
+        q2 = _mutate(q) if args.maxdist >= 1 else q
         prepared.append({"query": q2, "maxdist": args.maxdist})
 
     sem = asyncio.Semaphore(args.concurrency)
@@ -239,6 +260,221 @@ def run_local_bench(args) -> dict:
     return summary
 
 
+def run_layout_bench(args) -> dict:
+    """Compare a single BK-tree against a length-partitioned forest on the same queries.
+
+    Queries are sampled from the terms file with one random edit, so their lengths follow the
+    corpus distribution. For each maxdist the report gives the mean number of nodes whose distance
+    was computed and the per-query latency of both layouts.
+    """
+    from cppmatch import BKTree, ShardedBKTree
+
+    if not args.terms or not os.path.exists(args.terms):
+        raise RuntimeError("--terms is required for layout mode and must exist")
+
+    terms = load_terms(args.terms, args.limit_terms)
+    if not terms:
+        raise RuntimeError("No terms loaded")
+
+    t0 = time.time()
+    single = BKTree.build(terms)
+    single_build = time.time() - t0
+
+    lengths = sorted(len(t.encode("utf-8")) for t in terms)
+    shards = args.shards or max(1, lengths[int(0.99 * (len(lengths) - 1))] // args.band + 1)
+    t0 = time.time()
+    forest = ShardedBKTree.build(terms, shards, 0, "length", args.band)
+    forest_build = time.time() - t0
+
+    random.seed(args.seed)
+    queries = [_mutate(q) for q in random.sample(terms, min(args.queries, len(terms)))]
+
+    def measure(tree, maxdist: int) -> dict:
+        visited = sum(tree.count_visited(q, maxdist) for q in queries)
+        latencies = []
+        for q in queries:
+            t = time.perf_counter()
+            tree.search(q, maxdist)
+            latencies.append((time.perf_counter() - t) * 1000)
+        pct = _percentiles(latencies, (50, 95))
+        return {
+            "visited_mean": round(visited / len(queries), 1),
+            "latency_ms_mean": round(sum(latencies) / len(latencies), 4),
+            "latency_ms_p50": round(pct["p50"], 4),
+            "latency_ms_p95": round(pct["p95"], 4),
+        }
+
+    by_maxdist = {}
+    for maxdist in args.maxdists:
+        base, banded = measure(single, maxdist), measure(forest, maxdist)
+        by_maxdist[str(maxdist)] = {
+            "single": base,
+            "length": banded,
+            "visited_ratio": round(banded["visited_mean"] / max(base["visited_mean"], 1e-9), 3),
+            "speedup": round(base["latency_ms_mean"] / max(banded["latency_ms_mean"], 1e-9), 2),
+        }
+
+    return {
+        "mode": "layout",
+        "terms": len(terms),
+        "queries": len(queries),
+        "length_p50": lengths[len(lengths) // 2],
+        "length_p99": lengths[int(0.99 * (len(lengths) - 1))],
+        "shards": shards,
+        "band": args.band,
+        "shard_sizes": forest.shard_sizes(),
+        "single_build_sec": round(single_build, 3),
+        "length_build_sec": round(forest_build, 3),
+        "by_maxdist": by_maxdist,
+    }
+
+
+def run_coldstart_bench(args) -> dict:
+    """Time the service's artifact loader on the same tree packaged with each codec.
+
+    Every artifact is loaded ``--repeats`` times and the best time is kept. The artifacts sit in
+    the page cache after the first load, so this compares decompression and tree loading, not
+    disk or network throughput.
+    """
+    import tempfile
+
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if repo_root not in sys.path:
+        sys.path.insert(0, repo_root)
+    import app  # noqa: E402  (the loader under test)
+    from artifact_codec import SUFFIXES, open_archive_writer
+
+    if not args.terms or not os.path.exists(args.terms):
+        raise RuntimeError("--terms is required for coldstart mode and must exist")
+
+    terms = load_terms(args.terms, args.limit_terms)
+    if not terms:
+        raise RuntimeError("No terms loaded")
+    tree = app.BKTree.build(terms)
+
+    by_compression = {}
+    with tempfile.TemporaryDirectory(prefix="coldstart_") as tmp:
+        work_dir = Path(tmp)
+        image_path = work_dir / "bktree2.bin"
+        tree.save_mmap(str(image_path))
+        metadata_path = work_dir / "metadata.json"
+        metadata_path.write_text(json.dumps({"schema_version": 1, "term_count": len(terms)}), encoding="utf-8")
+        image_mib = image_path.stat().st_size / (1024 * 1024)
+
+        for compression in args.compressions:
+            archive_path = work_dir / f"artifact{SUFFIXES[compression]}"
+            t0 = time.perf_counter()
+            with open_archive_writer(str(archive_path), compression) as tar:
+                tar.add(image_path, arcname="bktree2.bin")
+                tar.add(metadata_path, arcname="metadata.json")
+            write_sec = time.perf_counter() - t0
+
+            loads = []
+            for _ in range(args.repeats):
+                t0 = time.perf_counter()
+                loaded, _ = app._load_bktree_artifact(str(archive_path))
+                loads.append(time.perf_counter() - t0)
+                if len(loaded) != len(tree):
+                    raise RuntimeError(f"{compression} artifact loaded {len(loaded)} of {len(tree)} terms")
+            best = min(loads)
+            by_compression[compression] = {
+                "artifact_mib": round(archive_path.stat().st_size / (1024 * 1024), 2),
+                "ratio": round(image_mib / max(archive_path.stat().st_size / (1024 * 1024), 1e-9), 2),
+                "write_sec": round(write_sec, 3),
+                "load_sec": round(best, 3),
+                "load_mib_per_sec": round(image_mib / max(best, 1e-9), 1),
+            }
+
+    return {
+        "mode": "coldstart",
+        "terms": len(terms),
+        "image_mib": round(image_mib, 2),
+        "repeats": args.repeats,
+        "by_compression": by_compression,
+    }
+
+
+def run_filter_bench(args) -> dict:
+    """Compare an index of every MRCONSO row with one of the rows a term filter keeps.
+
+    Both indexes are built like the service builds them: ``iter_rrf_terms`` (with the filter's
+    column filters for the second), repeats dropped, ``BKTree.build``. Queries are terms of the
+    filtered index with one random edit, i.e. what a filtered deployment is searched with, and
+    run against both trees. Sizes are of the BKTREE2 images.
+    """
+    import tempfile
+
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if repo_root not in sys.path:
+        sys.path.insert(0, repo_root)
+    from cppmatch import BKTree, iter_rrf_terms
+    from term_filters import TermFilter
+
+    if not args.mrconso or not os.path.exists(args.mrconso):
+        raise RuntimeError("--mrconso is required for filter mode and must exist")
+    term_filter = TermFilter(args.langs.split(","), args.sabs.split(","), args.exclude_suppressed)
+    if not term_filter.active:
+        raise RuntimeError("filter mode needs at least one of --langs, --sabs or --exclude-suppressed")
+
+    def build(rrf_filters) -> tuple:
+        t0 = time.perf_counter()
+        reader = iter_rrf_terms(args.mrconso, 14, rrf_filters)
+        terms = list(dict.fromkeys(term for batch in reader for term in batch))
+        parse_sec = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        tree = BKTree.build(terms, args.build_threads)
+        return tree, terms, reader.rows, parse_sec, time.perf_counter() - t0
+
+    every = build(None)
+    kept = build(term_filter.rrf_filters())
+    if not kept[1]:
+        raise RuntimeError(f"Term filter {term_filter} kept no rows")
+
+    random.seed(args.seed)
+    queries = [_mutate(q) for q in random.sample(kept[1], min(args.queries, len(kept[1])))]
+
+    indexes = {}
+    with tempfile.TemporaryDirectory(prefix="filter_bench_") as tmp:
+        for name, (tree, terms, rows, parse_sec, build_sec) in (("every_row", every), ("filtered", kept)):
+            image_path = Path(tmp) / f"{name}.bin"
+            tree.save_mmap(str(image_path))
+            by_maxdist = {}
+            for maxdist in args.maxdists:
+                latencies = []
+                for q in queries:
+                    t = time.perf_counter()
+                    tree.search(q, maxdist)
+                    latencies.append((time.perf_counter() - t) * 1000)
+                pct = _percentiles(latencies, (50, 95))
+                by_maxdist[str(maxdist)] = {
+                    "latency_ms_mean": round(sum(latencies) / len(latencies), 4),
+                    "latency_ms_p50": round(pct["p50"], 4),
+                    "latency_ms_p95": round(pct["p95"], 4),
+                }
+            indexes[name] = {
+                "rows": rows,
+                "terms": len(terms),
+                "image_mib": round(image_path.stat().st_size / (1024 * 1024), 2),
+                "parse_sec": round(parse_sec, 3),
+                "build_sec": round(build_sec, 3),
+                "by_maxdist": by_maxdist,
+            }
+
+    full, filtered = indexes["every_row"], indexes["filtered"]
+    return {
+        "mode": "filter",
+        "term_filter": term_filter.as_dict(),
+        "queries": len(queries),
+        "indexes": indexes,
+        "term_ratio": round(filtered["terms"] / max(full["terms"], 1), 3),
+        "image_ratio": round(filtered["image_mib"] / max(full["image_mib"], 1e-9), 3),
+        "speedup_by_maxdist": {
+            key: round(full["by_maxdist"][key]["latency_ms_mean"] / max(value["latency_ms_mean"], 1e-9), 2)
+            for key, value in filtered["by_maxdist"].items()
+        },
+    }
+
+
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="Massive-ish benchmark harness")
     sub = p.add_subparsers(dest="mode", required=True)
@@ -263,6 +499,36 @@ def parse_args() -> argparse.Namespace:
     pl.add_argument("--skip-python", action="store_true", help="Skip the Python baseline timing")
     pl.add_argument("--out-json", help="Write summary JSON to this path")
 
+    # layout subcommand
+    py = sub.add_parser("layout", help="Compare single-tree and length-partitioned index layouts")
+    py.add_argument("--terms", required=True, help="Terms file (RRF or terms)")
+    py.add_argument("--limit-terms", type=int, help="Optional cap when reading terms file")
+    py.add_argument("--queries", type=int, default=500, help="Number of queries")
+    py.add_argument("--maxdists", type=int, nargs="+", default=[1, 2, 3], help="Max distances to compare")
+    py.add_argument("--band", type=int, default=1, help="Byte-length band width per shard")
+    py.add_argument("--shards", type=int, default=0, help="Shard count (0 = cover the p99 term length)")
+    py.add_argument("--seed", type=int, default=0, help="Random seed for query sampling")
+    py.add_argument("--out-json", help="Write summary JSON to this path")
+
+    pc = sub.add_parser("coldstart", help="Compare artifact load times across compression codecs")
+    pc.add_argument("--terms", required=True, help="Terms file (RRF or terms)")
+    pc.add_argument("--limit-terms", type=int, help="Optional cap when reading terms file")
+    pc.add_argument("--compressions", nargs="+", choices=["gzip", "zstd", "none"],
+                    default=["gzip", "zstd", "none"], help="Codecs to compare")
+    pc.add_argument("--repeats", type=int, default=3, help="Loads per codec (best is reported)")
+    pc.add_argument("--out-json", help="Write summary JSON to this path")
+
+    pf = sub.add_parser("filter", help="Compare index size and latency with and without a term filter")
+    pf.add_argument("--mrconso", required=True, help="MRCONSO.RRF file")
+    pf.add_argument("--langs", default="", help="Comma-separated LAT values to keep (e.g. ENG)")
+    pf.add_argument("--sabs", default="", help="Comma-separated SAB values to keep")
+    pf.add_argument("--exclude-suppressed", action="store_true", help="Keep only SUPPRESS=N rows")
+    pf.add_argument("--queries", type=int, default=500, help="Number of queries")
+    pf.add_argument("--maxdists", type=int, nargs="+", default=[1, 2], help="Max distances to compare")
+    pf.add_argument("--build-threads", type=int, default=0, help="BKTree.build threads (0 = all cores)")
+    pf.add_argument("--seed", type=int, default=0, help="Random seed for query sampling")
+    pf.add_argument("--out-json", help="Write summary JSON to this path")
+
     return p.parse_args()
 
 
@@ -270,6 +536,12 @@ def main() -> None:
     args = parse_args()
     if args.mode == "remote":
         summary = asyncio.run(run_remote_bench(args))
+    elif args.mode == "layout":
+        summary = run_layout_bench(args)
+    elif args.mode == "coldstart":
+        summary = run_coldstart_bench(args)
+    elif args.mode == "filter":
+        summary = run_filter_bench(args)
     else:
         summary = run_local_bench(args)
 
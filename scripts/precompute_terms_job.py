@@ -3,10 +3,11 @@
 
 This Cloud Run Job performs the following steps:
 1. Download ``MRCONSO.RRF`` (or a compatible cache) from GCS.
-2. Parse the file and construct the BK-tree in memory using the shared ``cppmatch``
-    extension.
+2. Parse the file (RRF rows natively, with ``cppmatch.iter_rrf_terms``), drop repeated terms
+    and construct the BK-tree in memory using the shared ``cppmatch`` extension.
 3. Serialize the constructed BK-tree to a binary artifact on disk.
-4. Bundle metadata alongside the tree and upload the archive to GCS for reuse.
+4. Bundle metadata (including the tree shape from ``BKTree.stats()``) alongside the tree and
+    upload the archive to GCS for reuse.
 5. Emit a JSON summary to stdout before exiting.
 
 Environment variables (overridable via CLI flags):
@@ -14,6 +15,31 @@ Environment variables (overridable via CLI flags):
 - MRCONSO_FORMAT: input format, ``rrf`` (default) or ``terms``
 - BKTREE_ARTIFACT_PATH: gs:// destination for the serialized BK-tree
 - MAX_TERMS: optional cap to limit the number of terms (testing only)
+- BKTREE_TREE_FORMAT: ``bktree2`` (default, memory-mappable) or legacy ``bktree1``
+- BUILD_THREADS: worker threads for ``BKTree.build`` (``0``, the default, uses every core)
+- BKTREE_SHARDS: when > 0, partition terms into this many independent BKTREE2 shards
+  (``shards/shard-NNNN.bin`` members) that the service can load incrementally
+- BKTREE_SHARD_PARTITION: ``hash`` (default, balanced shards) or ``length`` (shard ``i`` holds
+  terms of ``i * band`` to ``(i + 1) * band - 1`` bytes, the last shard everything longer), which
+  lets searches skip shards outside ``len(query) +/- maxdist``
+- BKTREE_SHARD_BAND: byte-length band width for ``length`` partitioning (default ``1``)
+- BKTREE_COMPRESSION: artifact codec, ``gzip`` (default, ``.tar.gz``), ``zstd`` (``.tar.zst``,
+  multithreaded; needs the ``zstandard`` package) or ``none`` (plain ``.tar``). The service
+  detects the codec from the artifact's leading bytes
+- BKTREE_COMPRESSION_LEVEL: optional codec level (zstd defaults to 3, gzip to 9)
+- TERMS_DEDUP: drop repeated terms before the build (default ``1``); the tree is the same, minus
+  one wasted insert walk per repeat
+- TERMS_DEDUP_MEMORY_BYTES: memory budget of the dedup set (default 1 GiB); past it, sorted runs
+  are spilled to the work directory and merged (an external sort). It bounds the dedup step
+  only: the unique terms are then held as one list for ``BKTree.build``
+- TERMS_SORT: build from the unique terms in sorted order rather than first-seen order
+- MRCONSO_LANGS / MRCONSO_SABS: comma-separated LAT / SAB values; only rows with one of them are
+  indexed (default: every language / source)
+- MRCONSO_EXCLUDE_SUPPRESSED: index only ``SUPPRESS=N`` rows. The filter is recorded in
+  ``metadata.json`` as ``term_filter``; a service configured with a filter only loads artifacts
+  built with the same one. Filters need RRF input: the job refuses them for a ``terms`` source
+- TERMS_ARTIFACT_PATH: optional gs:// or local destination for the unique terms, one per line,
+  which the service loads with ``MRCONSO_FORMAT=terms``
 - JOB_TMP_DIR: optional directory for temporary downloads (defaults to ``/tmp``)
 """
 
@@ -33,8 +59,6 @@ from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Tuple
 
-from google.cloud import storage
-
 # Ensure the repository root is importable when running inside Cloud Run Jobs
 REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if REPO_ROOT not in sys.path:
@@ -42,6 +66,9 @@ if REPO_ROOT not in sys.path:
 
 # Import the shared MRCONSO helpers without triggering FastAPI startup
 import app  # type: ignore  # noqa: E402
+from artifact_codec import COMPRESSIONS, CONTENT_TYPES, SUFFIXES, open_archive_writer  # noqa: E402
+from term_dedup import DEFAULT_MEMORY_BYTES, DedupStats, unique_terms, write_terms  # noqa: E402
+from term_filters import TermFilter  # noqa: E402
 
 
 logger = logging.getLogger("precompute_terms_job")
@@ -55,6 +82,8 @@ def _ensure_local_copy(source: str, tmp_dir: str | None) -> Tuple[str, bool]:
         logger.info("Using local MRCONSO source at %s", source)
         return source, False
 
+    from google.cloud import storage  # Lazy import so local runs do not need the GCS client.
+
     client = storage.Client()
     bucket_name, blob_name = source.replace("gs://", "", 1).split("/", 1)
     blob = client.bucket(bucket_name).blob(blob_name)
@@ -71,51 +100,158 @@ def _ensure_local_copy(source: str, tmp_dir: str | None) -> Tuple[str, bool]:
     return tmp_path, True
 
 
-def _build_bktree(local_path: str, source_format: str, max_terms: int) -> Tuple[app.BKTree, int]:
-    """Parse MRCONSO and construct a BK-tree in memory."""
+def _parse_terms(local_path: str, source_format: str, max_terms: int, dedup: bool = True,
+                 memory_bytes: int = DEFAULT_MEMORY_BYTES, sort: bool = False,
+                 spill_dir: str | None = None,
+                 term_filter: TermFilter | None = None) -> Tuple[list[str], DedupStats, dict[str, Any]]:
+    """Parse MRCONSO into the list of terms to index, without repeats unless ``dedup`` is off.
 
-    tree = app.BKTree()
-    term_count = 0
+    The list holds every unique term at once (``BKTree.build`` needs them all), so
+    ``memory_bytes`` bounds the dedup set, not the parse. Only rows matching ``term_filter`` are
+    kept; term caches have no columns to filter on, so a filter on one raises ValueError. Returns the terms, the dedup counts and the parser's
+    throughput (RRF sources only).
+    """
+
+    term_filter = term_filter or TermFilter()
+    if term_filter.active and source_format.lower() == "terms":
+        raise ValueError(f"Term filter {term_filter} cannot be applied to a terms cache (no LAT/SAB/SUPPRESS columns)")
     app.MRCONSO_FORMAT = source_format.lower()
+    app.TERM_FILTER = term_filter
+    stats = DedupStats()
+    parse_stats: dict[str, Any] = {}
+
+    logger.info("Parsing terms from %s (format=%s, dedup=%s, sort=%s, term filter: %s)", local_path,
+                app.MRCONSO_FORMAT, dedup, sort, app.TERM_FILTER)
+    parse_start = time.time()
+
+    with app._open_mrconso(local_path) as handle:
+        rows = app._limit_terms(app._iter_terms(handle, parse_stats), max_terms)
+        if dedup:
+            terms = list(unique_terms(rows, memory_bytes=memory_bytes, spill_dir=spill_dir, sort=sort,
+                                      stats=stats))
+        else:
+            terms = list(rows)
+            stats.raw = stats.unique = len(terms)
+
+    logger.info(
+        "Parsed %d terms (%d unique, %d spill runs) in %.2fs",
+        stats.raw,
+        stats.unique,
+        stats.runs,
+        time.time() - parse_start,
+    )
+    return terms, stats, parse_stats
+
+
+def _build_bktree(terms: list[str], build_threads: int = 0, shards: int = 0, partition: str = "hash",
+                  band: int = 1) -> Tuple[app.BKTree | app.ShardedBKTree, float]:
+    """Construct the BK-tree (or sharded forest) in memory; returns it with the build seconds."""
 
-    logger.info("Building BK-tree from %s (format=%s)", local_path, app.MRCONSO_FORMAT)
     build_start = time.time()
+    if shards > 0:
+        tree = app.ShardedBKTree.build(terms, shards, build_threads, partition, band)
+    else:
+        tree = app.BKTree.build(terms, build_threads)
+    build_seconds = time.time() - build_start
+    logger.info(
+        "BK-tree build finished in %.2fs (terms=%d, threads=%s, shards=%s, partition=%s)",
+        build_seconds,
+        len(terms),
+        build_threads or "all",
+        shards or "none",
+        partition if shards > 0 else "none",
+    )
+    return tree, build_seconds
+
+
+def _tree_stats(tree: app.BKTree | app.ShardedBKTree) -> dict[str, Any]:
+    """Shape of the built tree for metadata.json (histogram keys become strings in JSON)."""
+
+    start = time.time()
+    stats = tree.stats()
+    logger.info(
+        "Tree stats in %.2fs: max_depth=%d mean_depth=%.2f max_fanout=%d leaves=%d",
+        time.time() - start,
+        stats["max_depth"],
+        stats["mean_depth"],
+        stats["max_fanout"],
+        stats["leaves"],
+    )
+    return stats
+
+
+TREE_MEMBERS = {"bktree1": "bktree.bin", "bktree2": "bktree2.bin"}
+
+
+def _shard_member(index: int) -> str:
+    return f"shards/shard-{index:04d}.bin"
+
+
+def _package_sharded_tree(forest: app.ShardedBKTree, metadata: dict[str, Any], work_dir: Path,
+                          compression: str = "gzip", compression_level: int | None = None) -> Path:
+    """Write one BKTREE2 member per shard, with metadata.json first so loaders can plan ahead."""
+
+    members = [_shard_member(index) for index in range(forest.shard_count)]
+    metadata = {
+        **metadata,
+        "shards": forest.shard_count,
+        "shard_members": members,
+        "shard_partition": "fnv1a64" if forest.partition == "hash" else "length",
+        "shard_band": forest.band,
+        "shard_term_counts": forest.shard_sizes(),
+        "tree_encoding": "sharded-bktree2",
+    }
+    metadata_path = work_dir / "metadata.json"
+    archive_path = work_dir / f"mrconso_bktree{SUFFIXES[compression]}"
+    metadata_path.write_text(json.dumps(metadata, indent=2, sort_keys=True), encoding="utf-8")
 
-    with open(local_path, "r", encoding="utf-8", errors="ignore", buffering=1 << 20) as handle:
-        for idx, term in enumerate(app._iter_terms(handle), start=1):
-            tree.insert(term)
-            term_count = idx
-            if max_terms and idx >= max_terms:
-                logger.warning("Reached MAX_TERMS=%d; stopping early", max_terms)
-                break
-            if idx % 500_000 == 0:
-                logger.info("Inserted %d terms into BK-tree", idx)
+    logger.info("Creating sharded artifact archive %s (%d shards, compression=%s)", archive_path,
+                forest.shard_count, compression)
+    start = time.time()
+    with open_archive_writer(str(archive_path), compression, level=compression_level) as tar:
+        tar.add(metadata_path, arcname="metadata.json")
+        for index, member in enumerate(members):
+            shard_path = work_dir / f"shard-{index:04d}.bin"
+            forest.save_shard(index, str(shard_path))
+            tar.add(shard_path, arcname=member)
+            shard_path.unlink()
+    logger.info("Archive written in %.2fs (%.1f MiB)", time.time() - start, archive_path.stat().st_size / (1024 * 1024))
 
-    logger.info("BK-tree build finished in %.2fs (terms=%d)", time.time() - build_start, term_count)
-    return tree, term_count
+    return archive_path
 
 
-def _package_tree(tree: app.BKTree, metadata: dict[str, Any], work_dir: Path) -> Path:
+def _package_tree(tree: app.BKTree | app.ShardedBKTree, metadata: dict[str, Any], work_dir: Path,
+                  tree_format: str = "bktree2", compression: str = "gzip",
+                  compression_level: int | None = None) -> Path:
     """Persist the BK-tree and metadata locally and return archive path."""
 
-    binary_path = work_dir / "bktree.bin"
+    if isinstance(tree, app.ShardedBKTree):
+        return _package_sharded_tree(tree, metadata, work_dir, compression, compression_level)
+
+    member = TREE_MEMBERS[tree_format]
+    binary_path = work_dir / member
     metadata_path = work_dir / "metadata.json"
-    archive_path = work_dir / "mrconso_bktree.tar.gz"
+    archive_path = work_dir / f"mrconso_bktree{SUFFIXES[compression]}"
 
-    logger.info("Serializing BK-tree to %s", binary_path)
-    tree.save(str(binary_path))
+    logger.info("Serializing BK-tree to %s (format=%s)", binary_path, tree_format)
+    if tree_format == "bktree2":
+        tree.save_mmap(str(binary_path))
+    else:
+        tree.save(str(binary_path))
 
     metadata_path.write_text(json.dumps(metadata, indent=2, sort_keys=True), encoding="utf-8")
 
-    logger.info("Creating artifact archive %s", archive_path)
-    with tarfile.open(archive_path, "w:gz") as tar:
-        tar.add(binary_path, arcname="bktree.bin")
+    logger.info("Creating artifact archive %s (compression=%s)", archive_path, compression)
+    start = time.time()
+    with open_archive_writer(str(archive_path), compression, level=compression_level) as tar:
+        tar.add(binary_path, arcname=member)
         tar.add(metadata_path, arcname="metadata.json")
+    logger.info("Archive written in %.2fs (%.1f MiB)", time.time() - start, archive_path.stat().st_size / (1024 * 1024))
 
     return archive_path
 
 
-def _upload_artifact(destination: str, source_path: Path) -> dict[str, Any]:
+def _upload_artifact(destination: str, source_path: Path, content_type: str = "application/gzip") -> dict[str, Any]:
     """Persist the archive to GCS or a local destination."""
 
     upload_start = time.time()
@@ -126,12 +262,14 @@ def _upload_artifact(destination: str, source_path: Path) -> dict[str, Any]:
     }
 
     if destination.startswith("gs://"):
+        from google.cloud import storage  # Lazy import so local runs do not need the GCS client.
+
         client = storage.Client()
         bucket_name, blob_name = destination.replace("gs://", "", 1).split("/", 1)
         bucket = client.bucket(bucket_name)
         artifact = bucket.blob(blob_name)
         logger.info("Uploading artifact to gs://%s/%s", bucket_name, blob_name)
-        artifact.upload_from_filename(str(source_path), content_type="application/gzip")
+        artifact.upload_from_filename(str(source_path), content_type=content_type)
         info["bucket"] = bucket_name
         info["object"] = blob_name
     else:
@@ -153,6 +291,87 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--artifact", default=os.getenv("BKTREE_ARTIFACT_PATH"), help="Artifact destination (gs:// or local)")
     parser.add_argument("--max-terms", type=int, default=int(os.getenv("MAX_TERMS", "0") or 0), help="Optional term cap")
     parser.add_argument("--tmp-dir", default=os.getenv("JOB_TMP_DIR"), help="Temporary directory for downloads")
+    parser.add_argument(
+        "--tree-format",
+        choices=sorted(TREE_MEMBERS),
+        default=os.getenv("BKTREE_TREE_FORMAT", "bktree2").lower(),
+        help="Serialized tree format (bktree2 can be memory-mapped by the service)",
+    )
+    parser.add_argument(
+        "--build-threads",
+        type=int,
+        default=int(os.getenv("BUILD_THREADS", "0") or 0),
+        help="Worker threads for the BK-tree build (0 = all cores)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=int(os.getenv("BKTREE_SHARDS", "0") or 0),
+        help="Partition into this many BKTREE2 shards (0 = single tree)",
+    )
+    parser.add_argument(
+        "--shard-partition",
+        choices=("hash", "length"),
+        default=os.getenv("BKTREE_SHARD_PARTITION", "hash").lower(),
+        help="Assign terms to shards by hash (balanced) or by byte-length band (prunes by length)",
+    )
+    parser.add_argument(
+        "--shard-band",
+        type=int,
+        default=int(os.getenv("BKTREE_SHARD_BAND", "1") or 1),
+        help="Byte-length band width per shard for --shard-partition=length",
+    )
+    parser.add_argument(
+        "--dedup",
+        action=argparse.BooleanOptionalAction,
+        default=app._parse_bool(os.getenv("TERMS_DEDUP"), default=True),
+        help="Drop repeated terms before the build",
+    )
+    parser.add_argument(
+        "--dedup-memory-bytes",
+        type=int,
+        default=int(os.getenv("TERMS_DEDUP_MEMORY_BYTES", str(DEFAULT_MEMORY_BYTES)) or 0),
+        help="Dedup set budget before spilling sorted runs to the work directory (0 = never spill)",
+    )
+    parser.add_argument(
+        "--sort-terms",
+        action=argparse.BooleanOptionalAction,
+        default=app._parse_bool(os.getenv("TERMS_SORT")),
+        help="Build from the unique terms in sorted order",
+    )
+    parser.add_argument(
+        "--langs",
+        default=os.getenv("MRCONSO_LANGS", ""),
+        help="Comma-separated LAT values to index (default: every language)",
+    )
+    parser.add_argument(
+        "--sabs",
+        default=os.getenv("MRCONSO_SABS", ""),
+        help="Comma-separated SAB values to index (default: every source)",
+    )
+    parser.add_argument(
+        "--exclude-suppressed",
+        action=argparse.BooleanOptionalAction,
+        default=app._parse_bool(os.getenv("MRCONSO_EXCLUDE_SUPPRESSED")),
+        help="Index only rows with SUPPRESS=N",
+    )
+    parser.add_argument(
+        "--terms-artifact",
+        default=os.getenv("TERMS_ARTIFACT_PATH"),
+        help="Also publish the unique terms, one per line, to this gs:// or local path",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=COMPRESSIONS,
+        default=os.getenv("BKTREE_COMPRESSION", "gzip").lower(),
+        help="Artifact codec: gzip (.tar.gz), zstd (.tar.zst, multithreaded) or none (.tar)",
+    )
+    parser.add_argument(
+        "--compression-level",
+        type=int,
+        default=int(os.getenv("BKTREE_COMPRESSION_LEVEL", "0") or 0) or None,
+        help="Codec level (default: zstd 3, gzip 9)",
+    )
     return parser.parse_args()
 
 
@@ -166,6 +385,12 @@ def main() -> None:
         logger.error("Artifact destination (BKTREE_ARTIFACT_PATH) is required")
         sys.exit(2)
 
+    term_filter = TermFilter(args.langs.split(","), args.sabs.split(","), args.exclude_suppressed)
+    if term_filter.active and args.source_format.lower() == "terms":
+        # metadata.json would claim a filter that was never applied
+        logger.error("Term filter %s needs RRF input; a terms cache has no LAT/SAB/SUPPRESS columns", term_filter)
+        sys.exit(2)
+
     overall_start = time.time()
     status = 0
 
@@ -174,6 +399,7 @@ def main() -> None:
         "source": args.source,
         "artifact": args.artifact,
         "max_terms": args.max_terms or None,
+        "term_filter": term_filter.as_dict(),
     }
 
     try:
@@ -183,8 +409,41 @@ def main() -> None:
             local_path, should_cleanup = _ensure_local_copy(args.source, work_dir_str)
             summary["local_source"] = local_path
 
-            tree, term_count = _build_bktree(local_path, args.source_format, args.max_terms)
+            terms, dedup, parse_stats = _parse_terms(
+                local_path,
+                args.source_format,
+                args.max_terms,
+                args.dedup,
+                args.dedup_memory_bytes,
+                args.sort_terms,
+                work_dir_str,
+                term_filter,
+            )
+            term_count = len(terms)
+            if parse_stats:
+                summary["parse"] = parse_stats
+            if args.terms_artifact:
+                terms_path = work_dir / "mrconso_terms.txt"
+                write_terms(terms, terms_path)
+                summary["terms_artifact"] = _upload_artifact(args.terms_artifact, terms_path, "text/plain")
+
+            tree, build_seconds = _build_bktree(
+                terms,
+                args.build_threads,
+                args.shards,
+                args.shard_partition,
+                args.shard_band,
+            )
+            del terms
             summary["term_count"] = term_count
+            summary["dedup"] = {
+                **dedup.as_dict(),
+                "build_seconds": round(build_seconds, 3),
+                # Upper bound: each repeat charged the mean cost of a unique insert.
+                "estimated_build_seconds_saved": round(
+                    build_seconds * dedup.duplicates / term_count if term_count else 0.0, 3
+                ),
+            }
 
             metadata = {
                 "schema_version": 1,
@@ -193,13 +452,24 @@ def main() -> None:
                 "source_format": args.source_format.lower(),
                 "max_terms": args.max_terms or None,
                 "term_count": term_count,
-                "artifact_type": "tar.gz",
-                "tree_encoding": "bktree.bin",
+                "raw_term_count": dedup.raw,
+                "term_filter": term_filter.as_dict(),
+                "terms_sorted": args.sort_terms or dedup.runs > 0,
+                "artifact_type": SUFFIXES[args.compression].lstrip("."),
+                "compression": args.compression,
+                "tree_encoding": TREE_MEMBERS[args.tree_format],
+                "tree_stats": _tree_stats(tree),
+            }
+            summary["tree_shape"] = {
+                key: value for key, value in metadata["tree_stats"].items() if not key.endswith("_histogram")
             }
 
-            archive_path = _package_tree(tree, metadata, work_dir)
+            archive_path = _package_tree(
+                tree, metadata, work_dir, args.tree_format, args.compression, args.compression_level
+            )
             summary["archive_path"] = str(archive_path)
-            summary.update(_upload_artifact(args.artifact, archive_path))
+            summary["compression"] = args.compression
+            summary.update(_upload_artifact(args.artifact, archive_path, CONTENT_TYPES[args.compression]))
             summary["status"] = "success"
 
             if should_cleanup:
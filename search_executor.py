@@ -0,0 +1,255 @@
+"""Bounded executor that keeps CPU-bound searches off the asyncio event loop.
+
+The C++ bindings release the GIL while searching, so a thread pool gives real parallelism and is
+the default. ``mode="process"`` runs searches in worker processes instead, each mapping the index
+from a BKTREE2 image, for builds of the extension that still hold the GIL.
+
+Every submission takes a slot out of ``workers + queue_size``. When none is free the request is
+rejected up front (:class:`ExecutorSaturated`, surfaced as HTTP 429) instead of queueing without
+bound, and a request that waits longer than ``timeout`` raises :class:`asyncio.TimeoutError`
+(HTTP 503). A timed-out search cannot be interrupted, so its slot is only released once it
+actually finishes.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable
+
+from cppmatch import BKTree, ShardedBKTree
+from rapidfuzz.distance import Levenshtein
+
+logger = logging.getLogger("search_mrconso_service")
+
+EXECUTOR_MODES = ("thread", "process")
+
+
+class ExecutorSaturated(RuntimeError):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+# ---------------------------------------------------------------------------
+# Search operations. Each takes the bound (tree, terms) first so the same function runs unchanged
+# in a pool thread or, by reference, in a worker process.
+# ---------------------------------------------------------------------------
+
+def bktree_search(tree: BKTree, terms: list[str], query: str, maxdist: int, k: int | None = None):
+    if k is not None and k >= 0:
+        return tree.search_topk(query, k, maxdist)
+    return tree.search(query, maxdist)
+
+
+def bktree_search_stats(tree: BKTree, terms: list[str], query: str, maxdist: int, k: int | None = None,
+                        best: bool = False):
+    """Like :func:`bktree_search`, returning ``(matches, stats)`` from ``search_with_stats``.
+
+    ``best`` keeps only the nearest matches: the exact hit from the tree's hash index if there is
+    one, otherwise the terms at the smallest distance up to ``maxdist`` that has any.
+    """
+    return tree.search_with_stats(query, maxdist, k if k is not None and k >= 0 else -1, best)
+
+
+def bktree_search_many(tree: BKTree, terms: list[str], queries: list[str], maxdists: list[int],
+                       threads: int, ks: list[int]):
+    return tree.search_many(queries, maxdists, threads, ks)
+
+
+def tree_stats(tree: BKTree, terms: list[str]) -> dict:
+    return tree.stats()
+
+
+def python_search(tree: BKTree, terms: list[str], query: str) -> tuple[str, int]:
+    best = min(terms, key=lambda t: Levenshtein.distance(query, t))
+    return best, int(Levenshtein.distance(query, best))
+
+
+def benchmark_sample(tree: BKTree, terms: list[str], sample: list[str]) -> tuple[float, float]:
+    """Time BK-tree (maxdist=1) against the linear Python scan over the same queries."""
+    t0 = time.time()
+    for q in sample:
+        tree.search(q, 1)
+    bkt_time = time.time() - t0
+
+    t0 = time.time()
+    for q in sample:
+        _ = min(terms, key=lambda t: Levenshtein.distance(q, t))
+    py_time = time.time() - t0
+    return bkt_time, py_time
+
+
+_WORKER_TREE = BKTree()
+_WORKER_TERMS: list[str] = []
+
+
+def _init_worker(tree_path: str | dict[str, Any] | None, terms: list[str]) -> None:
+    global _WORKER_TREE, _WORKER_TERMS
+    if isinstance(tree_path, dict):
+        shard_paths = tree_path["shards"]
+        _WORKER_TREE = ShardedBKTree(len(shard_paths), tree_path["partition"], tree_path["band"])
+        for index, shard_path in enumerate(shard_paths):
+            _WORKER_TREE.load_shard(index, shard_path)
+    else:
+        _WORKER_TREE = BKTree.load_mmap(tree_path) if tree_path else BKTree()
+    _WORKER_TERMS = terms
+
+
+def _call_in_worker(fn: Callable[..., Any], *args: Any) -> Any:
+    return fn(_WORKER_TREE, _WORKER_TERMS, *args)
+
+
+def _remove_image(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+class SearchExecutor:
+    """Fixed-size worker pool with a bounded wait queue and per-request timeout."""
+
+    def __init__(self, mode: str = "thread", workers: int | None = None, queue_size: int = 64,
+                 timeout: float | None = None, tmp_dir: str | None = None):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown search executor mode {mode!r}; expected one of {EXECUTOR_MODES}")
+        self.mode = mode
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.queue_size = max(0, queue_size)
+        self.timeout = timeout if timeout and timeout > 0 else None
+        self._tmp_dir = tmp_dir
+        self._lock = Lock()
+        self._pool: Executor | None = None
+        self._tree = BKTree()
+        self._terms: list[str] = []
+        self._image: Path | None = None
+        self._active = 0
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+
+    def bind(self, tree: BKTree | ShardedBKTree, terms: list[str], tree_path: str | None = None) -> None:
+        """Point future searches at a newly loaded index.
+
+        Process workers map the index from ``tree_path`` (a BKTREE2 image); without one the tree is
+        written to a private temporary image (one per shard for a ShardedBKTree) first. Searches
+        already running finish on the old index.
+        """
+        if self.mode == "thread":
+            with self._lock:
+                self._tree, self._terms = tree, terms
+            return
+
+        old_image = self._image
+        image = None
+        worker_path: str | dict[str, Any] | None = tree_path
+        if isinstance(tree, ShardedBKTree):
+            image = Path(tempfile.mkdtemp(prefix="bktree-shards-", dir=self._tmp_dir))
+            shard_paths = []
+            for index in range(tree.shard_count):
+                shard_path = image / f"shard-{index:04d}.bin"
+                tree.save_shard(index, str(shard_path))
+                shard_paths.append(str(shard_path))
+            worker_path = {"shards": shard_paths, "partition": tree.partition, "band": tree.band}
+        elif tree_path is None and len(tree):
+            fd, name = tempfile.mkstemp(prefix="bktree-", suffix=".bin", dir=self._tmp_dir)
+            os.close(fd)
+            tree.save_mmap(name)
+            image = Path(name)
+            worker_path = name
+        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   initargs=(worker_path, terms))
+        logger.info("Search process pool (%d workers) bound to %s", self.workers, image or tree_path)
+        with self._lock:
+            old_pool, self._pool = self._pool, pool
+            self._image = image
+        if old_pool is not None:
+            old_pool.shutdown(wait=False)
+        if old_image is not None:
+            # Workers that still map it keep the pages alive after the unlink.
+            _remove_image(old_image)
+
+    async def run(self, fn: Callable[..., Any], *args: Any, timeout: float | None = None) -> Any:
+        """Run ``fn(tree, terms, *args)`` on the pool and await its result."""
+        with self._lock:
+            if self._pending >= self.workers + self.queue_size:
+                self._rejected += 1
+                raise ExecutorSaturated(
+                    f"Search queue full ({self.workers} workers, {self.queue_size} queued)"
+                )
+            self._pending += 1
+            pool = self._ensure_pool()
+            tree, terms = self._tree, self._terms
+
+        try:
+            if self.mode == "thread":
+                future = pool.submit(self._tracked, fn, tree, terms, *args)
+            else:
+                future = pool.submit(_call_in_worker, fn, *args)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+
+        limit = self.timeout if timeout is None else (timeout if timeout > 0 else None)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), limit)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timed_out += 1
+            raise
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            pending = self._pending
+            active = self._active if self.mode == "thread" else min(pending, self.workers)
+            return {
+                "mode": self.mode,
+                "workers": self.workers,
+                "active": active,
+                "queue_depth": max(0, pending - active),
+                "queue_size": self.queue_size,
+                "saturation": round(pending / (self.workers + self.queue_size), 3),
+                "timeout_seconds": self.timeout,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+            image, self._image = self._image, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        if image is not None:
+            _remove_image(image)
+
+    def _ensure_pool(self) -> Executor:
+        if self._pool is None:
+            if self.mode == "thread":
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="search")
+            else:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                 initargs=(None, []))
+        return self._pool
+
+    def _tracked(self, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            self._active += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _release(self, future: Future | None) -> None:
+        with self._lock:
+            self._pending -= 1
+            if future is not None and not future.cancelled():
+                self._completed += 1
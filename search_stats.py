@@ -0,0 +1,98 @@
+"""Per-query BK-tree search statistics.
+
+Every BK-tree search the service runs (cache misses and ``debug=true`` requests) reports the work
+it took: nodes visited, distance-kernel calls, pruned subtrees, the deepest node reached and the
+time spent in the tree. :class:`SearchStatsRecorder` folds those into fixed-bucket histograms,
+split by ``maxdist``, so the distributions behind a maxdist policy or index layout change can be
+read off ``/debug/search-stats`` without re-running benchmarks.
+"""
+
+from bisect import bisect_left
+from threading import Lock
+from typing import Any, Mapping
+
+# Upper bounds of the histogram buckets (powers of two); larger values land in "+Inf".
+COUNT_BUCKETS = tuple(2**i for i in range(21))
+DEPTH_BUCKETS = tuple(range(1, 33))
+ELAPSED_US_BUCKETS = tuple(2**i for i in range(24))
+
+# maxdist values beyond this share one histogram, keeping the label set bounded.
+_MAXDIST_CAP = 8
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a fixed set of upper bounds."""
+
+    __slots__ = ("bounds", "counts", "count", "total")
+
+    def __init__(self, bounds: tuple[int, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+
+    def observe(self, value: int) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def snapshot(self) -> dict[str, Any]:
+        buckets = []
+        running = 0
+        for bound, count in zip(self.bounds, self.counts):
+            running += count
+            buckets.append({"le": bound, "count": running})
+        buckets.append({"le": "+Inf", "count": self.count})
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": round(self.total / self.count, 3) if self.count else 0.0,
+            "buckets": buckets,
+        }
+
+
+def _new_histograms() -> dict[str, Histogram]:
+    return {
+        "visited": Histogram(COUNT_BUCKETS),
+        "distance_calls": Histogram(COUNT_BUCKETS),
+        "pruned": Histogram(COUNT_BUCKETS),
+        "max_depth": Histogram(DEPTH_BUCKETS),
+        "elapsed_us": Histogram(ELAPSED_US_BUCKETS),
+    }
+
+
+def maxdist_label(maxdist: int) -> str:
+    if maxdist < 0:
+        return "unbounded"
+    return str(maxdist) if maxdist < _MAXDIST_CAP else f"{_MAXDIST_CAP}+"
+
+
+class SearchStatsRecorder:
+    """Histograms of per-query search statistics, keyed by maxdist label."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._by_maxdist: dict[str, dict[str, Histogram]] = {}
+
+    def record(self, maxdist: int, stats: Mapping[str, int]) -> None:
+        label = maxdist_label(maxdist)
+        with self._lock:
+            histograms = self._by_maxdist.get(label)
+            if histograms is None:
+                histograms = self._by_maxdist[label] = _new_histograms()
+            histograms["visited"].observe(stats["visited"])
+            histograms["distance_calls"].observe(stats["distance_calls"])
+            histograms["pruned"].observe(stats["pruned"])
+            histograms["max_depth"].observe(stats["max_depth"])
+            histograms["elapsed_us"].observe(stats["elapsed_ns"] // 1000)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                label: {name: hist.snapshot() for name, hist in histograms.items()}
+                for label, histograms in sorted(self._by_maxdist.items())
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._by_maxdist.clear()
@@ -7,7 +7,7 @@ ext_modules = [
         ['cppmatch.cpp'],
         include_dirs=[pybind11.get_include()],
         language='c++',
-        extra_compile_args=['-std=c++11'],
+        extra_compile_args=['-std=c++17'],
     ),
 ]
 
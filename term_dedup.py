@@ -0,0 +1,149 @@
+"""Duplicate removal for MRCONSO terms before the BK-tree is built.
+
+MRCONSO repeats the same ``STR`` under many sources and lexical ids, and inserting a repeat still
+walks a full root-to-leaf path of distance computations before the tree notices ``dist == 0``.
+:func:`unique_terms` drops repeats up front with a hash set and yields each term once, in
+first-seen order, so the tree is the one the raw rows would have built.
+
+The set is bounded by ``memory_bytes``. A load that outgrows it switches to an external sort:
+the distinct terms seen so far and every later chunk are sorted and written to run files in
+``spill_dir``, and the runs are merged back with duplicates dropped. The output is then in sorted
+order instead of first-seen order, which builds a different but equivalent tree. ``sort=True``
+asks for sorted output regardless, which makes the build order independent of the input order.
+
+The bound covers this step only. Output is still yielded one term at a time, but
+``BKTree.build`` takes the whole list, so the service and the precompute job hold every unique
+term in memory once more during the build, next to the tree. The pipelined load in the service
+(``LOAD_PIPELINE``) instead inserts terms as they are parsed and keeps no such list.
+
+:func:`write_terms` writes the unique-terms cache the precompute job publishes: UTF-8, one term
+per line, which the service loads with ``MRCONSO_FORMAT=terms``.
+"""
+
+import heapq
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import IO, Iterable, Iterator
+
+logger = logging.getLogger("term_dedup")
+
+DEFAULT_MEMORY_BYTES = 1024 * 1024 * 1024
+
+# Set slot and list pointer per kept term, on top of the string itself.
+_ENTRY_OVERHEAD = 24
+
+
+class DedupStats:
+    """Counts from one :func:`unique_terms` pass, for load logs and artifact metadata.
+
+    ``seconds`` is the wall time of the whole pass, including reading the input it wraps.
+    """
+
+    def __init__(self):
+        self.raw = 0
+        self.unique = 0
+        self.runs = 0
+        self.seconds = 0.0
+
+    @property
+    def duplicates(self) -> int:
+        return self.raw - self.unique
+
+    def as_dict(self) -> dict:
+        return {
+            "raw_term_count": self.raw,
+            "unique_term_count": self.unique,
+            "duplicate_terms": self.duplicates,
+            "dedup_spill_runs": self.runs,
+            "dedup_seconds": round(self.seconds, 3),
+        }
+
+
+def _write_run(terms: list[str], spill_dir: str | None) -> IO[str]:
+    # Length-prefixed records, untranslated: a term may itself contain "\r", "\n" or any other
+    # character that line iteration would treat as a line break.
+    run = tempfile.TemporaryFile("w+", encoding="utf-8", newline="", dir=spill_dir,
+                                 prefix="terms_run_")
+    for term in sorted(terms):
+        run.write(f"{len(term)}\n")
+        run.write(term)
+    run.seek(0)
+    return run
+
+
+def _read_run(run: IO[str]) -> Iterator[str]:
+    while header := run.readline():
+        yield run.read(int(header))
+
+
+def _merge_runs(runs: list[IO[str]]) -> Iterator[str]:
+    previous = None
+    for term in heapq.merge(*(_read_run(run) for run in runs)):
+        if term != previous:
+            previous = term
+            yield term
+
+
+def unique_terms(terms: Iterable[str], *, memory_bytes: int = DEFAULT_MEMORY_BYTES,
+                 spill_dir: str | None = None, sort: bool = False,
+                 stats: DedupStats | None = None) -> Iterator[str]:
+    """Yield each distinct term of ``terms`` once (first-seen order unless sorted, see above).
+
+    ``stats``, when given, is filled in as the terms are consumed; its counts are final once the
+    iterator is exhausted. ``memory_bytes <= 0`` never spills.
+    """
+    stats = stats if stats is not None else DedupStats()
+    start = time.perf_counter()
+    seen: set[str] = set()
+    kept: list[str] = []
+    held = 0
+    runs: list[IO[str]] = []
+    try:
+        for term in terms:
+            stats.raw += 1
+            if term in seen:
+                continue
+            seen.add(term)
+            kept.append(term)
+            held += sys.getsizeof(term) + _ENTRY_OVERHEAD
+            if 0 < memory_bytes < held:
+                # Over budget: sort what is held into a run and start a fresh chunk. A term
+                # repeated across chunks is dropped when the runs are merged.
+                runs.append(_write_run(kept, spill_dir))
+                logger.info("Dedup set reached %.1f MiB; spilled sorted run %d (%d terms)",
+                            held / (1024 * 1024), len(runs), len(kept))
+                seen.clear()
+                kept = []
+                held = 0
+
+        if runs:
+            if kept:
+                runs.append(_write_run(kept, spill_dir))
+            seen.clear()
+            kept = []
+            output: Iterable[str] = _merge_runs(runs)
+        else:
+            output = sorted(kept) if sort else kept
+        stats.runs = len(runs)
+        for term in output:
+            stats.unique += 1
+            yield term
+    finally:
+        for run in runs:
+            run.close()
+        stats.seconds = time.perf_counter() - start
+
+
+def write_terms(terms: Iterable[str], path: str | os.PathLike) -> int:
+    """Write terms one per line as UTF-8 and return how many were written."""
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="\n", buffering=1 << 20) as fh:
+        for term in terms:
+            fh.write(term)
+            fh.write("\n")
+            count += 1
+    return count
+
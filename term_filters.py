@@ -0,0 +1,97 @@
+"""Row filters for MRCONSO index builds.
+
+Most deployments only search some of MRCONSO: English strings, from a few source vocabularies,
+that the UMLS does not mark as suppressible. :class:`TermFilter` describes that subset (LAT
+values, SAB values, and whether to keep only ``SUPPRESS=N`` rows) and hands it to
+``cppmatch.iter_rrf_terms``, which drops the other rows while it scans, before their terms are
+ever decoded or inserted.
+
+The precompute job records the filter in ``metadata.json`` (``term_filter``). A service
+configured with a filter checks it there and refuses an artifact built with a different one, so
+an index never quietly covers other rows than the service asks for. Artifacts without the
+field were built from every row.
+"""
+
+import os
+from typing import Any, Iterable, Mapping
+
+
+def _split(value: str | None) -> list[str]:
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+class TermFilterMismatch(RuntimeError):
+    """An artifact was built with a different row filter than the service is configured with."""
+
+
+class TermFilter:
+    """Which MRCONSO rows to index; the default keeps every row.
+
+    ``langs`` are LAT codes (``ENG``, ``SPA``, ...) and are upper-cased; ``sabs`` are source
+    abbreviations (``MSH``, ``SNOMEDCT_US``, ...) and are matched exactly. Empty means any.
+    """
+
+    def __init__(self, langs: Iterable[str] = (), sabs: Iterable[str] = (), exclude_suppressed: bool = False):
+        self.langs = sorted({lang.strip().upper() for lang in langs if lang.strip()})
+        self.sabs = sorted({sab.strip() for sab in sabs if sab.strip()})
+        self.exclude_suppressed = bool(exclude_suppressed)
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str] = os.environ) -> "TermFilter":
+        """Read ``MRCONSO_LANGS``, ``MRCONSO_SABS`` (comma-separated) and ``MRCONSO_EXCLUDE_SUPPRESSED``."""
+        suppressed = (env.get("MRCONSO_EXCLUDE_SUPPRESSED") or "").strip().lower()
+        return cls(
+            _split(env.get("MRCONSO_LANGS")),
+            _split(env.get("MRCONSO_SABS")),
+            suppressed in {"1", "true", "t", "yes", "y", "on"},
+        )
+
+    @classmethod
+    def from_metadata(cls, metadata: Mapping[str, Any]) -> "TermFilter":
+        """The filter an artifact was built with (no filter when it does not record one)."""
+        recorded = metadata.get("term_filter") or {}
+        return cls(recorded.get("langs") or (), recorded.get("sabs") or (), recorded.get("exclude_suppressed", False))
+
+    @property
+    def active(self) -> bool:
+        return bool(self.langs or self.sabs or self.exclude_suppressed)
+
+    def rrf_filters(self) -> dict[str, list[str]] | None:
+        """The ``filters`` argument of ``cppmatch.iter_rrf_terms`` (None when every row is kept)."""
+        filters: dict[str, list[str]] = {}
+        if self.langs:
+            filters["LAT"] = self.langs
+        if self.sabs:
+            filters["SAB"] = self.sabs
+        if self.exclude_suppressed:
+            filters["SUPPRESS"] = ["N"]
+        return filters or None
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"langs": self.langs, "sabs": self.sabs, "exclude_suppressed": self.exclude_suppressed}
+
+    def check_artifact(self, metadata: Mapping[str, Any]) -> None:
+        """Raise :class:`TermFilterMismatch` unless the artifact was built with this filter.
+
+        A service without a filter accepts any artifact.
+        """
+        if not self.active:
+            return
+        recorded = TermFilter.from_metadata(metadata)
+        if recorded != self:
+            raise TermFilterMismatch(f"Artifact was built with term filter {recorded}, service expects {self}")
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, TermFilter) and self.as_dict() == other.as_dict()
+
+    def __str__(self) -> str:
+        if not self.active:
+            return "none (every row)"
+        parts = []
+        if self.langs:
+            parts.append("LAT=" + ",".join(self.langs))
+        if self.sabs:
+            parts.append("SAB=" + ",".join(self.sabs))
+        if self.exclude_suppressed:
+            parts.append("SUPPRESS=N")
+        return " ".join(parts)
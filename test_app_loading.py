@@ -7,7 +7,7 @@ from typing import Dict
 
 import pytest
 from fastapi.testclient import TestClient
-from cppmatch import BKTree
+from cppmatch import BKTree, ShardedBKTree
 
 
 def _reload_app(monkeypatch: pytest.MonkeyPatch, env: Dict[str, str | None]):
@@ -52,13 +52,16 @@ def _write_rrf(path, terms):
     path.write_text("\n".join(rows) + "\n", encoding="utf-8")
 
 
-def _make_bktree_artifact(tmp_dir, terms):
+def _make_bktree_artifact(tmp_dir, terms, member="bktree.bin"):
     tree = BKTree()
     for term in terms:
         tree.insert(term)
 
-    bin_path = tmp_dir / "bktree.bin"
-    tree.save(str(bin_path))
+    bin_path = tmp_dir / member
+    if member == "bktree2.bin":
+        tree.save_mmap(str(bin_path))
+    else:
+        tree.save(str(bin_path))
 
     metadata = {
         "schema_version": 1,
@@ -70,12 +73,35 @@ def _make_bktree_artifact(tmp_dir, terms):
 
     tar_path = tmp_dir / "artifact.tar.gz"
     with tarfile.open(tar_path, "w:gz") as tar:
-        tar.add(bin_path, arcname="bktree.bin")
+        tar.add(bin_path, arcname=member)
         tar.add(metadata_path, arcname="metadata.json")
 
     return tar_path, metadata
 
 
+def _make_sharded_artifact(tmp_dir, terms, shards):
+    forest = ShardedBKTree.build(terms, shards)
+    members = [f"shards/shard-{index:04d}.bin" for index in range(shards)]
+    metadata = {
+        "schema_version": 1,
+        "term_count": len(terms),
+        "shards": shards,
+        "shard_members": members,
+        "tree_encoding": "sharded-bktree2",
+    }
+    metadata_path = tmp_dir / "metadata.json"
+    metadata_path.write_text(json.dumps(metadata), encoding="utf-8")
+
+    tar_path = tmp_dir / "sharded.tar.gz"
+    with tarfile.open(tar_path, "w:gz") as tar:
+        tar.add(metadata_path, arcname="metadata.json")
+        for index, member in enumerate(members):
+            shard_path = tmp_dir / f"shard-{index}.bin"
+            forest.save_shard(index, str(shard_path))
+            tar.add(shard_path, arcname=member)
+    return tar_path, metadata
+
+
 def test_load_terms_from_artifact(monkeypatch, tmp_path):
     artifact_path, metadata = _make_bktree_artifact(tmp_path, ["Alpha", "Bravo", "Charlie"])
 
@@ -111,6 +137,169 @@ def test_load_terms_from_artifact(monkeypatch, tmp_path):
         assert python_baseline.status_code == 503
 
 
+def test_load_terms_from_mmap_artifacts(monkeypatch, tmp_path):
+    artifact_path, metadata = _make_bktree_artifact(tmp_path, ["Alpha", "Bravo", "Charlie"], member="bktree2.bin")
+
+    app_module = _reload_app(
+        monkeypatch,
+        {
+            "BKTREE_ARTIFACT_PATH": str(artifact_path),
+            "MRCONSO_PATH": str(tmp_path / "unused.txt"),
+            "ENABLE_PYTHON_BASELINE": "0",
+            "AUTO_LOAD_ON_STARTUP": "0",
+            "SHUTDOWN_AFTER_SECONDS": "0",
+        },
+    )
+    assert app_module.load_terms(force=True) == 3
+    # Tar members are streamed into memory rather than extracted and mapped
+    assert app_module.TREE.is_mmapped is False
+    assert ("Bravo", 0) in app_module.TREE.search("Bravo", 0)
+
+    # A bare BKTREE2 image is mapped in place, with metadata from its sidecar
+    image_path = tmp_path / "mrconso.bktree2"
+    app_module.TREE.save_mmap(str(image_path))
+    (tmp_path / "mrconso.bktree2.json").write_text(json.dumps(metadata), encoding="utf-8")
+    app_module = _reload_app(monkeypatch, {"BKTREE_ARTIFACT_PATH": str(image_path)})
+    assert app_module.load_terms(force=True) == 3
+    assert app_module.TREE.is_mmapped is True
+    assert app_module.ARTIFACT_METADATA == metadata
+    assert ("Charlie", 0) in app_module.TREE.search("Charlie", 0)
+
+
+def test_artifact_is_streamed_without_temp_files(monkeypatch, tmp_path):
+    artifact_path, _ = _make_bktree_artifact(tmp_path, ["Alpha", "Bravo", "Charlie"], member="bktree2.bin")
+    # An uncompressed tar of the same members is detected and read the same way
+    plain_path = tmp_path / "artifact.tar"
+    with tarfile.open(artifact_path, "r:gz") as src, tarfile.open(plain_path, "w") as dst:
+        for info in src.getmembers():
+            dst.addfile(info, src.extractfile(info))
+
+    def no_temp_files(*args, **kwargs):
+        raise AssertionError("artifact loading must not write temp files")
+
+    monkeypatch.setattr("tempfile.NamedTemporaryFile", no_temp_files)
+    monkeypatch.setattr("tempfile.mkstemp", no_temp_files)
+    for path in (artifact_path, plain_path):
+        app_module = _reload_app(
+            monkeypatch,
+            {
+                "BKTREE_ARTIFACT_PATH": str(path),
+                "MRCONSO_PATH": str(tmp_path / "unused.txt"),
+                "BKTREE_STREAM_BUFFER_BYTES": "4096",
+                "ENABLE_PYTHON_BASELINE": "0",
+                "AUTO_LOAD_ON_STARTUP": "0",
+                "SHUTDOWN_AFTER_SECONDS": "0",
+            },
+        )
+        assert app_module.load_terms(force=True) == 3
+        assert ("Charlie", 0) in app_module.TREE.search("Charlie", 0)
+        assert app_module.METRICS.artifact_bytes == path.stat().st_size
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd", "none"])
+def test_artifact_codec_is_detected_from_magic_bytes(monkeypatch, tmp_path, compression):
+    from artifact_codec import SUFFIXES, detect_compression, open_archive_writer
+
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    terms = ["Alpha", "Alphb", "Bravo", "Charlie"]
+    tree = BKTree.build(terms)
+    image_path = tmp_path / "bktree2.bin"
+    tree.save_mmap(str(image_path))
+    metadata_path = tmp_path / "metadata.json"
+    metadata_path.write_text(json.dumps({"term_count": len(terms), "compression": compression}), encoding="utf-8")
+    # The suffix is informational only; the loader goes by the leading bytes
+    artifact_path = tmp_path / f"artifact-{compression}.bin"
+    with open_archive_writer(str(artifact_path), compression) as tar:
+        tar.add(image_path, arcname="bktree2.bin")
+        tar.add(metadata_path, arcname="metadata.json")
+    assert detect_compression(artifact_path.read_bytes()[:4]) == compression
+    assert SUFFIXES[compression].startswith(".tar")
+
+    app_module = _reload_app(
+        monkeypatch,
+        {
+            "BKTREE_ARTIFACT_PATH": str(artifact_path),
+            "MRCONSO_PATH": str(tmp_path / "unused.txt"),
+            "ENABLE_PYTHON_BASELINE": "0",
+            "AUTO_LOAD_ON_STARTUP": "0",
+            "SHUTDOWN_AFTER_SECONDS": "0",
+        },
+    )
+    assert app_module.load_terms(force=True) == len(terms)
+    assert app_module.ARTIFACT_METADATA["compression"] == compression
+    assert app_module.TREE.search("Alpha", 1) == tree.search("Alpha", 1)
+
+
+def test_shared_index_is_attached_by_other_workers(monkeypatch, tmp_path):
+    terms_path = tmp_path / "terms.txt"
+    _write_terms_cache(terms_path, ["Alpha", "Beta", "Gamma"])
+    shared_path = tmp_path / "shm" / "mrconso.bktree2"
+    env = {
+        "MRCONSO_PATH": str(terms_path),
+        "MRCONSO_FORMAT": "terms",
+        "BKTREE_SHARED_PATH": str(shared_path),
+        "ENABLE_PYTHON_BASELINE": "0",
+        "AUTO_LOAD_ON_STARTUP": "0",
+        "SHUTDOWN_AFTER_SECONDS": "0",
+    }
+
+    owner = _reload_app(monkeypatch, env)
+    assert owner.load_terms(force=True) == 3
+    assert owner.SHARED_INDEX["role"] == "owner"
+    assert owner.TREE.is_mmapped is True
+
+    # A second worker maps the published image instead of rebuilding it
+    terms_path.unlink()
+    worker = _reload_app(monkeypatch, env)
+    assert worker.load_terms() == 3
+    assert worker.TREE.is_mmapped is True
+    assert ("Gamma", 0) in worker.TREE.search("Gamma", 0)
+
+    with TestClient(worker.app) as client:
+        shared = client.get("/healthz").json()["shared_index"]
+    assert shared["role"] == "attached"
+    assert shared["path"] == str(shared_path)
+    assert shared["bytes"] == shared_path.stat().st_size
+    assert (shared["device"], shared["inode"]) == (
+        owner.SHARED_INDEX["device"],
+        owner.SHARED_INDEX["inode"],
+    )
+
+
+def test_shared_index_from_another_source_is_republished(monkeypatch, tmp_path):
+    shared_path = tmp_path / "shm" / "mrconso.bktree2"
+    old_path = tmp_path / "old.txt"
+    _write_terms_cache(old_path, ["Alpha", "Beta", "Gamma"])
+    env = {
+        "MRCONSO_PATH": str(old_path),
+        "MRCONSO_FORMAT": "terms",
+        "BKTREE_SHARED_PATH": str(shared_path),
+        "BKTREE_ARTIFACT_PATH": None,
+        "ENABLE_PYTHON_BASELINE": "0",
+        "AUTO_LOAD_ON_STARTUP": "0",
+        "SHUTDOWN_AFTER_SECONDS": "0",
+    }
+    owner = _reload_app(monkeypatch, env)
+    assert owner.load_terms() == 3
+    sidecar = json.loads((tmp_path / "shm" / "mrconso.bktree2.json").read_text(encoding="utf-8"))
+    assert sidecar["source"]["mrconso_path"] == str(old_path)
+
+    # A worker configured with another source rebuilds instead of mapping the leftover image
+    new_path = tmp_path / "new.txt"
+    _write_terms_cache(new_path, ["Xray", "Yankee", "Zulu", "Alpha"])
+    worker = _reload_app(monkeypatch, {**env, "MRCONSO_PATH": str(new_path)})
+    assert worker.load_terms() == 4
+    assert worker.SHARED_INDEX["role"] == "owner"
+    assert worker.TREE.search("Zulu", 0) == [("Zulu", 0)]
+    assert worker.TREE.search("Gamma", 0) == []
+
+    # and the republished image is what the next worker with that source attaches
+    attached = _reload_app(monkeypatch, {**env, "MRCONSO_PATH": str(new_path)})
+    assert attached.load_terms() == 4
+    assert attached.SHARED_INDEX["role"] == "attached"
+
+
 def test_load_terms_without_baseline(monkeypatch, tmp_path):
     terms_path = tmp_path / "terms.txt"
     _write_terms_cache(terms_path, ["Alpha", "Beta", "Gamma"])
@@ -180,6 +369,51 @@ def test_load_terms_with_baseline(monkeypatch, tmp_path):
         assert "Epsilon" in terms
 
 
+def test_batch_search_deduplicates_and_preserves_order(monkeypatch, tmp_path):
+    terms_path = tmp_path / "terms.txt"
+    _write_terms_cache(terms_path, ["Alpha", "Alphb", "Beta", "Gamma"])
+
+    app_module = _reload_app(
+        monkeypatch,
+        {
+            "MRCONSO_PATH": str(terms_path),
+            "MRCONSO_FORMAT": "terms",
+            "ENABLE_PYTHON_BASELINE": "0",
+            "AUTO_LOAD_ON_STARTUP": "0",
+            "SHUTDOWN_AFTER_SECONDS": "0",
+            "SEARCH_BATCH_MAX": "4",
+        },
+    )
+    app_module.load_terms(force=True)
+
+    with TestClient(app_module.app) as client:
+        response = client.post(
+            "/search/bktree/batch",
+            json={
+                "queries": [
+                    {"query": "Alpha", "maxdist": 1},
+                    {"query": "Alpha", "maxdist": 1, "k": 1},
+                    {"query": "Alpha", "maxdist": 1, "k": 1},
+                    {"query": "Xyzzy", "maxdist": 1},
+                ]
+            },
+        )
+        assert response.status_code == 200
+        payload = response.json()
+        assert payload["queries"] == 4
+        assert payload["unique_queries"] == 3
+        assert payload["elapsed_ms"] >= 0
+        results = payload["results"]
+        assert [item["query"] for item in results] == ["Alpha", "Alpha", "Alpha", "Xyzzy"]
+        assert results[0]["matches"] == [{"term": "Alpha", "distance": 0}, {"term": "Alphb", "distance": 1}]
+        assert results[1]["matches"] == [{"term": "Alpha", "distance": 0}]
+        assert results[2]["matches"] == [{"term": "Alpha", "distance": 0}]
+        assert results[3]["matches"] == []
+
+        too_big = client.post("/search/bktree/batch", json={"queries": [{"query": "a"}] * 5})
+        assert too_big.status_code == 413
+
+
 def test_shutdown_timer_reports_health(monkeypatch, tmp_path):
     terms_path = tmp_path / "terms.txt"
     _write_terms_cache(terms_path, ["Zeta"])
@@ -220,4 +454,160 @@ def test_shutdown_timer_reports_health(monkeypatch, tmp_path):
         assert health_after["shutdown_timer_active"] is False
         assert called == {}
 
-    asyncio.run(runner())
\ No newline at end of file
+    asyncio.run(runner())
+
+def test_search_topk_without_distance_limit(monkeypatch, tmp_path):
+    terms_path = tmp_path / "terms.txt"
+    _write_terms_cache(terms_path, ["Alpha", "Alphb", "Beta", "Gamma"])
+
+    app_module = _reload_app(
+        monkeypatch,
+        {
+            "MRCONSO_PATH": str(terms_path),
+            "MRCONSO_FORMAT": "terms",
+            "ENABLE_PYTHON_BASELINE": "0",
+            "AUTO_LOAD_ON_STARTUP": "0",
+            "SHUTDOWN_AFTER_SECONDS": "0",
+        },
+    )
+    app_module.load_terms(force=True)
+
+    with TestClient(app_module.app) as client:
+        response = client.get("/search/bktree", params={"q": "Gamna", "max_dist": -1, "k": 1})
+        assert response.status_code == 200
+        assert response.json()["matches"] == [{"term": "Gamma", "distance": 1}]
+
+        response = client.post("/search/bktree", json={"query": "Alphx", "maxdist": 1, "k": 1})
+        assert response.json()["matches"] == [{"term": "Alpha", "distance": 1}]
+
+        response = client.post(
+            "/search/bktree/batch",
+            json={"queries": [{"query": "Betta", "maxdist": -1, "k": 2}]},
+        )
+        assert response.json()["results"][0]["matches"] == [
+            {"term": "Beta", "distance": 1},
+            {"term": "Alpha", "distance": 4},
+        ]
+
+
+def test_best_match_search_escalates_from_exact_hits(monkeypatch, tmp_path):
+    terms_path = tmp_path / "terms.txt"
+    _write_terms_cache(terms_path, ["Alpha", "Alphb", "Alphbc", "Beta", "Gamma"])
+
+    app_module = _reload_app(
+        monkeypatch,
+        {
+            "MRCONSO_PATH": str(terms_path),
+            "MRCONSO_FORMAT": "terms",
+            "ENABLE_PYTHON_BASELINE": "0",
+            "AUTO_LOAD_ON_STARTUP": "0",
+            "SHUTDOWN_AFTER_SECONDS": "0",
+        },
+    )
+    app_module.load_terms(force=True)
+
+    with TestClient(app_module.app) as client:
+        response = client.get("/search/bktree", params={"q": "Alpha", "max_dist": 2, "best": True, "debug": True})
+        assert response.json()["matches"] == [{"term": "Alpha", "distance": 0}]
+        assert response.json()["stats"]["visited"] == 0
+
+        response = client.post("/search/bktree", json={"query": "Alphx", "maxdist": 2, "best": True})
+        assert response.json()["matches"] == [
+            {"term": "Alpha", "distance": 1},
+            {"term": "Alphb", "distance": 1},
+        ]
+        # Cached separately from the ordinary search of the same query
+        response = client.post("/search/bktree", json={"query": "Alphx", "maxdist": 2})
+        assert len(response.json()["matches"]) == 3
+
+        response = client.get("/search/bktree", params={"q": "Omega", "max_dist": 1, "best": True})
+        assert response.json()["matches"] == []
+
+
+def test_sharded_artifact_loads_incrementally(monkeypatch, tmp_path):
+    terms = ["Alpha", "Alphb", "Bravo", "Charlie", "Delta", "Echo", "Foxtrot", "Golf"]
+    artifact_path, metadata = _make_sharded_artifact(tmp_path, terms, 3)
+    app_module = _reload_app(
+        monkeypatch,
+        {
+            "BKTREE_ARTIFACT_PATH": str(artifact_path),
+            "MRCONSO_PATH": str(tmp_path / "unused.txt"),
+            "ENABLE_PYTHON_BASELINE": "0",
+            "AUTO_LOAD_ON_STARTUP": "0",
+            "SHUTDOWN_AFTER_SECONDS": "0",
+        },
+    )
+
+    seen = []
+    real_publish = app_module._publish_partial
+
+    def publish(forest, meta):
+        real_publish(forest, meta)
+        seen.append((forest.loaded_shards, app_module.PARTIAL, app_module.LOADED, app_module.TERM_COUNT))
+
+    monkeypatch.setattr(app_module, "_publish_partial", publish)
+    assert app_module.load_terms(force=True) == len(terms)
+    assert [entry[:3] for entry in seen] == [(1, True, True), (2, True, True)]
+    assert all(0 < entry[3] < len(terms) for entry in seen)
+    assert isinstance(app_module.TREE, ShardedBKTree)
+    assert app_module.PARTIAL is False
+
+    with TestClient(app_module.app) as client:
+        health = client.get("/healthz").json()
+        assert health["partial"] is False
+        assert health["shards"]["count"] == 3 and health["shards"]["loaded"] == 3
+        response = client.get("/search/bktree", params={"q": "Alpha", "max_dist": 1}).json()
+        assert response == {"matches": [{"term": "Alpha", "distance": 0}, {"term": "Alphb", "distance": 1}]}
+
+        # While shards are still arriving, responses say so and are not cached.
+        partial = ShardedBKTree(3)
+        app_module.LOADED = False
+        app_module._publish_partial(partial, metadata)
+        response = client.get("/search/bktree", params={"q": "Golf", "max_dist": 0}).json()
+        assert response == {"matches": [], "partial": True}
+        assert client.get("/cache/stats").json()["entries"] == 0
+        assert client.get("/healthz").json()["shards"]["loaded"] == 0
+
+
+def test_index_stats_endpoint(monkeypatch, tmp_path):
+    terms_path = tmp_path / "terms.txt"
+    _write_terms_cache(terms_path, ["Alpha", "Alphb", "Beta", "Gamma"])
+    app_module = _reload_app(
+        monkeypatch,
+        {
+            "MRCONSO_PATH": str(terms_path),
+            "MRCONSO_FORMAT": "terms",
+            "ENABLE_PYTHON_BASELINE": "0",
+            "AUTO_LOAD_ON_STARTUP": "0",
+            "SHUTDOWN_AFTER_SECONDS": "0",
+        },
+    )
+
+    with TestClient(app_module.app) as client:
+        assert client.get("/index/stats").status_code == 503
+        app_module.load_terms(force=True)
+        stats = client.get("/index/stats").json()
+        assert stats["source"] == "computed"
+        assert stats["nodes"] == 4 and stats["edges"] == 3
+        assert stats["term_length_histogram"] == {"4": 1, "5": 3}
+        assert client.get("/index/stats").json() == stats
+
+    # Artifacts that carry the precompute job's tree_stats are served as recorded.
+    recorded = {"nodes": 3, "max_depth": 1, "depth_histogram": {"0": 1, "1": 2}}
+    artifact_path, _ = _make_bktree_artifact(tmp_path, ["Alpha", "Bravo", "Charlie"])
+    with tarfile.open(artifact_path, "r:gz") as tar:
+        tar.extractall(tmp_path / "unpacked")
+    metadata_path = tmp_path / "unpacked" / "metadata.json"
+    metadata = json.loads(metadata_path.read_text(encoding="utf-8"))
+    metadata_path.write_text(json.dumps({**metadata, "tree_stats": recorded}), encoding="utf-8")
+    with tarfile.open(artifact_path, "w:gz") as tar:
+        tar.add(tmp_path / "unpacked" / "bktree.bin", arcname="bktree.bin")
+        tar.add(metadata_path, arcname="metadata.json")
+
+    app_module = _reload_app(
+        monkeypatch,
+        {"BKTREE_ARTIFACT_PATH": str(artifact_path), "MRCONSO_PATH": str(tmp_path / "unused.txt")},
+    )
+    app_module.load_terms(force=True)
+    with TestClient(app_module.app) as client:
+        assert client.get("/index/stats").json() == {"source": "artifact", **recorded}
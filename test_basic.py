@@ -23,6 +23,34 @@ def test_levenshtein_distance():
     assert levenshtein('cat', 'bat') == 1
 
 
+def _reference_levenshtein(s1, s2):
+    """Plain dynamic-programming Levenshtein over UTF-8 bytes."""
+    a, b = s1.encode('utf-8'), s2.encode('utf-8')
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        curr = [i] + [0] * len(b)
+        for j, cb in enumerate(b, start=1):
+            curr[j] = min(prev[j] + 1, curr[j - 1] + 1, prev[j - 1] + (ca != cb))
+        prev = curr
+    return prev[-1]
+
+
+def test_levenshtein_matches_reference_across_word_boundaries():
+    """Bit-parallel kernel agrees with plain DP for short and multi-word patterns."""
+    import random
+
+    rng = random.Random(7)
+    lengths = [0, 1, 5, 63, 64, 65, 127, 128, 129, 200]
+    for _ in range(300):
+        a = ''.join(rng.choice('abcd') for _ in range(rng.choice(lengths)))
+        b = ''.join(rng.choice('abcd') for _ in range(rng.choice(lengths)))
+        assert levenshtein(a, b) == _reference_levenshtein(a, b)
+        assert levenshtein(b, a) == levenshtein(a, b)
+
+    # Multi-byte UTF-8 characters are compared byte-wise
+    assert levenshtein('é', 'e') == _reference_levenshtein('é', 'e')
+
+
 def test_bktree_exists():
     """Test that BKTree class can be instantiated."""
     tree = BKTree()
@@ -117,3 +145,595 @@ def test_bktree_search_returns_sorted():
     # Check that results are sorted by distance
     for i in range(len(results) - 1):
         assert results[i][1] <= results[i+1][1]
+
+
+def test_bktree_search_matches_linear_scan():
+    """Bounded search returns exactly the terms a full scan finds."""
+    import random
+
+    rng = random.Random(11)
+    stems = ['cardi', 'neur', 'gastr', 'hepat', 'nephr', 'oste']
+    suffixes = ['itis', 'osis', 'opathy', 'ectomy', 'algia']
+    terms = sorted({
+        rng.choice(stems) + rng.choice('aeiou') * rng.randint(0, 2) + rng.choice(suffixes)
+        for _ in range(400)
+    })
+    terms.append('x' * 150)
+    tree = BKTree()
+    for term in terms:
+        tree.insert(term)
+
+    for query in rng.sample(terms, 25) + ['cardiitis', 'x' * 148, '']:
+        for maxdist in (0, 1, 2, 4):
+            expected = sorted(
+                (t, levenshtein(query, t)) for t in terms if levenshtein(query, t) <= maxdist
+            )
+            expected.sort(key=lambda item: (item[1], item[0]))
+            assert tree.search(query, maxdist) == expected
+
+
+def test_bktree_wide_edges_and_round_trip(tmp_path):
+    """Edge distances of 255+ survive insert, compact, save/load and serialization."""
+    terms = ['a' * 300, 'b' * 300, 'b' * 299 + 'c', 'c' * 40, 'a' * 299, 'ab' * 160]
+    tree = BKTree()
+    for term in terms:
+        tree.insert(term)
+    assert len(tree) == len(terms)
+
+    def brute(query, maxdist):
+        found = [(t, levenshtein(query, t)) for t in terms]
+        return sorted((m for m in found if m[1] <= maxdist), key=lambda item: (item[1], item[0]))
+
+    queries = [('b' * 300, 1), ('a' * 300, 300), ('c' * 40, 260), ('ab' * 160, 0)]
+    for query, maxdist in queries:
+        assert tree.search(query, maxdist) == brute(query, maxdist)
+
+    tree.compact()
+    path = tmp_path / 'wide.bin'
+    tree.save(str(path))
+    loaded = BKTree.load(str(path))
+    rebuilt = BKTree.from_serializable(tree.to_serializable())
+    for other in (tree, loaded, rebuilt):
+        for query, maxdist in queries:
+            assert other.search(query, maxdist) == brute(query, maxdist)
+    assert loaded.to_serializable() == tree.to_serializable()
+
+
+def test_bktree_mmap_round_trip(tmp_path):
+    """BKTREE2 files can be memory-mapped or loaded, and mapped trees stay mutable."""
+    terms = ['apple', 'apply', 'apricot', 'banana', 'bandana', 'cabana']
+    tree = BKTree()
+    for term in terms:
+        tree.insert(term)
+
+    path = tmp_path / 'bktree2.bin'
+    tree.save_mmap(str(path))
+    with open(path, 'rb') as fh:
+        assert fh.read(8) == b'BKTREE2\x00'
+
+    mapped = BKTree.load_mmap(str(path))
+    loaded = BKTree.load(str(path))
+    assert mapped.is_mmapped is True
+    assert loaded.is_mmapped is False
+    assert len(mapped) == len(terms)
+    for query in ('apple', 'banana', 'cabbage'):
+        expected = tree.search(query, 2)
+        assert mapped.search(query, 2) == expected
+        assert loaded.search(query, 2) == expected
+    assert mapped.to_serializable() == tree.to_serializable()
+
+    # Inserting into a mapped tree copies it into owned memory first
+    mapped.insert('appel')
+    assert mapped.is_mmapped is False
+    assert ('appel', 0) in mapped.search('appel', 0)
+    assert BKTree.load_mmap(str(path)).search('appel', 0) == []
+
+
+def test_bktree_load_mmap_rejects_other_formats(tmp_path):
+    """load_mmap only accepts BKTREE2 images."""
+    tree = BKTree()
+    tree.insert('alpha')
+    path = tmp_path / 'bktree1.bin'
+    tree.save(str(path))
+    with pytest.raises(RuntimeError):
+        BKTree.load_mmap(str(path))
+
+    empty = BKTree()
+    empty_path = tmp_path / 'empty2.bin'
+    empty.save_mmap(str(empty_path))
+    assert len(BKTree.load_mmap(str(empty_path))) == 0
+    assert BKTree.load_mmap(str(empty_path)).search('alpha', 3) == []
+
+
+def test_bktree_load_rejects_corrupt_sections(tmp_path):
+    """Indices and offsets inside a BKTREE2 image are checked at load, not trusted by search."""
+    import io
+    import random
+    import struct
+
+    rng = random.Random(5)
+    terms = sorted({''.join(rng.choice('abcdefg') for _ in range(rng.randint(1, 9))) for _ in range(400)})[:200]
+    path = tmp_path / 'tree.bin'
+    BKTree.build(terms).save_mmap(str(path))
+    image = path.read_bytes()
+    (node_count, edge_count, pool_bytes, nodes_at, edges_at, _, exact_at, exact_slots) = struct.unpack_from(
+        '<8Q', image, 16)
+
+    def load_both(data):
+        path.write_bytes(bytes(data))
+        return BKTree.load_mmap(str(path)), BKTree.load_stream(io.BytesIO(bytes(data)))
+
+    def patched(offset, fmt, *values):
+        data = bytearray(image)
+        struct.pack_into(fmt, data, offset, *values)
+        return data
+
+    exact_full = bytearray(image)
+    exact_full[exact_at:exact_at + 4 * exact_slots] = struct.pack('<I', 1) * exact_slots
+    corrupt = [
+        patched(nodes_at, '<Q', pool_bytes),                 # term past the end of the pool
+        patched(nodes_at + 12, '<I', edge_count),            # first child edge past the edge section
+        patched(edges_at + 1, '<I', 0),                      # edge back to the root: a cycle
+        patched(edges_at + 1, '<I', node_count),             # child index out of range
+        patched(exact_at, '<I', node_count + 1),             # exact-match slot out of range
+        exact_full,                                          # exact-match probing would never stop
+    ]
+    for data in corrupt:
+        path.write_bytes(bytes(data))
+        with pytest.raises(RuntimeError):
+            BKTree.load_mmap(str(path))
+        with pytest.raises(RuntimeError):
+            BKTree.load_stream(io.BytesIO(bytes(data)))
+
+    # Random damage either fails to load or leaves a tree that searches safely
+    for _ in range(60):
+        data = bytearray(image)
+        offset = rng.randrange(128, len(data) - 16)
+        data[offset:offset + 16] = bytes(rng.randrange(256) for _ in range(16))
+        try:
+            trees = load_both(data)
+        except RuntimeError:
+            continue
+        for tree in trees:
+            try:
+                tree.search('abcd', 2)
+                tree.search_topk('abcd', 5)
+            except UnicodeDecodeError:
+                pass  # damaged term bytes are only decoded when returned
+
+
+def test_bktree_load_stream_reads_file_like_objects(tmp_path):
+    """load_stream builds the same tree from any binary reader, in either format."""
+    import gzip
+    import io
+    from cppmatch import ShardedBKTree
+
+    terms = ['apple', 'apply', 'apricot', 'banana', 'bandana', 'cabana'] + [f'term{i}' for i in range(500)]
+    tree = BKTree.build(terms, 1)
+    images = {}
+    for name, save in (('v1', tree.save), ('v2', tree.save_mmap)):
+        path = tmp_path / f'{name}.bin'
+        save(str(path))
+        images[name] = path.read_bytes()
+
+    class ReadOnly:
+        """Reader without readinto(), like some third-party streams."""
+
+        def __init__(self, data):
+            self._fh = io.BytesIO(data)
+
+        def read(self, size=-1):
+            return self._fh.read(size)
+
+    for data in images.values():
+        readers = [
+            io.BytesIO(data),
+            gzip.GzipFile(fileobj=io.BytesIO(gzip.compress(data))),
+            ReadOnly(data),
+        ]
+        for reader in readers:
+            loaded = BKTree.load_stream(reader, buffer_bytes=4096)
+            assert loaded.is_mmapped is False
+            assert loaded.to_serializable() == tree.to_serializable()
+
+    forest = ShardedBKTree(2)
+    forest.load_shard_stream(1, io.BytesIO(images['v2']))
+    assert forest.shard_sizes() == [-1, len(tree)]
+
+    for truncated in (images['v1'][:-3], images['v2'][: len(images['v2']) // 2], b'BKTREE9\x00'):
+        with pytest.raises(RuntimeError):
+            BKTree.load_stream(io.BytesIO(truncated))
+
+    class Failing(io.RawIOBase):
+        def readable(self):
+            return True
+
+        def readinto(self, buffer):
+            raise OSError('connection reset')
+
+    # Errors raised by the reader surface as themselves, not as a parse failure.
+    with pytest.raises(OSError, match='connection reset'):
+        BKTree.load_stream(Failing())
+    with pytest.raises(TypeError):
+        BKTree.load_stream(object())
+
+
+def test_iter_rrf_terms_matches_python_split(tmp_path):
+    """The native RRF scanner reads the STR column exactly like line.split('|')[14].strip().
+
+    That includes str.strip()'s non-ASCII whitespace and whitespace left beside dropped bytes.
+    """
+    import io
+    from cppmatch import iter_rrf_terms
+
+    def row(term, lat='ENG', sab='MSH', suppress='N'):
+        return '|'.join(['C1', lat, 'P', 'L1', 'PF', 'S1', 'Y', 'A1', '', '', '', sab, 'PT', 'D1', term,
+                         '0', suppress, '']) + '|'
+
+    lines = [row('Heart attack'), row('  padded\t'), row(''), 'too|few|fields', '', row('caf\u00e9'),
+             row('x' * 10000), row('fr', lat='FRE'), row('old', suppress='O'), row('rx', sab='RXNORM'),
+             row('\u00a0nbsp\u3000'), row('\u2028'), row(' \u00a0 inner\u00a0space \u2029'), row('bad byte'),
+             '|'.join(['f'] * 14 + ['last column'])]
+    # CRLF rows, invalid UTF-8 (one beside whitespace, one on its own), no final newline
+    data = ('\r\n'.join(lines)).encode().replace(b'bad byte', b'bad byte \xfe') + b'\xff'
+    expected = []
+    for line in data.decode('utf-8', 'ignore').splitlines():
+        parts = line.split('|')
+        if len(parts) > 14 and parts[14].strip():
+            expected.append(parts[14].strip())
+
+    path = tmp_path / 'MRCONSO.RRF'
+    path.write_bytes(data)
+    for source in (str(path), path, data, bytearray(data), io.BytesIO(data)):
+        reader = iter_rrf_terms(source, buffer_bytes=4096)
+        assert [term for batch in reader for term in batch] == expected
+        assert reader.rows == len(lines) and reader.skipped == 2 and reader.bytes_read == len(data)
+    assert [len(batch) for batch in iter_rrf_terms(data, buffer_bytes=1 << 20)] == [len(expected)]
+
+    reader = iter_rrf_terms(data, filters={'LAT': ['ENG'], 11: ('MSH',), 'SUPPRESS': {'N'}})
+    assert [term for batch in reader for term in batch] == ['Heart attack', 'padded', 'caf\u00e9', 'x' * 10000,
+                                                            'nbsp', 'inner\u00a0space', 'bad byte']
+    assert reader.filtered == 4  # FRE, suppressed, RXNORM and the bare 15-field row
+    assert [t for b in iter_rrf_terms(data, column='LAT', filters={'SAB': ['RXNORM']}) for t in b] == ['ENG']
+    with pytest.raises(ValueError):
+        iter_rrf_terms(data, filters={'NOPE': ['x']})
+    with pytest.raises(TypeError):
+        iter_rrf_terms(data, filters={'LAT': 'ENG'})
+
+
+def test_bktree_search_many_matches_search():
+    """Parallel batch search returns the same results as individual searches, in order."""
+    tree = BKTree()
+    for term in ['apple', 'apply', 'apricot', 'banana', 'bandana', 'cabana']:
+        tree.insert(term)
+
+    queries = ['apple', 'banana', 'zzz', 'apple', 'bandana']
+    assert tree.search_many(queries, [1], 3) == [tree.search(q, 1) for q in queries]
+
+    maxdists = [0, 2, 1, 1, 3]
+    expected = [tree.search(q, d) for q, d in zip(queries, maxdists)]
+    assert tree.search_many(queries, maxdists) == expected
+    assert tree.search_many([], [1]) == []
+
+    with pytest.raises(ValueError):
+        tree.search_many(queries, [1, 2])
+
+
+def test_bktree_search_topk_matches_truncated_search():
+    """Top-k search equals search(q, maxdist)[:k], including ties broken by term."""
+    import random
+
+    rng = random.Random(17)
+    terms = sorted({
+        ''.join(rng.choice('abcde') for _ in range(rng.randint(1, 9)))
+        for _ in range(1500)
+    })
+    tree = BKTree()
+    for term in terms:
+        tree.insert(term)
+
+    def scan(query, maxdist):
+        found = [(t, levenshtein(query, t)) for t in terms]
+        found = [m for m in found if maxdist < 0 or m[1] <= maxdist]
+        return sorted(found, key=lambda item: (item[1], item[0]))
+
+    for query in rng.sample(terms, 20) + ['abcabcabc', 'zz', '']:
+        for maxdist in (-1, 0, 2, 3):
+            expected = scan(query, maxdist)
+            for k in (0, 1, 5, 40):
+                assert tree.search_topk(query, k, maxdist) == expected[:k]
+
+    assert tree.search_topk('zzzz', 1) == scan('zzzz', -1)[:1]
+    assert BKTree().search_topk('alpha', 3) == []
+    queries = ['abc', 'dd', 'eeeee']
+    assert tree.search_many(queries, [2], 0, [3]) == [tree.search_topk(q, 3, 2) for q in queries]
+    with pytest.raises(ValueError):
+        tree.search_many(queries, [2], 0, [1, 2])
+
+
+def test_exact_index_and_best_match_escalation(tmp_path):
+    """maxdist=0, top-1 and search_best answer exact hits from the hash index; misses escalate."""
+    import random
+    from cppmatch import ShardedBKTree
+
+    rng = random.Random(23)
+    terms = [''.join(rng.choice('abcde') for _ in range(rng.randint(1, 8))) for _ in range(2000)]
+    unique = set(terms)
+    tree = BKTree.build(terms)
+    path = tmp_path / 'exact.bin'
+    tree.save_mmap(str(path))
+    mapped = BKTree.load_mmap(str(path))
+    forest = ShardedBKTree.build(terms, 3)
+
+    for query in rng.sample(terms, 30) + ['zzz', 'abcdeabcd', '']:
+        full = tree.search(query, 3)
+        nearest = min((d for _, d in full), default=None)
+        expected = [m for m in full if m[1] == nearest]
+        for index in (tree, mapped, forest):
+            assert (query in index) == (query in unique)
+            assert index.search(query, 0) == ([(query, 0)] if query in unique else [])
+            assert index.search_best(query, 3) == expected
+            assert index.search_topk(query, 1, 3) == full[:1]
+        matches, stats = tree.search_with_stats(query, 3, best=True)
+        assert matches == expected
+        if query in unique:
+            assert stats['visited'] == 0  # answered by the index alone
+
+    # Bounded and top-k walks seeded with the exact hit still return every match, once
+    for query in rng.sample(sorted(unique), 20):
+        for maxdist in (1, 2):
+            brute = sorted(((t, levenshtein(query, t)) for t in unique if levenshtein(query, t) <= maxdist),
+                           key=lambda m: (m[1], m[0]))
+            assert tree.search(query, maxdist) == mapped.search(query, maxdist) == brute
+            for k in (2, 5):
+                assert tree.search_topk(query, k, maxdist) == brute[:k]
+        assert tree.search_topk(query, 4, -1) == tree.search(query, 8)[:4]
+
+    # Escalation stops at the first radius with matches; unbounded by default
+    assert tree.search_best('abcdeabcdeabcde', 1) == []
+    assert tree.search_best('abcdeabcdeabcde')[0][1] > 1
+    assert BKTree().search_best('alpha') == [] and 'alpha' not in BKTree()
+
+    # Incremental inserts keep the index current; duplicates are skipped
+    grown = BKTree()
+    for term in terms:
+        grown.insert(term)
+    assert len(grown) == len(unique) and all(term in grown for term in unique)
+
+    # Images written before the index existed still load; the index is rebuilt in memory
+    image = bytearray(path.read_bytes())
+    image[72:88] = bytes(16)  # exactOffset, exactSlots
+    old = tmp_path / 'old.bin'
+    old.write_bytes(bytes(image))
+    for loaded in (BKTree.load_mmap(str(old)), BKTree.load(str(old))):
+        assert all(term in loaded for term in unique)
+        assert loaded.search_best('zzz', 3) == tree.search_best('zzz', 3)
+
+
+def test_bktree_build_matches_sequential_insert(tmp_path):
+    """The parallel bulk build lays out exactly the tree sequential inserts produce."""
+    import random
+
+    rng = random.Random(23)
+    terms = [''.join(rng.choice('abcdefg') for _ in range(rng.randint(0, 12))) for _ in range(30000)]
+    terms += terms[:500] + ['w' * 300, 'w' * 600, 'v' * 299]  # duplicates and wide edges
+
+    sequential = BKTree()
+    for term in terms:
+        sequential.insert(term)
+    sequential.compact()
+    sequential.save_mmap(str(tmp_path / 'sequential.bin'))
+    expected = (tmp_path / 'sequential.bin').read_bytes()
+
+    for threads in (1, 2, 4, 0):
+        built = BKTree.build(terms, threads)
+        assert len(built) == len(sequential)
+        built.save_mmap(str(tmp_path / 'built.bin'))
+        assert (tmp_path / 'built.bin').read_bytes() == expected
+        for query in ('abc', 'gfedcba', 'w' * 299):
+            assert built.search(query, 2) == sequential.search(query, 2)
+
+    assert len(BKTree.build([], 4)) == 0
+    assert BKTree.build(['solo'], 4).search('solo', 0) == [('solo', 0)]
+
+
+def test_sharded_bktree_matches_single_tree(tmp_path):
+    """Fan-out search over hash shards merges to the single-tree results."""
+    import random
+    from cppmatch import ShardedBKTree
+
+    rng = random.Random(29)
+    terms = [''.join(rng.choice('abcdef') for _ in range(rng.randint(1, 10))) for _ in range(5000)]
+    single = BKTree.build(terms, 1)
+    forest = ShardedBKTree.build(terms, 4)
+    assert forest.shard_count == 4 and forest.is_complete
+    assert len(forest) == len(single)
+    assert sum(forest.shard_sizes()) == len(single)
+    assert forest.shard_of('abc') == forest.shard_of('abc')
+
+    queries = rng.sample(terms, 30) + ['zzz', '']
+    for query in queries:
+        assert forest.search(query, 2) == single.search(query, 2)
+        assert forest.search(query, 1, threads=1) == single.search(query, 1)
+        assert forest.search_topk(query, 7) == single.search_topk(query, 7)
+    assert forest.search_many(queries, [1], 2, [3]) == [single.search_topk(q, 3, 1) for q in queries]
+
+    # Shards round-trip independently, and a half-loaded forest answers from what it has.
+    paths = [str(tmp_path / f'shard-{i}.bin') for i in range(4)]
+    for index, path in enumerate(paths):
+        forest.save_shard(index, path)
+    partial = ShardedBKTree(4)
+    assert partial.loaded_shards == 0 and partial.search('abc', 3) == []
+    partial.load_shard(0, paths[0])
+    partial.load_shard(1, paths[1])
+    assert partial.loaded_shards == 2 and not partial.is_complete
+    assert partial.shard_sizes()[2:] == [-1, -1]
+    for query in queries[:10]:
+        expected = [m for m in single.search(query, 2) if forest.shard_of(m[0]) in (0, 1)]
+        assert partial.search(query, 2) == expected
+    partial.load_shard(2, paths[2])
+    partial.load_shard(3, paths[3])
+    assert all(partial.search(q, 2) == single.search(q, 2) for q in queries)
+
+    inserted = ShardedBKTree(3)
+    for term in terms[:200]:
+        inserted.insert(term)
+    assert len(inserted) == len(BKTree.build(terms[:200], 1))
+    with pytest.raises(IndexError):
+        inserted.load_shard(3, paths[0])
+    with pytest.raises(ValueError):
+        ShardedBKTree(0)
+
+
+def test_length_partitioned_forest_prunes_by_length():
+    """Length bands give the single-tree results while consulting fewer nodes."""
+    import random
+    from cppmatch import ShardedBKTree
+
+    rng = random.Random(31)
+    terms = [''.join(rng.choice('abcdef') for _ in range(rng.randint(1, 24))) for _ in range(6000)]
+    single = BKTree.build(terms, 1)
+    forest = ShardedBKTree.build(terms, 10, partition='length', band=2)
+    assert (forest.partition, forest.band) == ('length', 2)
+    assert len(forest) == len(single)
+    assert forest.shard_of('abc') == 1 and forest.shard_of('a' * 100) == 9
+
+    queries = rng.sample(terms, 40) + ['zzz', '', 'a' * 30]
+    for query in queries:
+        for maxdist in (0, 1, 3):
+            assert forest.search(query, maxdist) == single.search(query, maxdist)
+        assert forest.search_topk(query, 5) == single.search_topk(query, 5)
+        assert forest.search_topk(query, 3, 2) == single.search_topk(query, 3, 2)
+
+    # Only the bands within len(query) +/- maxdist are consulted.
+    sizes = forest.shard_sizes()
+    for query in queries:
+        lo, hi = min(max(0, len(query) - 2) // 2, 9), min((len(query) + 2) // 2, 9)
+        assert forest.count_visited(query, 2) <= sum(sizes[lo:hi + 1])
+    assert forest.count_visited('a' * 30, 2) == 1
+    assert single.count_visited('abc', 0) >= 1
+
+    with pytest.raises(ValueError):
+        ShardedBKTree(4, partition='prefix')
+    with pytest.raises(ValueError):
+        ShardedBKTree(4, partition='length', band=0)
+
+
+def test_search_with_stats_and_aggregate_counters():
+    """Per-query stats match count_visited and add up in the tree's totals."""
+    import random
+    from cppmatch import ShardedBKTree
+
+    rng = random.Random(37)
+    terms = [''.join(rng.choice('abcdef') for _ in range(rng.randint(1, 10))) for _ in range(3000)]
+    tree = BKTree.build(terms, 1)
+    assert tree.search_stats()['searches'] == 0
+
+    matches, stats = tree.search_with_stats('abcab', 2)
+    assert matches == tree.search('abcab', 2)
+    assert stats['visited'] == tree.count_visited('abcab', 2)
+    assert 0 < stats['distance_calls'] <= stats['visited'] < len(tree)
+    assert stats['pruned'] > 0 and stats['max_depth'] >= 1 and stats['elapsed_ns'] > 0
+
+    top, top_stats = tree.search_with_stats('abcab', -1, 3)
+    assert top == tree.search_topk('abcab', 3)
+    assert top_stats['visited'] > 0
+
+    totals = tree.search_stats()
+    assert totals['searches'] == 4  # two searches above plus the two they were checked against
+    assert totals['visited'] >= stats['visited'] + top_stats['visited']
+    assert totals['max_depth'] >= max(stats['max_depth'], top_stats['max_depth'])
+    tree.reset_search_stats()
+    assert tree.search_stats()['searches'] == 0
+    empty, empty_stats = BKTree().search_with_stats('x', 1)
+    assert empty == [] and empty_stats['visited'] == 0 and empty_stats['distance_calls'] == 0
+
+    forest = ShardedBKTree.build(terms, 6, partition='length', band=2)
+    for k in (-1, 4):
+        found, forest_stats = forest.search_with_stats('abcab', 2, k)
+        assert found == (tree.search('abcab', 2) if k < 0 else tree.search_topk('abcab', 4, 2))
+        assert forest_stats['visited'] > 0
+    assert forest.search_with_stats('abcab', 2)[1]['visited'] == forest.count_visited('abcab', 2)
+    assert forest.search_stats()['searches'] > 0
+    forest.reset_search_stats()
+    assert forest.search_stats()['searches'] == 0
+
+
+def test_bktree_stats_describe_tree_shape():
+    """stats() reports counts and histograms consistent with the tree that was built."""
+    import random
+    from cppmatch import ShardedBKTree
+
+    tree = BKTree()
+    for term in ['book', 'books', 'cake', 'boo', 'cape', 'cart']:
+        tree.insert(term)
+    stats = tree.stats()
+    assert (stats['nodes'], stats['edges'], stats['leaves']) == (6, 5, 3)
+    assert stats['depth_histogram'] == {0: 1, 1: 2, 2: 3}
+    assert stats['max_depth'] == 2 and stats['max_fanout'] == 2
+    assert stats['fanout_histogram'] == {0: 3, 1: 1, 2: 2}
+    assert stats['edge_distance_histogram'] == {1: 2, 2: 2, 4: 1}
+    assert stats['term_length_histogram'] == {3: 1, 4: 4, 5: 1}
+    assert BKTree().stats()['nodes'] == 0
+
+    rng = random.Random(41)
+    terms = [''.join(rng.choice('abcdef') for _ in range(rng.randint(1, 12))) for _ in range(20000)]
+    big = BKTree.build(terms).stats()
+    assert sum(big['depth_histogram'].values()) == big['nodes'] == len(set(terms))
+    assert sum(big['edge_distance_histogram'].values()) == big['edges'] == big['nodes'] - 1
+    assert sum(n * f for f, n in big['fanout_histogram'].items()) == big['edges']
+
+    forest = ShardedBKTree.build(['book', 'books', 'cake', 'boo', 'cape', 'cart'], 3)
+    merged = forest.stats()
+    assert merged['nodes'] == 6 and merged['shards'] == 3
+    assert merged['edges'] == 6 - sum(1 for size in forest.shard_sizes() if size > 0)
+
+
+def test_adversarial_insertion_order_builds_deep_trees_safely():
+    """Insert and search walk deep, degenerate trees without recursion.
+
+    Moving a single 'b' along a run of 'a's puts every term at distance 2 from every other, so
+    each insert descends the whole chain built so far.
+    """
+    import random
+    import threading
+
+    n = 300
+    chain_terms = ['a' * i + 'b' + 'a' * (n - i - 1) for i in range(n)]
+    rng = random.Random(43)
+    vocabulary = sorted({
+        ''.join(rng.choice('abc') for _ in range(rng.randint(1, 8))) for _ in range(3000)
+    })
+    outcome = {}
+
+    def run():
+        chain = BKTree()
+        for term in chain_terms:
+            chain.insert(term)
+        ordered = BKTree()
+        for term in vocabulary:  # sorted input, as a sorted MRCONSO dump would arrive
+            ordered.insert(term)
+        outcome['chain_depth'] = chain.stats()['max_depth']
+        outcome['chain_hits'] = chain.search(chain_terms[-1], 2)
+        outcome['chain_top'] = chain.search_topk(chain_terms[0], 3)
+        outcome['ordered'] = [ordered.search(q, 2) for q in vocabulary[::300]]
+
+    # A small thread stack leaves little room for per-level frames.
+    previous = threading.stack_size(256 * 1024)
+    try:
+        worker = threading.Thread(target=run)
+        worker.start()
+        worker.join()
+    finally:
+        threading.stack_size(previous)
+
+    assert outcome['chain_depth'] == n - 1
+    assert len(outcome['chain_hits']) == n
+    assert outcome['chain_hits'][0] == (chain_terms[-1], 0)
+    assert outcome['chain_top'] == [(chain_terms[0], 0)] + [(t, 2) for t in sorted(chain_terms[1:])[:2]]
+    for query, found in zip(vocabulary[::300], outcome['ordered']):
+        expected = sorted(
+            ((t, _reference_levenshtein(query, t)) for t in vocabulary if _reference_levenshtein(query, t) <= 2),
+            key=lambda item: (item[1], item[0]),
+        )
+        assert found == expected
@@ -0,0 +1,99 @@
+"""
+Concurrency tests for the cppmatch BK-tree.
+The bindings release the GIL during traversal, so searches from several
+Python threads run in parallel and stay correct alongside inserts.
+Throughput scaling is measured by benchmark.py, not asserted here.
+"""
+import random
+import sys
+import threading
+
+from cppmatch import BKTree
+
+
+def _synthetic_terms(n, seed=3):
+    rng = random.Random(seed)
+    prefixes = ["cardio", "neuro", "gastro", "hepato", "nephro", "osteo", "derma", "pulmo"]
+    suffixes = ["itis", "osis", "pathy", "plasty", "ectomy", "algia", "megaly", "stenosis"]
+    terms = set()
+    while len(terms) < n:
+        noise = "".join(rng.choice("abcdefghij") for _ in range(rng.randint(2, 6)))
+        terms.add(rng.choice(prefixes) + noise + rng.choice(suffixes))
+    return sorted(terms)
+
+
+def test_search_releases_the_gil():
+    """A second thread finishes a search while the first is inside a search call.
+
+    With a long switch interval the interpreter only hands the GIL over when a call
+    releases it, so if search held the GIL the first thread would make every one of
+    its calls before the second thread got to run at all.
+    """
+    terms = _synthetic_terms(20000)
+    tree = BKTree.build(terms)
+    queries = random.Random(5).sample(terms, 200)
+    first_started = threading.Event()
+    second_done = threading.Event()
+    calls = []
+
+    def first():
+        first_started.set()
+        for query in queries:
+            tree.search(query, 2)
+            calls.append(query)
+            if second_done.is_set():
+                break
+
+    def second():
+        first_started.wait()
+        tree.search(queries[0], 1)
+        second_done.set()
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(60)
+    try:
+        threads = [threading.Thread(target=first), threading.Thread(target=second)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert second_done.is_set()
+    assert len(calls) < len(queries)
+
+
+def test_search_during_inserts_is_consistent():
+    """Readers never observe a torn tree while a writer keeps inserting."""
+    terms = _synthetic_terms(6000)
+    initial, extra = terms[:3000], terms[3000:]
+    tree = BKTree()
+    for term in initial:
+        tree.insert(term)
+
+    errors = []
+    stop = threading.Event()
+
+    def reader(seed):
+        rng = random.Random(seed)
+        while not stop.is_set():
+            query = rng.choice(initial)
+            results = tree.search(query, 1)
+            if (query, 0) not in results:
+                errors.append(query)
+            if any(a[1] > b[1] for a, b in zip(results, results[1:])):
+                errors.append(f"unsorted results for {query}")
+
+    readers = [threading.Thread(target=reader, args=(seed,)) for seed in range(4)]
+    for reader_thread in readers:
+        reader_thread.start()
+    for term in extra:
+        tree.insert(term)
+    stop.set()
+    for reader_thread in readers:
+        reader_thread.join()
+
+    assert errors == []
+    for term in random.Random(9).sample(extra, 50):
+        assert (term, 0) in tree.search(term, 0)
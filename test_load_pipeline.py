@@ -0,0 +1,159 @@
+"""
+Tests for the staged load pipeline and pipelined raw MRCONSO loads.
+"""
+import io
+import threading
+import time
+
+import pytest
+from cppmatch import BKTree
+from fastapi.testclient import TestClient
+from load_pipeline import LoadPipeline, QueueReader, read_chunks, rebatch
+from test_app_loading import _reload_app, _write_rrf, _write_terms_cache
+
+
+def test_stages_overlap_under_bounded_queues():
+    delay, count = 0.02, 15
+    depth = 2
+    peak = 0
+
+    def produce(_):
+        for idx in range(count):
+            time.sleep(delay)
+            yield [idx]
+
+    def double(batches):
+        for batch in batches:
+            time.sleep(delay)
+            yield batch * 2
+
+    seen = []
+
+    def slow_consumer(batch):
+        nonlocal peak
+        peak = max(peak, doubled.qsize())
+        time.sleep(delay)
+        seen.append(batch)
+
+    pipeline = LoadPipeline(depth)
+    started = time.perf_counter()
+    produced = pipeline.add_stage("read", "values", produce)
+    doubled = pipeline.add_stage("parse", "values", double, produced)
+    pipeline.consume("insert", "values", doubled, slow_consumer)
+    elapsed = time.perf_counter() - started
+
+    assert seen == [[idx, idx] for idx in range(count)]
+    # Three stages of count * delay each, run side by side rather than back to back
+    assert elapsed < 2 * count * delay
+    assert peak <= depth
+    report = pipeline.report()
+    assert list(report["stages"]) == ["read", "parse", "insert"]
+    assert report["stages"]["parse"]["items"] == count
+    assert report["stages"]["parse"]["values"] == report["stages"]["insert"]["values"] == 2 * count
+    assert report["stages"]["parse"]["starved_seconds"] > 0
+
+
+def test_stage_errors_stop_the_pipeline():
+    threads = threading.active_count()
+
+    def endless(_):
+        while True:
+            yield b"x"
+
+    def parse(chunks):
+        for idx, chunk in enumerate(chunks):
+            if idx == 3:
+                raise ValueError("bad row")
+            yield chunk
+
+    pipeline = LoadPipeline(1)
+    chunks = pipeline.add_stage("read", "bytes", endless)
+    rows = pipeline.add_stage("parse", "bytes", parse, chunks)
+    with pytest.raises(ValueError, match="bad row"):
+        pipeline.consume("insert", "bytes", rows, lambda row: None)
+    assert threading.active_count() == threads
+
+    # The consumer stopping early (returning False) ends the upstream stages as well
+    pipeline = LoadPipeline(1)
+    chunks = pipeline.add_stage("read", "bytes", endless)
+    taken = []
+    pipeline.consume("insert", "bytes", chunks, lambda chunk: taken.append(chunk) or len(taken) < 5)
+    assert len(taken) == 5 and threading.active_count() == threads
+
+
+def test_queue_reader_and_rebatch():
+    data = b"".join(f"row {idx}\n".encode() for idx in range(1000))
+    reader = io.BufferedReader(QueueReader(read_chunks(io.BytesIO(data), 7)), 64)
+    assert reader.read() == data
+    assert list(rebatch([[1, 2], [], [3, 4, 5, 6, 7]], 3)) == [[1, 2, 3], [4, 5, 6], [7]]
+
+
+def test_pipelined_raw_load_builds_the_sequential_tree(monkeypatch, tmp_path):
+    rows = [f"Term{idx % 37}x{idx % 5}" for idx in range(200)]
+    unique = list(dict.fromkeys(rows))
+    rrf_path = tmp_path / "MRCONSO.RRF"
+    _write_rrf(rrf_path, rows)
+    env = {
+        "MRCONSO_PATH": str(rrf_path),
+        "MRCONSO_FORMAT": "rrf",
+        "BKTREE_ARTIFACT_PATH": None,
+        "BKTREE_SHARED_PATH": None,
+        "ENABLE_PYTHON_BASELINE": "1",
+        "AUTO_LOAD_ON_STARTUP": "0",
+        "SHUTDOWN_AFTER_SECONDS": "0",
+        "LOAD_PIPELINE": "1",
+        "LOAD_READ_BYTES": "100",
+        "LOAD_BATCH_TERMS": "7",
+        "LOAD_QUEUE_DEPTH": "2",
+    }
+    app_module = _reload_app(monkeypatch, env)
+    assert app_module.load_terms(force=True) == len(unique)
+    assert app_module.TERMS == unique
+    assert app_module.TREE.to_serializable() == BKTree.build(unique).to_serializable()
+    with TestClient(app_module.app) as client:
+        health = client.get("/healthz").json()
+    assert health["dedup"]["raw_term_count"] == len(rows)
+    assert health["dedup"]["unique_term_count"] == len(unique)
+    stages = health["load_stages"]["stages"]
+    assert stages["read"]["bytes"] == rrf_path.stat().st_size
+    assert stages["parse"]["terms"] == stages["insert"]["terms"] == len(rows)
+
+    # MAX_TERMS counts raw rows and stops the stages early
+    app_module = _reload_app(monkeypatch, {**env, "MAX_TERMS": "50"})
+    assert app_module.load_terms(force=True) == len(set(rows[:50]))
+    assert app_module.DEDUP_STATS["raw_term_count"] == 50
+
+    # Term caches go through the same stages
+    terms_path = tmp_path / "terms.txt"
+    _write_terms_cache(terms_path, unique)
+    app_module = _reload_app(
+        monkeypatch, {**env, "MRCONSO_PATH": str(terms_path), "MRCONSO_FORMAT": "terms", "MAX_TERMS": None}
+    )
+    assert app_module.load_terms(force=True) == len(unique)
+    assert app_module.TREE.to_serializable() == BKTree.build(unique).to_serializable()
+
+
+def test_pipelined_load_surfaces_parse_errors(monkeypatch, tmp_path):
+    rrf_path = tmp_path / "MRCONSO.RRF"
+    _write_rrf(rrf_path, ["Alpha", "Beta"])
+    app_module = _reload_app(
+        monkeypatch,
+        {
+            "MRCONSO_PATH": str(rrf_path),
+            "MRCONSO_FORMAT": "rrf",
+            "BKTREE_ARTIFACT_PATH": None,
+            "BKTREE_SHARED_PATH": None,
+            "AUTO_LOAD_ON_STARTUP": "0",
+            "SHUTDOWN_AFTER_SECONDS": "0",
+            "LOAD_PIPELINE": "1",
+        },
+    )
+
+    def broken(handle, stats=None):
+        raise OSError("connection reset")
+        yield  # pragma: no cover
+
+    monkeypatch.setattr(app_module, "_term_batches", broken)
+    with pytest.raises(OSError, match="connection reset"):
+        app_module.load_terms(force=True)
+    assert app_module.LOADED is False
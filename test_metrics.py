@@ -0,0 +1,71 @@
+"""
+Tests for the Prometheus /metrics endpoint and its request middleware.
+"""
+from fastapi.testclient import TestClient
+from metrics import ServiceMetrics
+from test_app_loading import _reload_app, _write_terms_cache
+
+
+def _sample(text, name, **labels):
+    wanted = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    prefix = f"{name}{{{wanted}}} " if labels else f"{name} "
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    raise AssertionError(f"{prefix!r} not found")
+
+
+def test_render_without_traffic_is_well_formed():
+    text = ServiceMetrics().render(terms=0)
+    assert _sample(text, "mrconso_http_requests_in_flight") == 0
+    assert _sample(text, "mrconso_search_results_count") == 0
+    assert _sample(text, "mrconso_process_resident_memory_bytes") > 0
+    for line in text.splitlines():
+        assert line.startswith("# ") or line.startswith("mrconso_")
+
+
+def test_metrics_endpoint_reports_requests_searches_and_load(monkeypatch, tmp_path):
+    terms_path = tmp_path / "terms.txt"
+    _write_terms_cache(terms_path, ["Aspirin", "Asprin", "Ibuprofen"])
+    app_module = _reload_app(
+        monkeypatch,
+        {
+            "MRCONSO_PATH": str(terms_path),
+            "MRCONSO_FORMAT": "terms",
+            "ENABLE_PYTHON_BASELINE": "0",
+            "AUTO_LOAD_ON_STARTUP": "0",
+            "SHUTDOWN_AFTER_SECONDS": "0",
+        },
+    )
+    app_module.load_terms(force=True)
+
+    with TestClient(app_module.app) as client:
+        for _ in range(2):
+            assert client.get("/search/bktree", params={"q": "Aspirin", "max_dist": 1}).status_code == 200
+        client.post("/search/bktree/batch", json={"queries": [{"query": "Ibuprofen", "maxdist": 0}]})
+        assert client.get("/no-such-route").status_code == 404
+
+        response = client.get("/metrics")
+        assert response.headers["content-type"].startswith("text/plain")
+        text = response.text
+
+    requests = "mrconso_http_requests_total"
+    assert _sample(text, requests, endpoint="/search/bktree", method="GET", status=200) == 2
+    assert _sample(text, requests, endpoint="/search/bktree/batch", method="POST", status=200) == 1
+    assert _sample(text, requests, endpoint="unmatched", method="GET", status=404) == 1
+    latency = "mrconso_http_request_duration_seconds"
+    assert _sample(text, f"{latency}_count", endpoint="/search/bktree", method="GET") == 2
+    assert _sample(text, f"{latency}_bucket", endpoint="/search/bktree", method="GET", le="+Inf") == 2
+    # The scrape itself is still in flight while the page is rendered.
+    assert _sample(text, "mrconso_http_requests_in_flight") == 1
+
+    assert _sample(text, "mrconso_search_results_count") == 3
+    assert _sample(text, "mrconso_search_results_sum") == 2 + 2 + 1
+    assert _sample(text, "mrconso_search_maxdist_total", maxdist="1") == 2
+    assert _sample(text, "mrconso_search_maxdist_total", maxdist="0") == 1
+    assert _sample(text, "mrconso_index_loads_total", outcome="success") == 1
+    assert _sample(text, "mrconso_index_load_duration_seconds") > 0
+    assert _sample(text, "mrconso_index_terms") == 3
+    # Only the first single search missed the cache and went through the tree.
+    assert _sample(text, "mrconso_bktree_search_visited_nodes_count", maxdist="1") == 1
+    assert _sample(text, "mrconso_search_executor_rejected_total") == 0
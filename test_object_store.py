@@ -0,0 +1,111 @@
+"""
+Tests for parallel range reads and loading gs:// artifacts through a stand-in object store.
+"""
+import io
+import os
+import threading
+import time
+
+import pytest
+from cppmatch import BKTree
+from object_store import LocalObjectStore, ParallelRangeReader, split_gs_url
+from test_app_loading import _make_sharded_artifact, _reload_app
+
+
+def test_reader_returns_the_object_in_order():
+    data = os.urandom(100_003)
+    for part_bytes, concurrency in ((1, 3), (4096, 1), (7919, 4), (1 << 20, 8)):
+        with ParallelRangeReader(lambda s, e: data[s:e], len(data), part_bytes=part_bytes,
+                                 concurrency=concurrency) as reader:
+            assert reader.read() == data
+            assert reader.read(10) == b""
+            assert reader.parts == -(-len(data) // part_bytes)
+            assert reader.bytes_fetched == len(data)
+
+    with ParallelRangeReader(lambda s, e: b"", 0, part_bytes=16, concurrency=2) as reader:
+        assert reader.read() == b""
+
+
+def test_reader_seeks_and_bounds_inflight_requests():
+    data = bytes(range(256)) * 64
+    lock = threading.Lock()
+    inflight, peak = 0, 0
+
+    def fetch(start, end):
+        nonlocal inflight, peak
+        with lock:
+            inflight += 1
+            peak = max(peak, inflight)
+        time.sleep(0.002)
+        with lock:
+            inflight -= 1
+        return data[start:end]
+
+    with ParallelRangeReader(fetch, len(data), part_bytes=256, concurrency=3) as reader:
+        head = reader.read(8)
+        assert reader.seek(0) == 0 and reader.read(8) == head
+        reader.seek(5000)
+        assert reader.read(4) == data[5000:5004]
+        reader.seek(-3, io.SEEK_END)
+        assert reader.read() == data[-3:]
+    assert 1 < peak <= 3
+
+
+def test_reader_surfaces_fetch_errors():
+    def short(start, end):
+        return b"x" * (end - start - 1)
+
+    with ParallelRangeReader(short, 1000, part_bytes=100, concurrency=2) as reader:
+        with pytest.raises(IOError, match="returned 99 bytes"):
+            reader.read(10)
+
+
+def test_local_store_pins_the_object_version(tmp_path):
+    store = LocalObjectStore(tmp_path)
+    url = "gs://bucket/artifacts/tree.bin"
+    store.put(url, b"0123456789")
+    assert split_gs_url(url) == ("bucket", "artifacts/tree.bin")
+    size, version = store.stat(url)
+    assert size == 10 and store.read_range(url, 2, 5, version) == b"234"
+    os.utime(tmp_path / "bucket" / "artifacts" / "tree.bin", ns=(0, version + 1))
+    with pytest.raises(RuntimeError, match="changed"):
+        store.read_range(url, 0, 1, version)
+
+
+def test_gs_artifact_loads_through_parallel_range_reads(monkeypatch, tmp_path):
+    terms = ["Alpha", "Alphb", "Bravo", "Charlie", "Delta", "Echo", "Foxtrot", "Golf"]
+    artifact_path, _ = _make_sharded_artifact(tmp_path, terms, 3)
+    store = LocalObjectStore(tmp_path / "store", latency=0.001)
+    url = "gs://models/mrconso/sharded.tar.gz"
+    store.put(url, artifact_path.read_bytes())
+
+    app_module = _reload_app(
+        monkeypatch,
+        {
+            "BKTREE_ARTIFACT_PATH": url,
+            "MRCONSO_PATH": str(tmp_path / "unused.txt"),
+            "BKTREE_DOWNLOAD_PART_BYTES": "1024",
+            "BKTREE_DOWNLOAD_CONCURRENCY": "4",
+            "ENABLE_PYTHON_BASELINE": "0",
+            "AUTO_LOAD_ON_STARTUP": "0",
+            "SHUTDOWN_AFTER_SECONDS": "0",
+        },
+    )
+    monkeypatch.setattr(app_module, "_artifact_store", lambda: store)
+    assert app_module.load_terms(force=True) == len(terms)
+    assert app_module.TREE.search("Alpha", 1) == BKTree.build(terms).search("Alpha", 1)
+    assert app_module.METRICS.artifact_bytes == artifact_path.stat().st_size
+
+    # Every byte was fetched once, in part-sized ranges
+    size = artifact_path.stat().st_size
+    assert sorted(store.requests) == [(start, min(start + 1024, size)) for start in range(0, size, 1024)]
+
+    # A bare BKTREE2 image in the bucket streams the same way
+    image_url = "gs://models/mrconso/tree.bktree2"
+    image = tmp_path / "tree.bktree2"
+    BKTree.build(terms).save_mmap(str(image))
+    store.put(image_url, image.read_bytes())
+    app_module = _reload_app(monkeypatch, {"BKTREE_ARTIFACT_PATH": image_url})
+    monkeypatch.setattr(app_module, "_artifact_store", lambda: store)
+    assert app_module.load_terms(force=True) == len(terms)
+    assert ("Golf", 0) in app_module.TREE.search("Golf", 0)
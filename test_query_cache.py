@@ -0,0 +1,130 @@
+"""
+Tests for the sharded query-result cache and its use by the search endpoints.
+"""
+import threading
+
+from fastapi.testclient import TestClient
+from query_cache import QueryCache
+from test_app_loading import _reload_app, _write_terms_cache
+
+
+def test_cache_key_normalizes_query_and_k():
+    assert QueryCache.make_key("  aspirin ", 1, None) == ("aspirin", 1, -1)
+    assert QueryCache.make_key("aspirin", 1, -5) == QueryCache.make_key("aspirin", 1, None)
+    assert QueryCache.make_key("aspirin", 1, 3) != QueryCache.make_key("aspirin", 1, None)
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = QueryCache(max_entries=2, max_bytes=1 << 20, ttl_seconds=None, shards=1)
+    gen = cache.generation
+    for query in ("a", "b"):
+        cache.put((query, 1, -1), ((query, 0),), gen)
+    assert cache.get(("a", 1, -1)) == (("a", 0),)  # "a" is now most recently used
+    cache.put(("c", 1, -1), (("c", 0),), gen)
+    assert cache.get(("b", 1, -1)) is None
+    assert cache.get(("a", 1, -1)) is not None
+    assert cache.stats()["evictions"] == 1
+
+    small = QueryCache(max_entries=100, max_bytes=1000, ttl_seconds=None, shards=1)
+    big = tuple((f"term{i}", 1) for i in range(4))
+    for i in range(3):
+        small.put((f"q{i}", 1, -1), big, small.generation)
+    stats = small.stats()
+    assert stats["bytes"] <= 1000
+    assert stats["entries"] < 3
+    # A single result bigger than a shard is never stored.
+    small.put(("huge", 1, -1), tuple((f"t{i}", 1) for i in range(50)), small.generation)
+    assert small.get(("huge", 1, -1)) is None
+
+
+def test_total_entries_and_bytes_never_exceed_the_limits():
+    for max_entries in (1, 2, 5, 16, 17, 100):
+        cache = QueryCache(max_entries=max_entries, max_bytes=1 << 20, ttl_seconds=None, shards=16)
+        for i in range(500):
+            cache.put((f"q{i}", 1, -1), ((f"q{i}", 0),), cache.generation)
+            assert cache.stats()["entries"] <= max_entries
+        assert cache.stats()["entries"] == max_entries  # the shares add up to the whole limit
+
+    cache = QueryCache(max_entries=1000, max_bytes=5000, ttl_seconds=None, shards=16)
+    for i in range(500):
+        cache.put((f"q{i}", 1, -1), ((f"term{i}", 0),), cache.generation)
+        assert cache.stats()["bytes"] <= 5000
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("query_cache.time.monotonic", lambda: now[0])
+    cache = QueryCache(max_entries=10, ttl_seconds=5, shards=2)
+    cache.put(("x", 1, -1), (), cache.generation)
+    assert cache.get(("x", 1, -1)) == ()
+    now[0] += 6
+    assert cache.get(("x", 1, -1)) is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_invalidate_discards_results_from_previous_generation():
+    cache = QueryCache(max_entries=10, shards=4)
+    stale_generation = cache.generation
+    cache.put(("x", 1, -1), (("x", 0),), stale_generation)
+    cache.invalidate()
+    assert cache.get(("x", 1, -1)) is None
+    cache.put(("x", 1, -1), (("old", 0),), stale_generation)
+    assert cache.get(("x", 1, -1)) is None
+    assert cache.stats()["generation"] == stale_generation + 1
+
+
+def test_concurrent_access_stays_within_bounds():
+    cache = QueryCache(max_entries=64, shards=8)
+
+    def worker(seed):
+        for i in range(2000):
+            key = (f"q{(seed * 7 + i) % 200}", 1, -1)
+            if cache.get(key) is None:
+                cache.put(key, ((key[0], 0),), cache.generation)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert stats["entries"] <= 64
+    assert stats["hits"] + stats["misses"] == 8000
+
+
+def test_endpoints_use_cache_and_reload_invalidates(monkeypatch, tmp_path):
+    terms_path = tmp_path / "terms.txt"
+    _write_terms_cache(terms_path, ["Aspirin", "Asprin", "Ibuprofen"])
+    app_module = _reload_app(
+        monkeypatch,
+        {
+            "MRCONSO_PATH": str(terms_path),
+            "MRCONSO_FORMAT": "terms",
+            "ENABLE_PYTHON_BASELINE": "0",
+            "AUTO_LOAD_ON_STARTUP": "0",
+            "SHUTDOWN_AFTER_SECONDS": "0",
+            "QUERY_CACHE_ENTRIES": "100",
+        },
+    )
+    app_module.load_terms(force=True)
+
+    with TestClient(app_module.app) as client:
+        first = client.get("/search/bktree", params={"q": "Aspirin", "max_dist": 1}).json()
+        second = client.post("/search/bktree", json={"query": " Aspirin ", "maxdist": 1}).json()
+        assert first == second
+        assert first["matches"] == [{"term": "Aspirin", "distance": 0}, {"term": "Asprin", "distance": 1}]
+        stats = client.get("/cache/stats").json()
+        assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+        batch = client.post(
+            "/search/bktree/batch",
+            json={"queries": [{"query": "Aspirin", "maxdist": 1}, {"query": "Ibuprofen", "maxdist": 0}]},
+        ).json()
+        assert batch["cache_hits"] == 1
+        assert batch["results"][0]["matches"] == first["matches"]
+
+        _write_terms_cache(terms_path, ["Aspirin", "Ibuprofen"])
+        app_module.load_terms(force=True)
+        assert client.get("/cache/stats").json()["entries"] == 0
+        refreshed = client.get("/search/bktree", params={"q": "Aspirin", "max_dist": 1}).json()
+        assert refreshed["matches"] == [{"term": "Aspirin", "distance": 0}]
@@ -0,0 +1,165 @@
+"""
+Tests for the bounded search executor and the load-shedding it adds to the API.
+"""
+import asyncio
+import threading
+
+import pytest
+from cppmatch import BKTree
+from search_executor import ExecutorSaturated, SearchExecutor, bktree_search, python_search
+
+
+def _blocking(tree, terms, started, release):
+    started.set()
+    release.wait(5)
+    return len(tree)
+
+
+def _tree(terms):
+    tree = BKTree()
+    for term in terms:
+        tree.insert(term)
+    return tree
+
+
+def test_thread_executor_runs_bound_index():
+    executor = SearchExecutor("thread", workers=2, queue_size=2)
+    executor.bind(_tree(["alpha", "alphb", "beta"]), ["alpha", "alphb", "beta"])
+
+    async def runner():
+        hits = await executor.run(bktree_search, "alpha", 1)
+        best = await executor.run(python_search, "betta")
+        topk = await executor.run(bktree_search, "alphx", -1, 1)
+        return hits, best, topk
+
+    hits, best, topk = asyncio.run(runner())
+    executor.shutdown()
+    assert hits == [("alpha", 0), ("alphb", 1)]
+    assert best == ("beta", 1)
+    assert topk == [("alpha", 1)]
+    assert executor.stats()["completed"] == 3
+
+
+def test_executor_sheds_load_when_queue_full():
+    executor = SearchExecutor("thread", workers=1, queue_size=1)
+    started, release = threading.Event(), threading.Event()
+
+    async def runner():
+        running = asyncio.ensure_future(executor.run(_blocking, started, release))
+        queued = asyncio.ensure_future(executor.run(_blocking, threading.Event(), release))
+        await asyncio.to_thread(started.wait, 5)
+        stats = executor.stats()
+        with pytest.raises(ExecutorSaturated):
+            await executor.run(_blocking, started, release)
+        release.set()
+        await asyncio.gather(running, queued)
+        return stats
+
+    stats = asyncio.run(runner())
+    executor.shutdown()
+    assert stats["active"] == 1
+    assert stats["queue_depth"] == 1
+    assert stats["saturation"] == 1.0
+    assert executor.stats()["rejected"] == 1
+    assert executor.stats()["queue_depth"] == 0
+
+
+def test_executor_timeout_keeps_slot_until_search_finishes():
+    executor = SearchExecutor("thread", workers=1, queue_size=0, timeout=0.05)
+    started, release = threading.Event(), threading.Event()
+
+    async def runner():
+        with pytest.raises(asyncio.TimeoutError):
+            await executor.run(_blocking, started, release)
+        # The timed-out search is still running, so there is no room for another one.
+        with pytest.raises(ExecutorSaturated):
+            await executor.run(_blocking, started, release)
+        release.set()
+
+    asyncio.run(runner())
+    executor.shutdown()
+    stats = executor.stats()
+    assert stats["timed_out"] == 1
+    assert stats["rejected"] == 1
+
+
+def test_process_executor_maps_index_image(tmp_path):
+    executor = SearchExecutor("process", workers=1, queue_size=1, tmp_dir=str(tmp_path))
+    executor.bind(_tree(["carditis", "myocarditis", "nephritis"]), ["carditis", "nephritis"])
+    assert len(list(tmp_path.iterdir())) == 1
+
+    async def runner():
+        return await executor.run(bktree_search, "carditis", 0), await executor.run(python_search, "nefritis")
+
+    try:
+        hits, best = asyncio.run(runner())
+    finally:
+        executor.shutdown()
+    assert hits == [("carditis", 0)]
+    assert best == ("nephritis", 2)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_app_reports_executor_and_returns_429(monkeypatch, tmp_path):
+    from fastapi.testclient import TestClient
+    from test_app_loading import _reload_app, _write_terms_cache
+
+    terms_path = tmp_path / "terms.txt"
+    _write_terms_cache(terms_path, ["Alpha", "Beta"])
+    app_module = _reload_app(
+        monkeypatch,
+        {
+            "MRCONSO_PATH": str(terms_path),
+            "MRCONSO_FORMAT": "terms",
+            "ENABLE_PYTHON_BASELINE": "1",
+            "AUTO_LOAD_ON_STARTUP": "0",
+            "SHUTDOWN_AFTER_SECONDS": "0",
+            "SEARCH_WORKERS": "1",
+            "SEARCH_QUEUE_SIZE": "0",
+            "SEARCH_TIMEOUT_SECONDS": "5",
+        },
+    )
+    app_module.load_terms(force=True)
+
+    with TestClient(app_module.app) as client:
+        health = client.get("/healthz").json()["search_executor"]
+        assert health["mode"] == "thread"
+        assert health["workers"] == 1
+        assert health["queue_size"] == 0
+        assert health["timeout_seconds"] == 5.0
+
+        assert client.get("/search/python", params={"q": "Alpga"}).json()["matches"] == [
+            {"term": "Alpha", "distance": 1}
+        ]
+
+        started, release = threading.Event(), threading.Event()
+        blocker = threading.Thread(
+            target=client.portal.call,
+            args=(app_module.SEARCH_POOL.run, _blocking, started, release),
+        )
+        blocker.start()
+        assert started.wait(5)
+        response = client.get("/search/bktree", params={"q": "Alpha"})
+        assert response.status_code == 429
+        assert client.get("/healthz").json()["search_executor"]["saturation"] == 1.0
+        release.set()
+        blocker.join()
+
+        assert client.get("/search/bktree", params={"q": "Alpha"}).status_code == 200
+
+
+def test_process_executor_loads_sharded_index(tmp_path):
+    from cppmatch import ShardedBKTree
+
+    executor = SearchExecutor("process", workers=1, queue_size=1, tmp_dir=str(tmp_path))
+    executor.bind(ShardedBKTree.build(["carditis", "myocarditis", "nephritis"], 2), [])
+
+    async def runner():
+        return await executor.run(bktree_search, "carditis", 3)
+
+    try:
+        hits = asyncio.run(runner())
+    finally:
+        executor.shutdown()
+    assert hits == [("carditis", 0), ("myocarditis", 3)]
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,68 @@
+"""
+Tests for per-query search statistics: histograms, the debug search flag and /debug/search-stats.
+"""
+from fastapi.testclient import TestClient
+from search_stats import Histogram, SearchStatsRecorder, maxdist_label
+from test_app_loading import _reload_app, _write_terms_cache
+
+
+def test_histogram_buckets_are_cumulative():
+    hist = Histogram((1, 4, 16))
+    for value in (0, 1, 3, 4, 100):
+        hist.observe(value)
+    snap = hist.snapshot()
+    assert [b["count"] for b in snap["buckets"]] == [2, 4, 4, 5]
+    assert snap["buckets"][-1]["le"] == "+Inf"
+    assert (snap["count"], snap["sum"], snap["mean"]) == (5, 108, 21.6)
+
+
+def test_recorder_groups_by_maxdist():
+    recorder = SearchStatsRecorder()
+    stats = {"visited": 10, "distance_calls": 8, "pruned": 3, "max_depth": 2, "elapsed_ns": 5000}
+    recorder.record(1, stats)
+    recorder.record(1, stats)
+    recorder.record(-1, stats)
+    recorder.record(20, stats)
+    snap = recorder.snapshot()
+    assert sorted(snap) == ["1", "8+", "unbounded"]
+    assert snap["1"]["visited"]["count"] == 2
+    assert snap["1"]["elapsed_us"]["sum"] == 10
+    assert maxdist_label(7) == "7"
+    recorder.reset()
+    assert recorder.snapshot() == {}
+
+
+def test_debug_param_and_stats_endpoint(monkeypatch, tmp_path):
+    terms_path = tmp_path / "terms.txt"
+    _write_terms_cache(terms_path, ["Aspirin", "Asprin", "Ibuprofen", "Paracetamol"])
+    app_module = _reload_app(
+        monkeypatch,
+        {
+            "MRCONSO_PATH": str(terms_path),
+            "MRCONSO_FORMAT": "terms",
+            "ENABLE_PYTHON_BASELINE": "0",
+            "AUTO_LOAD_ON_STARTUP": "0",
+            "SHUTDOWN_AFTER_SECONDS": "0",
+        },
+    )
+    app_module.load_terms(force=True)
+
+    with TestClient(app_module.app) as client:
+        plain = client.get("/search/bktree", params={"q": "Aspirin", "max_dist": 1}).json()
+        assert "stats" not in plain
+        debug = client.get("/search/bktree", params={"q": "Aspirin", "max_dist": 1, "debug": "true"}).json()
+        assert debug["matches"] == plain["matches"]
+        assert debug["stats"]["visited"] >= 2
+        assert set(debug["stats"]) == {"visited", "distance_calls", "pruned", "max_depth", "elapsed_ns"}
+        posted = client.post("/search/bktree", json={"query": "Aspirin", "maxdist": 1, "debug": True}).json()
+        assert "stats" in posted
+
+        report = client.get("/debug/search-stats").json()
+        # The plain search was a miss; both debug searches bypassed the cache.
+        assert report["by_maxdist"]["1"]["visited"]["count"] == 3
+        assert report["tree_totals"]["searches"] == 3
+        assert report["executor_mode"] == "thread"
+
+        client.get("/debug/search-stats", params={"reset": "true"})
+        report = client.get("/debug/search-stats").json()
+        assert report["by_maxdist"] == {} and report["tree_totals"]["searches"] == 0
@@ -0,0 +1,92 @@
+"""
+Tests for dropping repeated terms before the BK-tree build.
+"""
+import os
+import random
+
+from cppmatch import BKTree
+from fastapi.testclient import TestClient
+from term_dedup import DedupStats, unique_terms, write_terms
+from test_app_loading import _reload_app, _write_rrf
+
+
+def _rows(seed=3, unique=400, repeats=600):
+    rng = random.Random(seed)
+    terms = ["".join(rng.choice("abcdef") for _ in range(rng.randint(1, 8))) for _ in range(unique)]
+    rows = terms + [rng.choice(terms) for _ in range(repeats)]
+    rng.shuffle(rows)
+    return rows
+
+
+def test_unique_terms_keeps_first_seen_order():
+    rows = _rows()
+    stats = DedupStats()
+    unique = list(unique_terms(rows, stats=stats))
+    assert unique == list(dict.fromkeys(rows))
+    assert stats.raw == len(rows) and stats.unique == len(unique) and stats.runs == 0
+    assert stats.as_dict()["duplicate_terms"] == len(rows) - len(unique)
+    # Repeats never changed the tree, so the deduplicated build is the same tree
+    assert BKTree.build(unique).to_serializable() == BKTree.build(rows).to_serializable()
+
+    assert list(unique_terms(rows, sort=True)) == sorted(set(rows))
+    assert list(unique_terms([])) == []
+
+
+def test_unique_terms_spills_sorted_runs_past_the_memory_budget(tmp_path):
+    rows = _rows(unique=3000, repeats=3000) + ["tab\tterm", "tab"]
+    stats = DedupStats()
+    unique = list(unique_terms(rows, memory_bytes=16 * 1024, spill_dir=str(tmp_path), stats=stats))
+    assert stats.runs > 1
+    assert unique == sorted(set(rows))
+    assert stats.unique == len(unique) and stats.raw == len(rows)
+    assert os.listdir(tmp_path) == []  # runs are removed once merged
+
+    # Stopping early still removes the runs
+    partial = unique_terms(rows, memory_bytes=16 * 1024, spill_dir=str(tmp_path))
+    next(partial)
+    partial.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_unique_terms_spill_keeps_terms_with_line_breaks(tmp_path):
+    # Spilled terms must come back whole, whatever line-break characters they contain
+    odd = ["a\rb", "a\nb", "a\r\nb", "a\u2028b", "a\x85b", "\n", "a"]
+    rows = (odd + [f"t{i}" for i in range(20)]) * 50
+    stats = DedupStats()
+    unique = list(unique_terms(rows, memory_bytes=200, spill_dir=str(tmp_path), stats=stats))
+    assert stats.runs > 1
+    assert unique == sorted(set(rows))
+
+
+def test_raw_load_deduplicates_and_serves_the_terms_cache(monkeypatch, tmp_path):
+    rows = ["Aspirin", "Asprin", "Aspirin", "Ibuprofen", "Asprin", "Aspirin"]
+    rrf_path = tmp_path / "MRCONSO.RRF"
+    _write_rrf(rrf_path, rows)
+    app_module = _reload_app(
+        monkeypatch,
+        {
+            "MRCONSO_PATH": str(rrf_path),
+            "MRCONSO_FORMAT": "rrf",
+            "BKTREE_ARTIFACT_PATH": None,
+            "BKTREE_SHARED_PATH": None,
+            "ENABLE_PYTHON_BASELINE": "1",
+            "AUTO_LOAD_ON_STARTUP": "0",
+            "SHUTDOWN_AFTER_SECONDS": "0",
+        },
+    )
+    assert app_module.load_terms(force=True) == 3
+    assert app_module.TERMS == ["Aspirin", "Asprin", "Ibuprofen"]
+    with TestClient(app_module.app) as client:
+        dedup = client.get("/healthz").json()["dedup"]
+    assert dedup["raw_term_count"] == 6 and dedup["unique_term_count"] == 3
+    assert dedup["estimated_build_seconds_saved"] >= 0
+
+    # The unique-terms cache the precompute job publishes loads as MRCONSO_FORMAT=terms
+    terms_path = tmp_path / "terms.txt"
+    assert write_terms(app_module.TERMS, terms_path) == 3
+    app_module = _reload_app(
+        monkeypatch, {"MRCONSO_PATH": str(terms_path), "MRCONSO_FORMAT": "terms", "TERMS_DEDUP": "0"}
+    )
+    assert app_module.load_terms(force=True) == 3
+    assert app_module.DEDUP_STATS["duplicate_terms"] == 0
+    assert app_module.TREE.search("Asprin", 0) == [("Asprin", 0)]
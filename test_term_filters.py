@@ -0,0 +1,240 @@
+"""
+Tests for LAT/SAB/SUPPRESS filtering of MRCONSO rows at index build time.
+"""
+import importlib.util
+import json
+import sys
+import tarfile
+from pathlib import Path
+
+import pytest
+from cppmatch import BKTree, iter_rrf_terms
+from fastapi.testclient import TestClient
+from term_filters import TermFilter, TermFilterMismatch
+from test_app_loading import _reload_app
+
+ROWS = [
+    # (LAT, SAB, SUPPRESS, STR)
+    ("ENG", "MSH", "N", "Aspirin"),
+    ("ENG", "SNOMEDCT_US", "N", "Ibuprofen"),
+    ("SPA", "MSHSPA", "N", "Aspirina"),
+    ("ENG", "MSH", "O", "Asprin"),
+    ("GER", "MSHGER", "N", "Ibuprofen Tablette"),
+    ("ENG", "RXNORM", "N", "Naproxen"),
+    ("ENG", "SNOMEDCT_US", "E", "Acetylsalicylic"),
+]
+
+
+def _write_mrconso(path, rows=ROWS):
+    lines = []
+    for idx, (lat, sab, suppress, term) in enumerate(rows, start=1):
+        row = [f"C{idx:07d}", lat, "P", f"L{idx:07d}", "PF", f"S{idx:07d}", "Y", f"A{idx:08d}", "", "", "",
+               sab, "PT", f"CODE{idx}", term, "0", suppress, ""]
+        lines.append("|".join(row))
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def _write_artifact(tmp_path, terms, term_filter=None):
+    tree_path = tmp_path / "bktree2.bin"
+    BKTree.build(terms).save_mmap(str(tree_path))
+    metadata = {"schema_version": 1, "term_count": len(terms)}
+    if term_filter is not None:
+        metadata["term_filter"] = term_filter.as_dict()
+    metadata_path = tmp_path / "metadata.json"
+    metadata_path.write_text(json.dumps(metadata), encoding="utf-8")
+    tar_path = tmp_path / "artifact.tar.gz"
+    with tarfile.open(tar_path, "w:gz") as tar:
+        tar.add(tree_path, arcname="bktree2.bin")
+        tar.add(metadata_path, arcname="metadata.json")
+    return tar_path
+
+
+def test_term_filter_config_and_artifact_check(tmp_path):
+    assert not TermFilter().active and TermFilter().rrf_filters() is None
+    term_filter = TermFilter.from_env(
+        {"MRCONSO_LANGS": "eng, spa", "MRCONSO_SABS": "SNOMEDCT_US,MSH,", "MRCONSO_EXCLUDE_SUPPRESSED": "true"}
+    )
+    assert term_filter.as_dict() == {"langs": ["ENG", "SPA"], "sabs": ["MSH", "SNOMEDCT_US"], "exclude_suppressed": True}
+    assert term_filter.rrf_filters() == {"LAT": ["ENG", "SPA"], "SAB": ["MSH", "SNOMEDCT_US"], "SUPPRESS": ["N"]}
+    assert str(term_filter) == "LAT=ENG,SPA SAB=MSH,SNOMEDCT_US SUPPRESS=N"
+
+    path = tmp_path / "MRCONSO.RRF"
+    _write_mrconso(path)
+    kept = [term for batch in iter_rrf_terms(str(path), 14, term_filter.rrf_filters()) for term in batch]
+    assert kept == ["Aspirin", "Ibuprofen"]  # Aspirina is from MSHSPA
+
+    term_filter.check_artifact({"term_filter": term_filter.as_dict()})
+    with pytest.raises(TermFilterMismatch, match="none"):
+        term_filter.check_artifact({"term_count": 3})  # older artifacts were built from every row
+    with pytest.raises(TermFilterMismatch):
+        term_filter.check_artifact({"term_filter": TermFilter(["ENG"]).as_dict()})
+    TermFilter().check_artifact({"term_filter": term_filter.as_dict()})  # no filter configured: anything goes
+
+
+def test_raw_load_indexes_only_filtered_rows(monkeypatch, tmp_path):
+    path = tmp_path / "MRCONSO.RRF"
+    _write_mrconso(path)
+    env = {
+        "MRCONSO_PATH": str(path),
+        "MRCONSO_FORMAT": "rrf",
+        "BKTREE_ARTIFACT_PATH": None,
+        "BKTREE_SHARED_PATH": None,
+        "ENABLE_PYTHON_BASELINE": "1",
+        "AUTO_LOAD_ON_STARTUP": "0",
+        "SHUTDOWN_AFTER_SECONDS": "0",
+        "MRCONSO_LANGS": "ENG",
+        "MRCONSO_SABS": "MSH,SNOMEDCT_US",
+        "MRCONSO_EXCLUDE_SUPPRESSED": "1",
+    }
+    app_module = _reload_app(monkeypatch, env)
+    assert app_module.load_terms(force=True) == 2
+    assert app_module.TERMS == ["Aspirin", "Ibuprofen"]
+    assert app_module.TREE.search("Asprin", 1) == [("Aspirin", 1)]
+    with TestClient(app_module.app) as client:
+        health = client.get("/healthz").json()
+    assert health["term_filter"] == {"langs": ["ENG"], "sabs": ["MSH", "SNOMEDCT_US"], "exclude_suppressed": True}
+
+    # The pipelined load applies the same filter
+    app_module = _reload_app(monkeypatch, {**env, "LOAD_PIPELINE": "1"})
+    assert app_module.load_terms(force=True) == 2
+    assert app_module.TERMS == ["Aspirin", "Ibuprofen"]
+
+    # Without a filter every row is indexed
+    app_module = _reload_app(
+        monkeypatch, {**env, "MRCONSO_LANGS": None, "MRCONSO_SABS": None, "MRCONSO_EXCLUDE_SUPPRESSED": None}
+    )
+    assert app_module.load_terms(force=True) == len(ROWS)
+
+
+def test_filtered_service_refuses_a_terms_cache(monkeypatch, tmp_path):
+    terms_path = tmp_path / "terms.txt"
+    terms_path.write_text("Aspirin\nAspirina\n", encoding="utf-8")
+    app_module = _reload_app(
+        monkeypatch,
+        {
+            "MRCONSO_PATH": str(terms_path),
+            "MRCONSO_FORMAT": "terms",
+            "BKTREE_ARTIFACT_PATH": None,
+            "BKTREE_SHARED_PATH": None,
+            "AUTO_LOAD_ON_STARTUP": "0",
+            "SHUTDOWN_AFTER_SECONDS": "0",
+            "MRCONSO_LANGS": "ENG",
+        },
+    )
+    with pytest.raises(RuntimeError, match="terms cache"):
+        app_module.load_terms(force=True)
+    with TestClient(app_module.app) as client:
+        health = client.get("/healthz").json()
+    assert health["loaded"] is False and health["terms"] == 0
+    assert health["term_filter"] is None  # nothing is served, so no filter is claimed
+
+
+def test_artifact_built_with_another_filter_is_rejected(monkeypatch, tmp_path):
+    path = tmp_path / "MRCONSO.RRF"
+    _write_mrconso(path)
+    english = TermFilter(["ENG"])
+    env = {
+        "MRCONSO_PATH": str(path),
+        "MRCONSO_FORMAT": "rrf",
+        "BKTREE_SHARED_PATH": None,
+        "ENABLE_PYTHON_BASELINE": "0",
+        "AUTO_LOAD_ON_STARTUP": "0",
+        "SHUTDOWN_AFTER_SECONDS": "0",
+        "MRCONSO_LANGS": "ENG",
+    }
+
+    # Matching filter: the artifact is served
+    artifact = _write_artifact(tmp_path, ["Stored"], english)
+    app_module = _reload_app(monkeypatch, {**env, "BKTREE_ARTIFACT_PATH": str(artifact)})
+    assert app_module.load_terms(force=True) == 1
+    assert app_module.ARTIFACT_METADATA["term_filter"] == english.as_dict()
+
+    # An unfiltered artifact is refused and the index is built from the rows the filter keeps
+    artifact = _write_artifact(tmp_path, ["Stored"])
+    app_module = _reload_app(monkeypatch, {**env, "BKTREE_ARTIFACT_PATH": str(artifact)})
+    assert app_module.load_terms(force=True) == 5
+    assert app_module.ARTIFACT_METADATA is None
+    assert app_module.TREE.search("Stored", 0) == []
+
+    # So is a bare BKTREE2 image, which records no filter
+    image = tmp_path / "tree.bktree2"
+    BKTree.build(["Stored"]).save_mmap(str(image))
+    app_module = _reload_app(monkeypatch, {**env, "BKTREE_ARTIFACT_PATH": str(image)})
+    assert app_module.load_terms(force=True) == 5
+
+
+
+def test_shared_image_built_with_another_filter_is_republished(monkeypatch, tmp_path):
+    path = tmp_path / "MRCONSO.RRF"
+    _write_mrconso(path)
+    env = {
+        "MRCONSO_PATH": str(path),
+        "MRCONSO_FORMAT": "rrf",
+        "BKTREE_ARTIFACT_PATH": None,
+        "BKTREE_SHARED_PATH": str(tmp_path / "shm" / "mrconso.bktree2"),
+        "ENABLE_PYTHON_BASELINE": "0",
+        "AUTO_LOAD_ON_STARTUP": "0",
+        "SHUTDOWN_AFTER_SECONDS": "0",
+        "MRCONSO_LANGS": None,
+    }
+    owner = _reload_app(monkeypatch, env)
+    assert owner.load_terms() == len(ROWS)
+
+    # The unfiltered image is not attached by a worker that only indexes English rows
+    filtered = _reload_app(monkeypatch, {**env, "MRCONSO_LANGS": "ENG"})
+    assert filtered.load_terms() == 5
+    assert filtered.SHARED_INDEX["role"] == "owner"
+    assert filtered.TREE.search("Aspirina", 0) == []
+
+    # The republished image records its filter, so the next English worker attaches it
+    worker = _reload_app(monkeypatch, {**env, "MRCONSO_LANGS": "ENG"})
+    assert worker.load_terms() == 5
+    assert worker.SHARED_INDEX["role"] == "attached"
+
+
+def _run_precompute_job(monkeypatch, capsys, *args):
+    spec = importlib.util.spec_from_file_location(
+        "precompute_terms_job", Path(__file__).parent / "scripts" / "precompute_terms_job.py"
+    )
+    job = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(job)
+    for key in ("MRCONSO_LANGS", "MRCONSO_SABS", "MRCONSO_EXCLUDE_SUPPRESSED"):
+        monkeypatch.delenv(key, raising=False)
+    monkeypatch.setattr(sys, "argv", ["precompute_terms_job.py", *args])
+    with pytest.raises(SystemExit) as exit_info:
+        job.main()
+    out = capsys.readouterr().out.strip()
+    return exit_info.value.code, json.loads(out) if out else None
+
+
+def test_precompute_job_records_the_filter_it_applied(monkeypatch, capsys, tmp_path):
+    rrf_path = tmp_path / "MRCONSO.RRF"
+    _write_mrconso(rrf_path)
+    artifact = tmp_path / "out" / "rrf.tar"
+    code, summary = _run_precompute_job(
+        monkeypatch, capsys, "--source", str(rrf_path), "--artifact", str(artifact), "--compression", "none",
+        "--langs", "ENG", "--exclude-suppressed",
+    )
+    assert code == 0 and summary["term_count"] == 3
+    with tarfile.open(artifact) as tar:
+        metadata = json.load(tar.extractfile("metadata.json"))
+    assert metadata["term_filter"] == TermFilter(["ENG"], exclude_suppressed=True).as_dict()
+
+    # A terms cache cannot be filtered, so a filter on one is refused rather than recorded
+    terms_path = tmp_path / "terms.txt"
+    terms_path.write_text("Aspirin\nAspirina\n", encoding="utf-8")
+    artifact = tmp_path / "out" / "terms.tar"
+    code, summary = _run_precompute_job(
+        monkeypatch, capsys, "--source", str(terms_path), "--source-format", "terms",
+        "--artifact", str(artifact), "--langs", "ENG",
+    )
+    assert code == 2 and summary is None and not artifact.exists()
+
+    code, summary = _run_precompute_job(
+        monkeypatch, capsys, "--source", str(terms_path), "--source-format", "terms",
+        "--artifact", str(artifact), "--compression", "none",
+    )
+    assert code == 0 and summary["term_count"] == 2
+    with tarfile.open(artifact) as tar:
+        metadata = json.load(tar.extractfile("metadata.json"))
+    assert metadata["term_filter"] == TermFilter().as_dict()